@@ -53,10 +53,12 @@ def reset_stats(rfam, response):
     return
   
   # Terminate render time information...
-  meta = node.read()
-  if 'render_time' in meta:
-    del meta['render_time']
-    node.write(meta)
+  with node.lock():
+    meta = node.read()
+    if 'render_time' in meta:
+      meta = node.read_for_update()
+      del meta['render_time']
+      node.write(meta)
     
   # Record success...
   rfam.log(response, 'reset_stats(%s)' % '/'.join(path))
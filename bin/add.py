@@ -141,9 +141,9 @@ def job_prman(rfam, response):
   json_path[-1] += '.json'
   
   if json_path in db:
-    priority = true_priority(rfam, response.project, db[json_path], db)
+    priority = true_priority(rfam, response.project, db[json_path])
   else:
-    settings = rfam.proj_defaults(response.project)['priority.json'].read()
+    settings = rfam.catalog(response.project).priority
     priority = settings['low']
   
   #create some json for commands
@@ -187,9 +187,9 @@ def job(rfam, response):
   json_path[-1] += '.json'
   
   if json_path in db:
-    priority = true_priority(rfam, response.project, db[json_path], db)
+    priority = true_priority(rfam, response.project, db[json_path])
   else:
-    settings = rfam.proj_defaults(response.project)['priority.json'].read()
+    settings = rfam.catalog(response.project).priority
     priority = settings['low']
   
   # Create the job...
@@ -219,19 +219,20 @@ def role(rfam, response):
   ident = str(uuid.uuid4())
   
   # Verify that the user is sane...
-  if user not in rfam.getUsersByProject(response.project):
+  if not rfam.isUserOnProject(response.project, user):
     response.append('false')
     return
   
   # Create the new role entry...
   proj = rfam.proj(response.project)['project.json']
-  p = proj.read()
-  if len(p['roles'])>0:
-    order = max(map(lambda d: d['order'], p['roles'].values())) + 1.0
-  else:
-    order = 0
-  p['roles'][ident] = {'role' : role, 'user' : user, 'order' : order}
-  proj.write(p)
+  with proj.lock():
+    p = proj.read_for_update()
+    if len(p['roles'])>0:
+      order = max(map(lambda d: d['order'], p['roles'].values())) + 1.0
+    else:
+      order = 0
+    p['roles'][ident] = {'role' : role, 'user' : user, 'order' : order}
+    proj.write(p)
     
   # Report success...
   rfam.log(response, 'new_role(%s,%s)' % (role, user))
@@ -262,9 +263,10 @@ def ext_asset(rfam, response):
   
   # Create the new entry...
   proj = rfam.proj(response.project)['project.json']
-  p = proj.read()
-  p['ext_assets'][ident] = {'description' : description, 'license' : license, 'origin' : origin}
-  proj.write(p)
+  with proj.lock():
+    p = proj.read_for_update()
+    p['ext_assets'][ident] = {'description' : description, 'license' : license, 'origin' : origin}
+    proj.write(p)
   
   # Report success...
   rfam.log(response, 'new_external_asset(%s,%s,%s,%s)' % (ident, description, license, origin))
@@ -0,0 +1,226 @@
+# Copyright 2014 Tom SF Haines
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import os.path
+import time
+import mmap
+import struct
+import threading
+from collections import namedtuple
+
+try:
+  import fcntl
+except ImportError:
+  fcntl = None # Not Unix - every process writes the index.
+
+
+
+# The fields of an asset that listings use, as stored in the index - path is a tuple, as used to index an FSDB, for the .json file; mtime is its modification time in nanoseconds; owner can be None; support is a tuple of user identifiers...
+Asset = namedtuple('Asset', ['path', 'mtime', 'name', 'type', 'owner', 'state', 'priority', 'render', 'support'])
+
+
+
+# Binary layout - a header, then a fixed size record for each asset, then the strings the records point into, as (offset, length) pairs of utf8, with an offset of none_offset for None. Paths are stored joined with '/', support joined with '\n'...
+magic = b'RFAI'
+version = 1
+header = struct.Struct('<4sIdI') # magic, version, when it was built (time.time()), number of records.
+record = struct.Struct('<qIIIIIIIIIIIIdB') # mtime_ns, (offset, length) for path, name, type, owner, state and support, priority, render.
+none_offset = 0xffffffff
+
+# Minimum time between the writer checking if the index needs rebuilding, in seconds...
+check_interval = 1.0
+
+
+
+class AssetIndex:
+  """A file that holds the commonly used fields of every asset of a project in a compact binary form, so listing pages can be generated without parsing every asset's .json file, in every process. Every process maps the file read only; one of them, the one that holds a flock on the file next to it, is the writer, that keeps it up to date from its FSDB of the project - the file is replaced as a whole, so readers never see a partial update. Another process takes over if the writer exits. Processes that see a change to the project more recent than the index stop using it until it has been rebuilt, so a user always sees their own edits."""
+  def __init__(self, fn, db, max_age = 60.0, exclude = ()):
+    """fn is the file to keep the index in; db the FSDB of the project, which is watched for changes. An index older than max_age seconds is not used, in case the writer has stopped updating it. exclude is a collection of directory names that are skipped, as for FSDB.walk - the directories old versions of files are moved into."""
+    self.fn = fn
+    self.db = db
+    self.max_age = max_age
+    self.exclude = tuple(exclude)
+    self.lock = threading.Lock() # Held whilst rebuilding.
+    self.map_lock = threading.Lock() # Held whilst remapping.
+
+    self.lock_fd = None # File descriptor holding the writer lock, if this process is the writer.
+    self.seq = None # Sequence number of the FSDB journal when the index was last built.
+    self.checked = 0.0 # When the writer last checked if the index needed rebuilding.
+    self.written = 0.0 # When the writer last wrote the index.
+
+    self.map = None # mmap of the index, or None if not yet mapped.
+    self.map_stat = None # (inode, mtime_ns) of the mapped file, to detect its replacement.
+
+    self.changed = 0.0 # When this process last saw a change to the project.
+    self.db.subscribe(self.__change)
+
+    directory = os.path.dirname(fn)
+    if directory!='' and not os.path.exists(directory):
+      os.makedirs(directory)
+
+
+  def __change(self, seq, kind, path):
+    """Subscription to the FSDB - notes when the project last changed."""
+    self.changed = time.time()
+
+
+  def close(self):
+    """Stops using the index, releasing the writer lock if held."""
+    self.db.unsubscribe(self.__change)
+
+    with self.lock:
+      if self.lock_fd!=None:
+        if self.lock_fd>=0:
+          os.close(self.lock_fd)
+        self.lock_fd = None
+
+    with self.map_lock:
+      self.map = None # Closed when the last thread using it lets go.
+      self.map_stat = None
+
+
+  def writer(self):
+    """Returns True if this process is the writer, trying to become it if no process is."""
+    if self.lock_fd!=None: return True
+
+    if fcntl==None:
+      self.lock_fd = -1
+      return True
+
+    fd = os.open(self.fn + '.lock', os.O_RDWR | os.O_CREAT, 0o666)
+    try:
+      fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+      os.close(fd)
+      return False
+
+    self.lock_fd = fd
+    return True
+
+
+  def update(self):
+    """If this process is the writer rebuilds the index, if the project has changed since it was last built; otherwise does nothing. Checks at most once every check_interval seconds, and has to visit every asset to notice changes made by other processes (stat-ing each, but only parsing those that have changed), so it costs about as much as a listing page from the FSDB."""
+    now = time.time()
+    if (now - self.checked) < check_interval: return
+    if not self.lock.acquire(False): return # Another thread is on it.
+
+    try:
+      self.checked = now
+      if not self.writer(): return
+
+      assets = []
+      for path, node in self.db.walk('.json', self.exclude):
+        meta = node.read()
+        if meta!=None and 'type' in meta and 'owner' in meta:
+          assets.append((path, node.stat[0] if node.stat!=None else 0, meta))
+
+      # Rewrite it if anything has changed, or if it is getting old enough for the readers to stop trusting it...
+      seq = self.db.sequence()
+      if seq!=self.seq or (now - self.written) > (0.5 * self.max_age) or not os.path.exists(self.fn):
+        self.write(assets)
+        self.seq = seq
+        self.written = now
+
+    finally:
+      self.lock.release()
+
+
+  def write(self, assets):
+    """Writes the index from a list of (path, mtime_ns, meta), where meta is the dictionary of the asset's .json file."""
+    strings = bytearray()
+    offsets = dict()
+
+    def add(s):
+      if s==None: return (none_offset, 0)
+      if s not in offsets:
+        data = s.encode('utf8')
+        offsets[s] = (len(strings), len(data))
+        strings.extend(data)
+      return offsets[s]
+
+    records = bytearray()
+    for path, mtime, meta in assets:
+      fields = [mtime]
+      for s in ('/'.join(path), meta.get('name', ''), meta['type'], meta['owner'], meta.get('state', ''), '\n'.join(meta.get('support', ()))):
+        fields.extend(add(s))
+      fields.append(float(meta.get('priority', 0)))
+      fields.append(1 if meta.get('render', False) else 0)
+      records.extend(record.pack(*fields))
+
+    temp = '%s.%i.tmp' % (self.fn, os.getpid())
+    with open(temp, 'wb') as f:
+      f.write(header.pack(magic, version, time.time(), len(assets)))
+      f.write(records)
+      f.write(strings)
+    os.replace(temp, self.fn)
+
+
+  def remap(self):
+    """Maps the index, if it has been replaced since it was last mapped. Returns False if there is no usable index."""
+    try:
+      st = os.stat(self.fn)
+    except OSError:
+      return False
+
+    key = (st.st_ino, st.st_mtime_ns)
+    if key==self.map_stat: return True
+
+    with self.map_lock:
+      if key==self.map_stat: return True
+
+      try:
+        with open(self.fn, 'rb') as f:
+          m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+      except (OSError, ValueError):
+        return False
+
+      if len(m)<header.size or header.unpack_from(m, 0)[:2]!=(magic, version):
+        m.close()
+        return False
+
+      self.map = m # The old one is closed when the last thread using it lets go.
+      self.map_stat = key
+      return True
+
+
+  def assets(self):
+    """Returns a list of Asset-s, one for every asset of the project, in no particular order, or None if the index can not be used - because it has not been built yet, is older than max_age or this process has seen a change more recent than it. Updates the index first if this process is the writer."""
+    self.update()
+    if not self.remap(): return None
+
+    m = self.map
+    if m==None: return None
+    m = memoryview(m)
+    _, _, built, count = header.unpack_from(m, 0)
+    if self.changed>=built or (time.time() - built) > self.max_age: return None
+
+    base = header.size + count * record.size
+    strings = m[base:]
+
+    def get(offset, length):
+      if offset==none_offset: return None
+      return str(strings[offset:offset+length], 'utf8')
+
+    ret = []
+    for r in record.iter_unpack(m[header.size:base]):
+      path = tuple(get(r[1], r[2]).split('/'))
+      support = get(r[11], r[12])
+      support = tuple(support.split('\n')) if support!='' else ()
+      priority = int(r[13]) if r[13].is_integer() else r[13]
+
+      ret.append(Asset(path, r[0], get(r[3], r[4]), get(r[5], r[6]), get(r[7], r[8]), get(r[9], r[10]), priority, r[14]!=0, support))
+
+    return ret
@@ -0,0 +1,131 @@
+#! /usr/bin/env python3
+# Copyright 2014 Tom SF Haines
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import os.path
+import json
+
+import unittest
+import tempfile
+
+from . import fs_db
+from . import fs_db_json
+from . import asset_index
+
+
+
+class TestAssetIndex(unittest.TestCase):
+  """Tests the index of assets shared between processes."""
+  def setUp(self):
+    self.temp_dir = tempfile.TemporaryDirectory()
+    self.root = os.path.join(self.temp_dir.name, 'project')
+    self.fn = os.path.join(self.temp_dir.name, 'index', 'project.idx')
+
+    os.makedirs(os.path.join(self.root, 'props'))
+    self.meta = {'name' : 'Teapot', 'type' : 'prop', 'owner' : None, 'state' : 'modelling', 'priority' : 7, 'render' : True, 'support' : ['tom', 'joe']}
+    with open(os.path.join(self.root, 'props', 'teapot.blend.json'), 'w') as f:
+      json.dump(self.meta, f)
+
+    with open(os.path.join(self.root, 'project.json'), 'w') as f:
+      json.dump({'title' : 'Tea'}, f)
+
+    self.dbs = []
+    self.indices = []
+
+
+  def tearDown(self):
+    for index in self.indices:
+      index.close()
+    self.temp_dir.cleanup()
+
+
+  def process(self, exclude = ()):
+    """Helper - returns an FSDB and AssetIndex, as another process would have."""
+    db = fs_db.FSDB(self.root)
+    db.register(fs_db_json.JsonFileType())
+    index = asset_index.AssetIndex(self.fn, db, exclude = exclude)
+
+    self.dbs.append(db)
+    self.indices.append(index)
+    return db, index
+
+
+  def test_assets(self):
+    """Checks the writer builds the index, and a reader gets the same from it."""
+    db, writer = self.process()
+    assets = writer.assets()
+    self.assertTrue(writer.writer())
+    self.assertTrue(len(assets)==1)
+
+    teapot = assets[0]
+    self.assertTrue(teapot.path==('props', 'teapot.blend.json'))
+    self.assertTrue(teapot.mtime==db['props', 'teapot.blend.json'].stat[0])
+    self.assertTrue((teapot.name, teapot.type, teapot.owner, teapot.state)==('Teapot', 'prop', None, 'modelling'))
+    self.assertTrue(teapot.priority==7 and isinstance(teapot.priority, int))
+    self.assertTrue(teapot.render==True)
+    self.assertTrue(teapot.support==('tom', 'joe'))
+
+    other_db, reader = self.process()
+    self.assertFalse(reader.writer())
+    self.assertTrue(reader.assets()==assets)
+
+
+  def test_changes(self):
+    """Checks that a change is picked up by the writer, and that a reader that has seen a change more recent than the index ignores it."""
+    db, writer = self.process()
+    other_db, reader = self.process()
+    self.assertTrue(writer.assets()[0].owner==None)
+
+    # The reader makes a change - it can't use the index until the writer has rebuilt it...
+    node = other_db['props', 'teapot.blend.json']
+    meta = dict(node.read())
+    meta['owner'] = 'tom'
+    node.write(meta)
+    self.assertTrue(reader.assets()==None)
+
+    writer.checked = 0.0
+    self.assertTrue(writer.assets()[0].owner=='tom')
+    self.assertTrue(reader.assets()[0].owner=='tom')
+
+    # An index that is too old is ignored, in case the writer has stopped...
+    reader.max_age = -1.0
+    self.assertTrue(reader.assets()==None)
+
+
+  def test_takeover(self):
+    """Checks another process becomes the writer when the writer goes."""
+    db, writer = self.process()
+    other_db, reader = self.process()
+    self.assertTrue(writer.writer())
+    self.assertFalse(reader.writer())
+
+    writer.close()
+    self.indices.remove(writer)
+    self.assertTrue(reader.writer())
+    self.assertTrue(len(reader.assets())==1)
+
+
+  def test_exclude(self):
+    """Checks that old versions of files, in excluded directories, are not indexed."""
+    os.makedirs(os.path.join(self.root, 'props', 'old'))
+    with open(os.path.join(self.root, 'props', 'old', 'teapot.blend.json 2014-01-01'), 'w') as f:
+      json.dump(self.meta, f)
+    with open(os.path.join(self.root, 'props', 'old', 'teapot.blend.json'), 'w') as f:
+      json.dump(self.meta, f)
+
+    db, writer = self.process(('old',))
+    assets = writer.assets()
+    self.assertTrue([asset.path for asset in assets]==[('props', 'teapot.blend.json')])
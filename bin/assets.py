@@ -35,7 +35,8 @@ def app(rfam, response):
   new_button = rfam.template('button.new', {}, response)
 
   # Fetch the correct header for the asset list...
-  if rfam.proj_defaults(response.project)['priority.json'].read()['visible']:
+  settings = rfam.catalog(response.project).priority
+  if settings['visible']:
     assets_head = rfam.template('assets.head_priority', {}, response)
     row_template = 'assets.row_priority'
   else:
@@ -54,31 +55,41 @@ def app(rfam, response):
   types.sort(key=lambda t: t[1])
   types = '\n'.join(map (lambda t: t[0], types))
   
-  # Generate the list of assets for the table...
-  assets = []
-  
-  db = rfam.proj(response.project)
+  # Collect the assets, from the shared index if possible (it doesn't include dependencies, so can't be used when boosting priorities)...
   old = rfam.getLanguage(response.user)['old']
+  rows = None
   
-  ident = 0
-  for path in db:
-    if old in path: continue # Skip depreciated versions of files.
-    node = db[path]
-    if node.isa()==node.FILE and path[-1].endswith('.json'):
+  if not settings['boosting']:
+    indexed = rfam.indexed_assets(response.project)
+    if indexed!=None:
+      rows = [(asset.path, asset.name, asset.type, asset.owner, asset.state, asset.priority, asset.priority) for asset in indexed if old not in asset.path[:-1]] # Skip depreciated versions of files.
+  
+  if rows==None:
+    rows = []
+    db = rfam.proj(response.project)
+    
+    for path, node in db.walk('.json', (old,)): # Skip depreciated versions of files.
       meta = node.read()
       if meta==None or ('type' not in meta) or ('owner' not in meta):
         continue
       
-      at = rfam.getType(response.project, meta['type'])
-      at = at['name'] if at!=None else '? - error'
-      owner = rfam.userChoice(response.project, meta['owner'], True)
-      state = rfam.stateChoice(response.project, meta['type'], meta['state'])
-      priority = rfam.priorityInterface(response.project, meta['priority'])
-      
-      payload = {'id' : str(ident), 'path' : attr_escape(('/'.join(path))[:-5]), 'name' : meta['name'], 'type_ident' : meta['type'], 'type' : at, 'owner' : owner, 'state' : state, 'priority' : priority, 'true_priority' : true_priority(rfam, response.project, node)}
-      assets.append(rfam.template(row_template, payload, response))
-      
-      ident += 1
+      rows.append((path, meta['name'], meta['type'], meta['owner'], meta['state'], meta['priority'], true_priority(rfam, response.project, node)))
+  
+  # Generate the list of assets for the table...
+  assets = []
+  
+  ident = 0
+  for path, name, type_ident, owner_ident, state_ident, priority_value, priority_true in rows:
+    at = rfam.getType(response.project, type_ident)
+    at = at['name'] if at!=None else '? - error'
+    owner = rfam.userChoice(response.project, owner_ident, True)
+    state = rfam.stateChoice(response.project, type_ident, state_ident)
+    priority = rfam.priorityInterface(response.project, priority_value)
+    
+    payload = {'id' : str(ident), 'path' : attr_escape(('/'.join(path))[:-5]), 'name' : name, 'type_ident' : type_ident, 'type' : at, 'owner' : owner, 'state' : state, 'priority' : priority, 'true_priority' : priority_true}
+    assets.append(rfam.template(row_template, payload, response))
+    
+    ident += 1
   
   assets = '\n'.join(assets)
   
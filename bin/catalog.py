@@ -0,0 +1,94 @@
+# Copyright 2014 Tom SF Haines
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import time
+
+
+
+class Choice:
+  """The html of a list of options for a select element, made once and then reused with any one of them selected. Each option is given as (key, before, after), and is written as before + flag + after, where flag is 'selected' for the selected one and '' otherwise; an option with a key of None is never selected. Selecting one copies the string with 'selected' inserted, rather than building every option again."""
+  def __init__(self, options):
+    options = list(options)
+    self.html = ''.join(before + after for key, before, after in options)
+    
+    # For each key where 'selected' goes in the html to select its option(s)...
+    self.marks = dict()
+    offset = 0
+    for key, before, after in options:
+      if key!=None:
+        self.marks.setdefault(key, []).append(offset + len(before))
+      offset += len(before) + len(after)
+  
+  
+  def render(self, selected = None):
+    """Returns the html with the option(s) with the given key selected; if there are none then it is returned with nothing selected."""
+    marks = self.marks.get(selected)
+    if marks==None: return self.html
+    
+    ret = self.html
+    for pos in reversed(marks):
+      ret = ret[:pos] + 'selected' + ret[pos:]
+    
+    return ret
+
+
+
+class Catalog:
+  """Everything in the defaults directory of a project that pages need, read once and indexed, so a page that lists many assets does not read every asset type and state for each of them. Never edited after construction, other than remembering the html it is asked to make - when the defaults change a new one is made to replace it, so threads can keep using the old one. Treat the contents of the dictionaries as read only, as they are the cached contents of the files."""
+  def __init__(self, db):
+    """db is the FSDB of the defaults directory."""
+    self.db = db
+    self.seq = db.sequence() # Journal sequence number of db when built, to notice when it has changed.
+    self.built = time.time()
+    
+    # Asset types, in the order they are listed, and states, both indexed by ident...
+    self.types = dict()
+    if 'asset_types' in db:
+      for name in db['asset_types']:
+        if name.endswith('.json'):
+          at = db['asset_types', name].read()
+          self.types[at['ident']] = at
+    
+    self.states = dict()
+    if 'states' in db:
+      for name in db['states']:
+        if name.endswith('.json'):
+          state = db['states', name].read()
+          self.states[state['ident']] = state
+    
+    # For each type the states it supports, in order, skipping any that do not exist...
+    self.type_states = dict()
+    for ident, at in self.types.items():
+      self.type_states[ident] = [self.states[s] for s in at['states'] if s in self.states]
+    
+    # The priority configuration...
+    self.priority = db['priority.json'].read() if 'priority.json' in db else None
+    
+    # Html made from the above, by the key it was asked for with - see memo...
+    self.memos = dict()
+
+
+  def memo(self, key, make):
+    """Returns what make() returns, calling it only the first time a key is used - for html made from the defaults, such as a Choice. Two threads could both make one, which is harmless."""
+    ret = self.memos.get(key)
+    if ret==None:
+      ret = make()
+      self.memos[key] = ret
+    return ret
+  
+  
+  def current(self, db, max_age):
+    """Returns True if this catalog can still be used for the given FSDB of the defaults - it must be the one it was built from, with no changes seen since, and not older than max_age seconds, after which it is rebuilt in case another process has changed a file."""
+    return db is self.db and db.sequence()==self.seq and (time.time() - self.built) < max_age
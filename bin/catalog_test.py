@@ -0,0 +1,90 @@
+#! /usr/bin/env python3
+# Copyright 2014 Tom SF Haines
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import os.path
+import json
+
+import unittest
+import tempfile
+
+from . import fs_db
+from . import fs_db_json
+from . import catalog
+
+
+
+class TestCatalog(unittest.TestCase):
+  """Tests the catalog of the defaults of a project."""
+  def setUp(self):
+    self.temp_dir = tempfile.TemporaryDirectory()
+    self.root = self.temp_dir.name
+    
+    os.mkdir(os.path.join(self.root, 'asset_types'))
+    os.mkdir(os.path.join(self.root, 'states'))
+    
+    def save(fn, data):
+      with open(os.path.join(self.root, fn), 'w') as f:
+        json.dump(data, f)
+    
+    save('asset_types/shot.json', {'ident' : 'shot', 'states' : ['done', 'missing', 'ns']})
+    save('states/ns.json', {'ident' : 'ns', 'name' : 'Not started'})
+    save('states/done.json', {'ident' : 'done', 'name' : 'Done'})
+    save('priority.json', {'low' : 0, 'high' : 10})
+    
+    self.db = fs_db.FSDB(self.root)
+    self.db.register(fs_db_json.JsonFileType())
+  
+  
+  def tearDown(self):
+    self.temp_dir.cleanup()
+  
+  
+  def test_contents(self):
+    """Checks the types, states and priority are indexed, with the states of a type in its order and missing ones skipped."""
+    cat = catalog.Catalog(self.db)
+    
+    self.assertTrue(list(cat.types)==['shot'])
+    self.assertTrue(set(cat.states)=={'ns', 'done'})
+    self.assertTrue([s['ident'] for s in cat.type_states['shot']]==['done', 'ns'])
+    self.assertTrue(cat.priority['high']==10)
+  
+  
+  def test_current(self):
+    """Checks a catalog stops being current when the defaults change, or another FSDB is used."""
+    cat = catalog.Catalog(self.db)
+    self.assertTrue(cat.current(self.db, 60.0))
+    self.assertFalse(cat.current(self.db, 0.0))
+    
+    other = fs_db.FSDB(self.root)
+    self.assertFalse(cat.current(other, 60.0))
+    
+    self.db['priority.json'].write({'low' : 0, 'high' : 5})
+    self.assertFalse(cat.current(self.db, 60.0))
+    self.assertTrue(catalog.Catalog(self.db).priority['high']==5)
+  
+  
+  def test_choice(self):
+    """Checks a Choice selects the right option, and only that one."""
+    choice = catalog.Choice([(None, '<option', ' value="">-</option>'), ('a', '<option ', ' value="a">A</option>'), ('b', '<option ', ' value="b">B</option>')])
+    
+    self.assertTrue(choice.render()=='<option value="">-</option><option  value="a">A</option><option  value="b">B</option>')
+    self.assertTrue(choice.render('b')=='<option value="">-</option><option  value="a">A</option><option selected value="b">B</option>')
+    self.assertTrue(choice.render('c')==choice.render())
+    
+    cat = catalog.Catalog(self.db)
+    self.assertTrue(cat.memo('x', lambda: choice) is choice)
+    self.assertTrue(cat.memo('x', lambda: None) is choice)
@@ -15,18 +15,30 @@
 
 import os
 import os.path
+import sys
+import stat
+import types
 import shutil
+import copy
 import time
 import datetime
+import atexit
 
 import json
+import contextlib
+import itertools
+import threading
+import weakref
+from collections import OrderedDict, deque
 
 try:
   from collections.abc import Mapping
 except ImportErrror:
   from collections import Mapping
 
-from .lock_file import lock_dir_prefix, LockFile
+from .lock_file import hidden_prefixes, LockFile, AtomicFile
+from . import fs_db_inotify
+from . import fs_db_broadcast
 
 
 
@@ -44,84 +56,407 @@ class FileType:
     """Given a writable file object and the data associated (in the same form as read returns) this should write it to the file."""
     raise NotImplementedError
   
+  def json_safe(self):
+    """Returns True if the objects returned by read can be saved with json, so they can be included in a snapshot of the FSDB."""
+    return False
+  
+  def freeze(self, data):
+    """Given an object, as returned by read, returns a read only view of it, for an FSDB in frozen mode to cache and hand out - write must accept what this returns. The default can't do any better than returning it unchanged."""
+    return data
+  
+  def thaw(self, data):
+    """Reverses freeze, returning a private copy of the data that can be edited - must always copy, as it is also used to get an editable copy of unfrozen data. The default is a deep copy."""
+    return copy.deepcopy(data)
+  
+
+
+class Epoch(threading.local):
+  """The current epoch of a thread - whilst one is running each Node is validated against the file system at most once. 0 when no epoch is running. Thread local, so each request of a threaded server gets its own."""
+  current = 0
+
+epoch_state = Epoch()
+epoch_count = itertools.count(1)
+
+def begin_epoch():
+  """Starts an epoch for the calling thread, typically one per web request - until end_epoch is called every Node, of every FSDB, will be validated against the file system at most once, so any number of helpers can access the same files without repeatedly checking them. Changes made by this process are still seen immediately. Returns the epoch number, which is unique across threads."""
+  epoch_state.current = next(epoch_count)
+  return epoch_state.current
+
+
+def end_epoch():
+  """Ends the current epoch of the calling thread, so Node-s go back to being validated on every access."""
+  epoch_state.current = 0
+
+
+
+class ContentsBudget:
+  """Tracks every Node with cached file contents, across every FSDB, in least recently used order, whilst a limit is set, so the total can be kept within a memory budget by evicting the contents that have gone unused for longest; they are reloaded when next read. Sizes are those of the files on disk, which is only a rough guide to the memory the parsed contents use."""
+  def __init__(self):
+    self.limit = None # Maximum total size of cached contents, in bytes; None for no limit.
+    self.nodes = OrderedDict() # id(Node) -> (Node, size), least recently used first.
+    self.size = 0 # Total size of cached contents.
+    self.evictions = 0 # Number of times contents have been evicted.
+    self.lock = threading.Lock() # Held whilst the queue is being changed; never held whilst taking another lock.
+  
+  
+  def use(self, node, size = None):
+    """Records that the contents of the given Node have just been used, moving it to the back of the queue. If they have just been loaded size should be given, after which other contents are evicted if the budget has been exceeded. Does nothing, without taking the lock, if there is no limit, as this is called on every read."""
+    if self.limit==None: return
+    
+    key = id(node)
+    with self.lock:
+      if key in self.nodes:
+        self.nodes.move_to_end(key)
+        if size==None: return
+        self.size -= self.nodes[key][1]
+      
+      if size==None: size = 0
+      self.nodes[key] = (node, size)
+      self.size += size
+      
+      if self.limit!=None and self.size>self.limit:
+        self.evict()
+  
+  
+  def discard(self, node):
+    """Stops tracking a Node, for when its contents have gone."""
+    with self.lock:
+      entry = self.nodes.pop(id(node), None)
+      if entry!=None:
+        self.size -= entry[1]
+  
+  
+  def release(self, owner):
+    """Stops tracking every Node of the given FSDB, for when it is no longer in use."""
+    with self.lock:
+      for key, entry in list(self.nodes.items()):
+        if entry[0].owner is owner:
+          del self.nodes[key]
+          self.size -= entry[1]
+  
+  
+  def evict(self):
+    """Evicts contents, least recently used first, until within the limit. Never evicts the most recently used, or contents with a pending write, as they are not on disk yet. The caller must hold the lock. A thread that is reading evicted contents keeps the object it already has, so eviction never takes anything away from a caller."""
+    skipped = []
+    while self.size>self.limit and len(self.nodes)>1:
+      key, entry = self.nodes.popitem(last=False)
+      node = entry[0]
+      if key in node.owner.pending:
+        skipped.append((key, entry))
+        continue
+      
+      node.contents = None
+      self.size -= entry[1]
+      self.evictions += 1
+    
+    for key, entry in reversed(skipped):
+      self.nodes[key] = entry
+      self.nodes.move_to_end(key, last=False)
+
+
+
+# The budget shared by every FSDB...
+budget = ContentsBudget()
+
+def set_memory_budget(limit):
+  """Sets the maximum total size, in bytes, of the cached file contents of every FSDB, measured as the size of the files on disk; None, the default, for no limit. Contents are only tracked whilst there is a limit, so it should be set before files are read."""
+  with budget.lock:
+    budget.limit = limit
+    if limit==None:
+      # Nothing is tracked without a limit...
+      budget.nodes.clear()
+      budget.size = 0
+    
+    elif budget.size>limit:
+      budget.evict()
+
+
+def memory_stats():
+  """Returns a dictionary of statistics about cached file contents, across every FSDB - 'resident' is their total size, 'cached' how many files have cached contents and 'evictions' how many times contents were evicted to keep within the budget. Only counts contents tracked whilst a budget is set."""
+  return {'resident' : budget.size, 'cached' : len(budget.nodes), 'evictions' : budget.evictions}
+
+
+
+# Every FSDB of this process, so changes made by other processes can be applied to all of them - id(FSDB) -> FSDB, as they can not be hashed...
+instances = weakref.WeakValueDictionary()
+
+# The broadcast shared by every FSDB of this process, or None if other processes are not being told about changes...
+broadcast = None
+
+def enable_broadcast(directory):
+  """Makes every FSDB of this process tell the other processes that use the same directory about the changes it makes, and apply the changes they make, so a worker of a multi-process server sees a new file immediately, rather than after the cache time. Changes from other processes are applied whenever an FSDB is polled. Messages can be lost if a process falls behind, in which case it finds out about the change as it would without the broadcast."""
+  global broadcast
+  if broadcast==None:
+    broadcast = fs_db_broadcast.Broadcast(directory)
+    atexit.register(disable_broadcast)
+
+
+def disable_broadcast():
+  """Stops telling other processes about changes, and removes the socket of this process."""
+  global broadcast
+  if broadcast!=None:
+    broadcast.close()
+    broadcast = None
+
+
+def apply_broadcast(path, kind, mtime):
+  """Applies a change made by another process to every FSDB that covers the given path - see FSDB.invalidate."""
+  for db in list(instances.values()):
+    root = os.path.abspath(db.root)
+    if path.startswith(root + os.sep):
+      db.invalidate(tuple(path[len(root)+1:].split(os.sep)), kind, mtime)
+
+
+
+def dir_validator(path, now):
+  """Returns (mtime_ns, size, inode) for the given directory, to compare with later to see if its contents have changed. Returns None if the directory was modified too recently for its mtime to be trusted (file systems with coarse time stamps could change it again without the mtime changing) or it can not be stat-ed. now is the time the listing it is validating was started."""
+  try:
+    st = os.stat(path)
+  except OSError:
+    return None
+  
+  if st.st_mtime_ns > (now - 2.0) * 1e9:
+    return None
+  
+  return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+
+# Number of directory locks an FSDB has - see FSDB.dir_lock...
+lock_stripes = 64
+
+
+
+# Shared by every directory that has no children, so empty directories do not need a dict of their own - replaced by a real dict when a child is added...
+no_children = types.MappingProxyType(dict())
+
 
 
 class Node(Mapping):
-  """Represents a node in the filesystem, be it file or directory. Provides a slightly weird if useful interface to it!"""
+  """Represents a node in the filesystem, be it file or directory. Provides a slightly weird if useful interface to it! Kept small, as there is one per file - names are interned, paths and file types are worked out when needed rather than stored, and empty directories share a children map."""
   UNINITIALISED = 0
   DELETED = 1
   DIRECTORY = 2
   FILE = 3
   
-  __slots__ = ['owner', 'parent', 'name', 'cache_real_path', 'state', 'ftype', 'update', 'contents', 'ext']
+  __slots__ = ['owner', 'parent', 'name', 'state', 'update', 'contents', 'ext', 'stat', 'epoch']
   
   def __init__(self, owner, parent, name):
     self.owner = owner
     self.parent = parent
-    self.name = name
-    
-    self.cache_real_path = None # Its slow to calculate, so cache it.
+    self.name = sys.intern(name) if name!=None else None # The same names turn up in every directory.
     
     self.state = Node.UNINITIALISED
-    self.ftype = None # The file type object that matches this filename; None if no associated type.
-    self.update = None # When it was last updated.
-    self.contents = None # Depends on what it is - for directories its a dict[child] -> Node.
-    self.ext = None
-    
-    for ext, ft in owner.types.items():
-      if self.name.endswith(ext):
-        self.ftype = ft
-        break
+    self.update = None # When it was last updated - for directories when it was listed, for files when the stat was last checked.
+    self.contents = None # Depends on what it is - for directories its a dict[child] -> Node, or no_children if its empty.
+    self.ext = None # For directories a dict[extension] -> True if a file with that extension is inside; reset on change.
+    self.epoch = 0 # Epoch in which it was last validated.
+    self.stat = None # (mtime_ns, size, inode) from the last time it was looked at, or None if unknown. For directories this is from when it was listed, and only recorded if it can be trusted to detect a change.
+  
+  
+  @property
+  def ftype(self):
+    """The file type object that matches this filename; None if no associated type. Looked up in the table of the owner each time."""
+    if self.name==None: return None
+    return self.owner.filetype_of(self.name)
+  
+  
+  def adopt(self, name, child = None):
+    """Creates a new, uninitialised, Node with the given name and adds it to the contents of this directory, which must already have been listed - alternatively child can be a Node that has already been made, with this as its parent. Returns the new Node. The caller must hold the directory lock of this Node; the contents are copied rather than edited, so threads iterating the old ones are not disturbed."""
+    if child==None:
+      child = Node(self.owner, self, name)
+    contents = dict(self.contents)
+    contents[child.name] = child
+    self.contents = contents
+    return child
+  
+  
+  def changed(self):
+    """Records that the contents of this directory have changed - resets the summary of what it contains, for it and its parents, and updates the version of the owner."""
+    self.owner.version += 1
+    node = self
+    while node!=None:
+      node.ext = None
+      node = node.parent
   
   
   def isa(self):
     """Returns what it is - either DELETED, DIRECTORY or FILE. Note that this will make sure everything is upto date as required, so this doubles as a cache-checking method."""
-    # If it hasn't been initialised make it do so...
+    # If it hasn't been initialised make it do so - usually the parent directory listing will have done this already...
     if self.state==Node.UNINITIALISED:
-      path = self.real_path()
-      
-      if not os.path.exists(path):
-        self.state = Node.DELETED
-      elif os.path.isdir(path):
+      self.resolve()
+    
+    # If its a directory make sure it has been listed, noting that the contents cache may be out of date - watched directories are only relisted when marked dirty (update set to None) whilst the rest time out...
+    current = epoch_state.current
+    if self.state==Node.DIRECTORY and (self.epoch!=current or current==0):
+      # Checked again with the lock held, as another thread may have just done the work...
+      with self.owner.dir_lock(self):
+        self.epoch = current
+        
+        if self.contents==None:
+          self.scan()
+        
+        elif id(self) in self.owner.watches:
+          if self.update==None:
+            self.refresh()
+        
+        elif self.update==None or (self.update + self.owner.cache_time) < time.time():
+          self.refresh()
+     
+    return self.state
+  
+  
+  def resolve(self):
+    """Decides what an uninitialised node is with a single stat."""
+    try:
+      st = os.stat(self.real_path())
+      if stat.S_ISDIR(st.st_mode):
         self.state = Node.DIRECTORY
       else:
         self.state = Node.FILE
+        self.stat = (st.st_mtime_ns, st.st_size, st.st_ino)
+    
+    except OSError:
+      self.state = Node.DELETED
+  
+  
+  def watch(self, path):
+    """Starts watching this directory, which is at the given real path, for changes if the owner has a watcher and it is not already watched. Watch descriptors are kept by the owner rather than in every Node, as most are never watched."""
+    owner = self.owner
+    if owner.watcher!=None and id(self) not in owner.watches:
+      wd = owner.watcher.add(path, self)
+      if wd!=None:
+        owner.watches[id(self)] = wd
+  
+  
+  def scan(self, details = False):
+    """Lists the directory for the first time, using os.scandir so that each child already knows if its a file or a directory without having to be checked individually. If details is True it also records the mtime, size and inode of every file from the same pass, ready for read(). Called automatically by isa as required, with the directory lock held."""
+    path = self.real_path()
+    
+    # Start watching before listing, so no change can slip between the two...
+    self.watch(path)
+    
+    self.update = time.time()
+    self.stat = dir_validator(path, self.update)
+    contents = dict()
+    
+    try:
+      with os.scandir(path) as it:
+        for entry in it:
+          if entry.name.startswith(hidden_prefixes): continue
+          child = Node(self.owner, self, entry.name)
+          child.enter(entry, details)
+          contents[child.name] = child
+    
+    except OSError:
+      pass
+    
+    self.contents = contents if len(contents)!=0 else no_children
+    self.owner.version += 1
+  
+  
+  def enter(self, entry, details = False):
+    """Initialises an uninitialised Node from the os.DirEntry for it, which avoids having to stat it. Symbolic links are left for isa to resolve. If details is True files that have a file type (so can be read) also have their mtime, size and inode recorded."""
+    try:
+      if entry.is_symlink():
+        return
       
-      if self.state==Node.DIRECTORY:
-        # Make sure it contains the correct directory contents...
-        self.update = time.time()
-        
-        self.contents = dict()
-        try:
-          fns = os.listdir(path)
-        except OSError:
-          fns = []
-        
-        for fn in fns:
-          if not fn.startswith(lock_dir_prefix):
-            self.contents[fn] = Node(self.owner, self, fn)
-
-      return self.state # No need to check stuff - we just updated it!
+      if entry.is_dir(follow_symlinks=False):
+        self.state = Node.DIRECTORY
+      
+      else:
+        self.state = Node.FILE
+        if details and self.ftype!=None:
+          st = entry.stat(follow_symlinks=False)
+          self.stat = (st.st_mtime_ns, st.st_size, st.st_ino)
     
-    # If its a directory its contents cache may be out of date...
-    if self.state==Node.DIRECTORY:
-      t = time.time()
-      if (self.update + self.owner.cache_time) < t:
-        self.update = t
-        self.ext = None # Reset contents cache.
-        path = self.real_path()
-        fnl = set(os.listdir(path))
+    except OSError:
+      self.state = Node.UNINITIALISED
+  
+  
+  def load(self, skip = None):
+    """Loads the entire hierarchy below this node in a single pass - every directory is listed with os.scandir and the mtime, size and inode of every file that can be read is recorded from the same results. Much faster than discovering everything lazily, especially on a network file system. Parts of the hierarchy that have already been listed are not listed again. skip is optionally a function that is given the name of each child and returns True if it is not to be loaded, including everything below it."""
+    if self.state==Node.UNINITIALISED:
+      self.resolve()
+    
+    if self.state!=Node.DIRECTORY: return
+    
+    with self.owner.dir_lock(self):
+      if self.contents==None:
+        self.scan(True)
+    self.isa()
+    
+    stack = [self]
+    while len(stack)!=0:
+      node = stack.pop()
+      for name, child in node.contents.items():
+        if skip!=None and skip(name): continue
         
-        # Delete stuff that no longer exists...
-        for die in (self.contents.keys() - fnl):
-          del self.contents[die]
+        if child.state==Node.UNINITIALISED:
+          child.resolve()
         
-        # Add new stuff...
-        for birth in (fnl - self.contents.keys()):
-          if not birth.startswith(lock_dir_prefix):
-            self.contents[birth] = Node(self.owner, self, birth)
-     
-    return self.state
+        if child.state==Node.DIRECTORY:
+          if child.contents==None:
+            with self.owner.dir_lock(child):
+              if child.contents==None:
+                child.scan(True)
+          stack.append(child)
+  
+  
+  def refresh(self):
+    """Relists the contents of a directory, keeping the Node-s of children that still exist. Skips the listing if the directory has provably not changed since it was last listed. Called automatically by isa as required. Takes the directory lock, and swaps in new contents rather than editing them, so threads iterating the old contents are not disturbed."""
+    with self.owner.dir_lock(self):
+      path = self.real_path()
+      self.watch(path)
+      
+      self.update = time.time()
+      prev = self.stat
+      self.stat = dir_validator(path, self.update)
+      if prev!=None and prev==self.stat:
+        return
+      
+      try:
+        with os.scandir(path) as it:
+          entries = dict((entry.name, entry) for entry in it if not entry.name.startswith(hidden_prefixes))
+      except OSError:
+        entries = dict()
+      
+      contents = dict(self.contents)
+      changed = False
+      
+      # Delete stuff that no longer exists...
+      for die in (contents.keys() - entries.keys()):
+        contents[die].forget()
+        self.owner.pending.pop(id(contents[die]), None)
+        self.owner.record('deleted', contents[die], True)
+        del contents[die]
+        changed = True
+      
+      # Add new stuff...
+      for birth in (entries.keys() - contents.keys()):
+        child = Node(self.owner, self, birth)
+        child.enter(entries[birth])
+        contents[child.name] = child
+        self.owner.record('created', child, True)
+        changed = True
+      
+      if changed:
+        self.contents = contents if len(contents)!=0 else no_children
+        self.changed()
+  
+  
+  def forget(self):
+    """Stops watching this node and everything below it, and drops any cached contents from the memory budget - called when it leaves the hierarchy."""
+    if self.state==Node.FILE:
+      budget.discard(self)
+    
+    elif self.state==Node.DIRECTORY and self.contents!=None:
+      wd = self.owner.watches.pop(id(self), None)
+      if wd!=None:
+        self.owner.watcher.remove(wd)
+      
+      for child in self.contents.values():
+        child.forget()
 
 
   def path(self):
@@ -135,18 +470,15 @@ class Node(Mapping):
   
   
   def real_path(self):
-    """Returns the real filename of the node - a straight string that can be passed to functions like open etc."""
-    if self.cache_real_path==None:
-      def make_path(node):
-        while True:
-          if node.parent==None:
-            yield node.owner.root
-            return
-          yield node.name
-          node = node.parent
-      self.cache_real_path = os.path.join(*list(make_path(self))[::-1])
-      
-    return self.cache_real_path
+    """Returns the real filename of the node - a straight string that can be passed to functions like open etc. Built from the parent links each time, rather than stored in every node."""
+    parts = []
+    node = self
+    while node.parent!=None:
+      parts.append(node.name)
+      node = node.parent
+    parts.append(node.owner.root)
+    
+    return os.path.join(*reversed(parts))
   
   
   def filetype(self):
@@ -157,43 +489,167 @@ class Node(Mapping):
   def read(self):
     """Reads the file and returns an object representing it.
     Note that the object may be cached for future calls to read,
-    and therefore must not be edited (Unless it is to be immediatly sent to the write method)."""
+    and therefore must not be edited - use read_for_update to get a copy that can be. If the FSDB is in frozen mode it is a read only view, as made by the FileType's freeze method, so editing it fails rather than silently changing the cache.
+    The cache is validated with the files mtime (nanoseconds), size and inode, unless it was validated within the trust window of the FSDB, in which case it is returned without even a stat.
+    If the contents were evicted to keep within the memory budget they are simply reloaded.
+    Safe to call from several threads at once - the contents are only read once into a local, as another thread could evict or replace them, and two threads that both find the cache stale will both load the file, which is harmless."""
     if self.ftype==None:
       raise TypeError('File type does not have a registered file handler')
     
+    owner = self.owner
+    contents = self.contents
+    
+    # If there is a pending write the cache is newer than the file...
+    if len(owner.pending)!=0 and id(self) in owner.pending and contents!=None:
+      owner.stat_saved += 1
+      budget.use(self)
+      return contents
+    
+    now = time.time()
+    current = epoch_state.current
+    
+    if contents!=None:
+      # Skip the stat if it was validated in this epoch or recently enough...
+      if (current!=0 and self.epoch==current) or (self.update!=None and (now - self.update) < owner.trust_window):
+        owner.stat_saved += 1
+        budget.use(self)
+        return contents
+      
+      # Check the cache is still valid...
+      st = os.stat(self.real_path())
+      owner.stat_calls += 1
+      self.update = now
+      self.epoch = current
+      
+      fstat = (st.st_mtime_ns, st.st_size, st.st_ino)
+      if fstat==self.stat:
+        budget.use(self)
+        return contents
+    
+    elif self.stat!=None and self.update==None:
+      # First read after load() or a snapshot - it has already been stat-ed, noting that if the file has changed since the stat will be older than what is read, which is safe...
+      owner.stat_saved += 1
+      fstat = self.stat
+    
+    else:
+      st = os.stat(self.real_path())
+      owner.stat_calls += 1
+      self.update = now
+      self.epoch = current
+      fstat = (st.st_mtime_ns, st.st_size, st.st_ino)
+    
+    # (Re)load the file...
     rpath = self.real_path()
-    fmtime = os.path.getmtime(rpath) # Less than ideal, but ns resolution not avalible on version of python I am using:-/
+    if owner.single_proc or owner.atomic:
+      f = open(rpath, 'r')
+      contents = self.ftype.read(f)
+      f.close()
+    else:
+      with LockFile(rpath, 'r') as f:
+        contents = self.ftype.read(f)
     
-    if self.update==None or self.update<fmtime:
-      self.update = fmtime
-      if self.owner.single_proc:
-        f = open(rpath, 'r')
-        self.contents = self.ftype.read(f)
-        f.close()
-      else:
-        with LockFile(rpath, 'r') as f:
-          self.contents = self.ftype.read(f)
+    if owner.frozen:
+      contents = self.ftype.freeze(contents)
+    
+    if self.stat!=None and self.stat!=fstat:
+      owner.record('modified', self, True)
     
-    return self.contents
+    self.contents = contents
+    self.stat = fstat
+    owner.version += 1
+    budget.use(self, fstat[1])
+    
+    return contents
+  
   
+  def read_for_update(self):
+    """Returns a private copy of what read returns, that can be edited and then handed to write - for read-modify-write, which should be wrapped in lock() if another thread or process could be changing the file. Costs a deep copy, so only use it when an edit is going to be made."""
+    data = self.read()
+    return self.ftype.thaw(data) if data!=None else None
   
-  def write(self, data):
-    """Writes the given data into the file, the details of which are FileType dependent. The data will also be stored in the files cache ready to be reused, so after a call to write data must not be edited, unless it is to be written again, which would not be very efficient. Note that this locks the file using a directory to make sure its totally safe."""
+  
+  def write(self, data, sync = False):
+    """Writes the given data into the file, the details of which are FileType dependent. The data will also be stored in the files cache ready to be reused, so after a call to write data must not be edited, unless it is to be written again, which would not be very efficient - in frozen mode a read only view is cached instead, so the caller can keep editing data. Note that this locks the file using a directory to make sure its totally safe, unless in atomic mode, where a temporary file is written and then renamed over the original. If the FSDB is in write-behind mode only the cache is updated, with the file written when the FSDB is flushed, so repeated writes cost one - set sync to True to write it immediately, for when it matters that it reaches the disk."""
     if self.ftype==None:
       raise TypeError('File type does not have a registered file handler')
     
-    rpath = self.real_path()
+    owner = self.owner
+    if owner.frozen:
+      data = self.ftype.freeze(data)
+    
+    if owner.write_behind>0.0 and not sync:
+      key = id(self)
+      if key in owner.pending:
+        owner.writes_coalesced += 1
+      else:
+        if len(owner.pending)==0:
+          owner.pending_since = time.time()
+        owner.pending[key] = self
+      
+      self.update = time.time()
+      self.epoch = epoch_state.current
+      self.contents = data
+      owner.version += 1
+      budget.use(self)
     
-    if self.owner.single_proc:
-      f = open(rpath, 'w')
-      self.ftype.write(f, data)
-      f.close()
     else:
-      with LockFile(rpath, 'w') as f:
-        self.ftype.write(f, data)
+      owner.pending.pop(id(self), None)
+      self.__store(data)
+    
+    owner.record('modified', self)
+  
+  
+  def flush(self):
+    """Writes the file if it has a pending write, from write-behind mode; otherwise does nothing."""
+    if self.owner.pending.pop(id(self), None)!=None:
+      self.__store(self.contents)
+  
+  
+  def __store(self, data):
+    """Does the actual writing for write, and flush. Holds the file lock, so two threads never write the same file at once. In frozen mode data must already be frozen."""
+    rpath = self.real_path()
     
-    self.update = os.path.getmtime(rpath) # Less than ideal, but ns resolution not avalible on version of python I am using:-/
-    self.contents = data
+    with self.owner.file_lock(self):
+      if self.owner.single_proc:
+        f = open(rpath, 'w')
+        self.ftype.write(f, data)
+        f.close()
+      elif self.owner.atomic:
+        with AtomicFile(rpath, 'w') as f:
+          self.ftype.write(f, data)
+      else:
+        with LockFile(rpath, 'w') as f:
+          self.ftype.write(f, data)
+      
+      st = os.stat(rpath)
+      self.owner.stat_calls += 1
+      self.owner.writes += 1
+      
+      self.update = time.time()
+      self.epoch = epoch_state.current
+      self.stat = (st.st_mtime_ns, st.st_size, st.st_ino)
+      self.contents = data
+      self.owner.version += 1
+      budget.use(self, st.st_size)
+  
+  
+  @contextlib.contextmanager
+  def lock(self):
+    """Returns a context manager that a read-modify-write of this file should be wrapped in, so a concurrent change by another thread or process is not lost. Always holds the file lock of this Node, which keeps out other threads of this process; in atomic mode it also locks the file on disk, with the next read always checking the file system (otherwise reads and writes lock the file themselves and there is no point, or there is only one process). Note that write-behind mode defeats the file system lock, as the write happens after it is released."""
+    with self.owner.file_lock(self):
+      if self.owner.single_proc or not self.owner.atomic:
+        yield None
+        return
+      
+      # Make sure the next read sees what the last writer left, which could be this process...
+      self.flush()
+      self.update = None
+      self.epoch = 0
+      if self.contents==None:
+        self.stat = None
+      
+      with LockFile(self.real_path(), None) as f:
+        yield f
   
   
   def modified(self):
@@ -220,24 +676,38 @@ class Node(Mapping):
     
     if data==None:
       # Special case directory creation...
-      if name in self.contents: return self.contents[name]
-      
-      ret = Node(self.owner, self, name)
-      self.contents[name] = ret
-      
-      os.makedirs(ret.real_path())
+      with self.owner.dir_lock(self):
+        if name in self.contents: return self.contents[name]
+        
+        ret = self.adopt(name)
+        self.changed()
+        
+        os.makedirs(ret.real_path())
+        self.owner.record('created', ret)
       
       return ret
     
-    if name in self.contents:
-      ret = self.contents[name]
+    ret = self.contents.get(name)
+    if ret!=None:
       if ret.isa()!=Node.FILE:
         raise TypeError('Can not write data into a directory')
+      ret.write(data)
+    
     else:
+      # Its a new file, so it has to be on disk before the directory is next listed, whatever the write mode - written before it is adopted so other threads never see it half made...
+      if self.owner.filetype_of(name)==None:
+        raise TypeError('File type does not have a registered file handler')
+      
       ret = Node(self.owner, self, name)
-      self.contents[name] = ret
-    
-    ret.write(data)
+      ret.state = Node.FILE
+      if self.owner.frozen:
+        data = ret.ftype.freeze(data)
+      ret.__store(data)
+      
+      with self.owner.dir_lock(self):
+        self.adopt(name, ret)
+        self.changed()
+      self.owner.record('created', ret)
     
     return ret
       
@@ -247,19 +717,27 @@ class Node(Mapping):
     if self.isa()!=Node.DIRECTORY:
       raise TypeError('Can only create files within directories')
     
-    if name in self.contents:
-      ret = self.contents[name]
+    ret = self.contents.get(name)
+    kind = 'modified' if ret!=None else 'created'
+    if ret!=None:
       if ret.isa()!=Node.FILE:
         raise TypeError('Cannot replace a directory with a file')
+      self.owner.pending.pop(id(ret), None)
+      budget.discard(ret)
       ret.update = None
       ret.contents = None
+      ret.stat = None
     else:
       ret = Node(self.owner, self, name)
-      self.contents[name] = ret
     
     fn = source.real_path() if isinstance(source, Node) else source
     
     shutil.copy2(fn, ret.real_path())
+    with self.owner.dir_lock(self):
+      if kind=='created':
+        self.adopt(name, ret)
+      self.changed()
+    self.owner.record(kind, ret)
     
     return ret
   
@@ -278,8 +756,11 @@ class Node(Mapping):
     if len(key)==0: return self
     
     if key[0] not in self.contents:
-      os.mkdir(os.path.join(self.real_path(), key[0]))
-      self.contents[key[0]] = Node(self.owner, self, key[0])
+      with self.owner.dir_lock(self):
+        if key[0] not in self.contents:
+          os.mkdir(os.path.join(self.real_path(), key[0]))
+          self.owner.record('created', self.adopt(key[0]))
+          self.changed()
     
     return self.contents[key[0]].create(key[1:])
   
@@ -289,53 +770,89 @@ class Node(Mapping):
     if self.isa()!=Node.FILE:
       raise TypeError('System cannot remove directories')
     
+    self.owner.pending.pop(id(self), None)
+    budget.discard(self)
     os.unlink(self.real_path())
+    self.owner.record('deleted', self)
     self.state = Node.DELETED
     
-    del self.parent.contents[self.name]
+    parent = self.parent
+    with self.owner.dir_lock(parent):
+      if parent.contents.get(self.name) is self:
+        contents = dict(parent.contents)
+        del contents[self.name]
+        parent.contents = contents if len(contents)!=0 else no_children
+        parent.changed()
 
   
-  def iterate(self, path = None):
-    """Iterates all items in this directory and subdirectories - should yield the same number of items that count outputs, ignoring the possibility that the state can change between calls. Will also yield itself; yields full paths, with the optional input the same as a call to path on this Node, but as a list - used internally to speed things up."""
-    t = self.isa()
-    
-    if t==Node.DELETED: return
-    
-    if path==None:
-      path = list(self.path())
-    yield tuple(path)
-    
-    if t==Node.FILE: return
-      
-    # t==Node.DIRECTORY
-    for name, child in self.contents.items():
-      for ret in child.iterate(path + [name]):
-        yield ret
+  def iterate(self):
+    """Iterates all items in this directory and subdirectories - should yield the same number of items that count outputs, ignoring the possibility that the state can change between calls. Will also yield itself; yields full paths."""
+    for path, node in self.__traverse(None, None, True):
+      yield path
   
   
-  def iterate_ext(self, ext, path = None, exclude = None):
+  def iterate_ext(self, ext, exclude = None):
     """Same as iterate, except it only returns files with the given extension - a little bit more efficient than filtering yourself. exclude is an optional regular expression - directories that match are not iterated into."""
-    t = self.isa()
+    for path, node in self.__traverse(ext, exclude.match if exclude!=None else None, False):
+      yield path
+
+
+  def walk(self, ext = None, exclude = ()):
+    """Iterates the files in this directory and its subdirectories, yielding (path, Node) pairs, where path is the tuple path() would return. ext optionally restricts it to files whose name ends with the given string, whilst exclude is a collection of names that are skipped without being iterated into - typically the directories that old versions of files are moved into. Much faster than iterating the paths and then looking each one up."""
+    return self.__traverse(ext, exclude.__contains__ if len(exclude)!=0 else None, False)
+  
+  
+  def collect(self, ext = None, exclude = ()):
+    """Same as walk, but returns a list of every (path, Node) pair in one go, for when they are all going to be used anyway."""
+    return list(self.walk(ext, exclude))
+  
+  
+  def __traverse(self, ext, skip, dirs):
+    """Does the work for iterate, iterate_ext and walk - yields (path, Node) for every file below this one whose name ends with ext (any file if ext is None), plus every directory, including this one, if dirs is True. skip is None or a function that is given the name of each child and returns True if it is to be skipped, including not iterating into it. Uses a stack of iterators over directory contents, plus a single list for the path that is added to and removed from as it goes, so the cost of each item does not grow with its depth, beyond making its path tuple. Loads everything that is not skipped in one pass first, so skipped directories are never listed."""
+    self.load(skip)
     
+    t = self.isa()
     if t==Node.DELETED: return
     
-    if path==None:
-      path = list(self.path())
-    
+    path = list(self.path())
     if t==Node.FILE:
-      if self.ext==None:
-        self.ext = self.name.endswith(ext)
-      if self.ext:
-        yield tuple(path)
+      if ext==None or self.name.endswith(ext):
+        yield (tuple(path), self)
       return
-      
+    
     # t==Node.DIRECTORY
-    for name, child in self.contents.items():
-      if (exclude==None or not exclude.match(name)) and child.contains_ext(ext):
-        for ret in child.iterate_ext(ext, path + [name]):
-          yield ret
-
-
+    if dirs:
+      yield (tuple(path), self)
+    
+    stack = [iter(self.contents.items())]
+    while len(stack)!=0:
+      for name, child in stack[-1]:
+        if skip!=None and skip(name): continue
+        
+        t = child.isa()
+        if t==Node.FILE:
+          if ext==None or name.endswith(ext):
+            path.append(name)
+            yield (tuple(path), child)
+            path.pop()
+        
+        elif t==Node.DIRECTORY:
+          if ext!=None and skip==None and not child.contains_ext(ext): continue # contains_ext would look inside skipped directories.
+          
+          path.append(name)
+          if dirs:
+            yield (tuple(path), child)
+          
+          stack.append(iter(child.contents.items()))
+          break
+      
+      else:
+        # Finished a directory - carry on with its parent...
+        stack.pop()
+        if len(stack)!=0:
+          path.pop()
+  
+  
   def count(self):
     """Returns the number of items in this Node plus all of its children nodes, counting itself - unlike len it does the entire hierarchy."""
     t = self.isa()
@@ -361,9 +878,7 @@ class Node(Mapping):
       return False
     
     if t==Node.FILE:
-      if self.ext==None:
-        self.ext = self.name.endswith(ext)
-      return self.ext
+      return self.name.endswith(ext)
     
     # t==Node.Directory
     if self.ext==None:
@@ -379,6 +894,46 @@ class Node(Mapping):
     return self.ext[ext]
 
 
+  def snapshot(self):
+    """Returns the cached state of this node and everything below it as json friendly lists, for FSDB.save_snapshot. Nothing touches the file system."""
+    if self.state==Node.DIRECTORY:
+      children = None
+      if self.contents!=None:
+        children = [child.snapshot() for child in self.contents.values()]
+      return [self.name, 'd', self.stat, children]
+    
+    if self.state==Node.FILE:
+      if self.contents!=None and self.ftype!=None and self.ftype.json_safe():
+        contents = self.contents
+        if self.owner.frozen:
+          contents = self.ftype.thaw(contents)
+        return [self.name, 'f', self.stat, contents]
+      return [self.name, 'f', self.stat]
+    
+    return [self.name, 'u']
+  
+  
+  def restore(self, snap):
+    """Reverses snapshot, filling in this (new) node and all of its children from what it returned. Everything is marked as needing to be validated, so it is checked against the file system, cheaply, before use."""
+    if snap[1]=='d':
+      self.state = Node.DIRECTORY
+      self.stat = tuple(snap[2]) if snap[2]!=None else None
+      if snap[3]!=None:
+        contents = dict()
+        for child_snap in snap[3]:
+          child = Node(self.owner, self, child_snap[0])
+          child.restore(child_snap)
+          contents[child.name] = child
+        self.contents = contents if len(contents)!=0 else no_children
+    
+    elif snap[1]=='f':
+      self.state = Node.FILE
+      self.stat = tuple(snap[2]) if snap[2]!=None else None
+      if len(snap)>3 and self.ftype!=None and self.stat!=None:
+        self.contents = self.ftype.freeze(snap[3]) if self.owner.frozen else snap[3]
+        budget.use(self, self.stat[1])
+
+
   def __contains__(self, key):
     if self.isa()!=Node.DIRECTORY:
       return False
@@ -409,16 +964,205 @@ class Node(Mapping):
 
 
 class FSDB(Mapping):
-  """Caches the state of the directory hierarchy its passed on initialisation, under the assumption that other proceses may change the structure. It does cache however, and only checks periodically, so out of date answers are possible for directory contents. For file contents the query is guaranteed to be millisecond recent as it checks time stamps. Caches the contents of files for which a handler is registered. Acts as a mapping type that accesses everything in the hierarchy via tuples of strings (!), with an empty tuple obtaining the root Node. Note that internally it uses directories prefixed with '.lock_' for file locks, so don't try and use nodes with that prefix as they will be hidden."""
-  def __init__(self, root, single_proc = False):
-    """Root is the root directory of the hierarchy to cache. single_proc can be set to False to stop it using lock files - this makes reading a hell of a lot faster, but is unsafe if their are multiple processes!"""
+  """Caches the state of the directory hierarchy its passed on initialisation, under the assumption that other proceses may change the structure. It does cache however, and only checks periodically, so out of date answers are possible for directory contents, unless watching is enabled and inotify is available. For file contents the query is guaranteed to be millisecond recent as it checks time stamps. Caches the contents of files for which a handler is registered. Acts as a mapping type that accesses everything in the hierarchy via tuples of strings (!), with an empty tuple obtaining the root Node. Note that internally it uses directories prefixed with '.lock_' for file locks and files prefixed with '.tmp_' for atomic writes, so don't try and use nodes with those prefixes as they will be hidden. Can be shared by the threads of a threaded server - directory contents are never edited, only replaced, so iterating is always safe, and listing and writing are protected by striped locks."""
+  def __init__(self, root, single_proc = False, watch = False, atomic = False, frozen = False):
+    """Root is the root directory of the hierarchy to cache. single_proc can be set to False to stop it using lock files - this makes reading a hell of a lot faster, but is unsafe if their are multiple processes! If watch is True it uses inotify to find out about directory changes as they happen rather than relisting directories every cache_time seconds; silently falls back to the timeout when inotify is unavailable or the hierarchy is on a network file system (where inotify does not see changes made by other machines). If atomic is True (and single_proc False) files are written to a temporary file that is renamed over the original, so readers never need a lock - every process using the hierarchy must agree on this, and read-modify-write sequences should be wrapped in Node.lock(). If frozen is True cached file contents are kept as read only views, made by the FileType's freeze method, so they can be handed to every caller, on every thread, without a defensive copy - Node.read_for_update() gets a copy to edit."""
     self.root = os.path.normpath(root)
     self.single_proc = single_proc
+    self.atomic = atomic
+    self.frozen = frozen
     self.cache_time = 30.0
+    self.trust_window = 0.0
+    
+    self.stat_calls = 0 # Number of stat calls made to validate file contents.
+    self.stat_saved = 0 # Number of times validating file contents was skipped, either because it was validated within the trust window or it was already known.
     
     self.types = dict() # Dictionary from extension to FileType object.
+    self.type_table = dict() # Dictionary from the last extension in a name ('.json') to a list of (extension, FileType), so a file's type is found with a lookup.
+    
+    self.write_behind = 0.0 # Interval between flushes of pending writes; 0 to write immediately.
+    self.pending = dict() # id(Node) -> Node, for files whose cached contents have not been written yet.
+    self.pending_since = 0.0 # When the oldest pending write was made.
+    self.writes = 0 # Number of files written to disk.
+    self.writes_coalesced = 0 # Number of writes that were never made, as a later write to the same file replaced them.
+    
+    self.seq = 0 # Sequence number of the last change in the journal.
+    self.journal = deque(maxlen=4096) # Recent changes, as (sequence number, kind, path) - see changes_since.
+    self.subscribers = [] # Functions to call with every change.
+    
+    self.version = 0 # Incremented whenever the cache changes.
+    self.snapshot_fn = None # Where to save snapshots by default.
+    self.snapshot_version = None # Version when last saved.
+    
+    self.polled = 0 # Epoch in which poll last ran.
+    
+    # Locks, for when it is used by several threads. Directory locks are striped - each directory uses the lock its id selects, so there is a fixed number however big the hierarchy - and held whilst a directory is listed or its contents swapped, never whilst taking another lock. File locks are made as needed, so unrelated files never wait for each other (Node.lock() can be nested), and held whilst a file is written or for the duration of Node.lock(). A thread may take a directory lock whilst holding a file lock, but never the other way around...
+    self.dir_locks = [threading.RLock() for _ in range(lock_stripes)]
+    self.file_locks = dict() # id(Node) -> [RLock, number of threads using it].
+    self.file_locks_lock = threading.Lock()
+    self.journal_lock = threading.Lock()
+    self.poll_lock = threading.Lock()
+    
+    self.watcher = None
+    self.watches = dict() # id(Node) -> inotify watch descriptor, for the directories being watched - the watcher holds a reference to each Node, so ids are not reused.
+    if watch and fs_db_inotify.supported(self.root):
+      try:
+        self.watcher = fs_db_inotify.Watcher(self.__dirty)
+      except OSError:
+        self.watcher = None
     
     self.node = Node(self, None, None)
+    instances[id(self)] = self
+  
+  
+  def dir_lock(self, node):
+    """Returns the lock that must be held to list the given directory Node or change its contents - reentrant."""
+    return self.dir_locks[(id(node) >> 4) % lock_stripes]
+  
+  
+  @contextlib.contextmanager
+  def file_lock(self, node):
+    """Returns a context manager that holds the lock of the given file Node, as done whilst it is written - reentrant. The lock only exists whilst a thread wants it."""
+    key = id(node)
+    with self.file_locks_lock:
+      entry = self.file_locks.get(key)
+      if entry==None:
+        entry = [threading.RLock(), 0]
+        self.file_locks[key] = entry
+      entry[1] += 1
+    
+    try:
+      with entry[0]:
+        yield
+    
+    finally:
+      with self.file_locks_lock:
+        entry[1] -= 1
+        if entry[1]==0:
+          del self.file_locks[key]
+  
+  
+  def __dirty(self, node, name):
+    """Callback for the watcher - marks a directory as needing to be relisted on next access."""
+    if name==None and self.watches.get(id(node)) not in self.watcher.watched:
+      self.watches.pop(id(node), None) # Watch has been dropped by the kernel - back to polling.
+    node.update = None
+  
+  
+  def watching(self):
+    """Returns True if directory changes are being detected with inotify, False if they are being polled."""
+    return self.watcher!=None
+  
+  
+  def poll(self):
+    """Processes any pending change notifications, so the cache reflects the file system, and flushes pending writes if the oldest has waited for the write-behind interval. Called automatically whenever the FSDB object is accessed (at most once per epoch), but not when a Node is, so if you hold onto a Node for a long time call this occasionally. If another thread is already polling it returns immediately, as that thread is doing the work."""
+    if not self.poll_lock.acquire(False):
+      return
+    
+    try:
+      if len(self.pending)!=0 and (time.time() - self.pending_since) >= self.write_behind:
+        self.flush()
+      
+      current = epoch_state.current
+      if current!=0:
+        if self.polled==current: return
+        self.polled = current
+      
+      if broadcast!=None:
+        broadcast.poll(apply_broadcast)
+      
+      watcher = self.watcher
+      if watcher!=None:
+        watcher.poll(hidden_prefixes)
+    
+    finally:
+      self.poll_lock.release()
+  
+  
+  def record(self, kind, node, seen = False):
+    """Adds a change to the journal, and tells the subscribers about it - kind is one of 'created', 'modified' or 'deleted'. Called by Node-s as they see changes; seen is True if the change was made by someone else, False if it was made through this FSDB, in which case other processes are told about it if broadcasting is enabled."""
+    path = node.path()
+    with self.journal_lock:
+      self.seq += 1
+      change = (self.seq, kind, path)
+      self.journal.append(change)
+    
+    if broadcast!=None and not seen:
+      mtime = node.stat[0] if kind=='modified' and node.stat!=None else None
+      broadcast.send(os.path.abspath(node.real_path()), kind, mtime)
+    
+    for callback in self.subscribers:
+      callback(*change)
+  
+  
+  def invalidate(self, key, kind, mtime = None):
+    """Applies a change made by another process, without touching the file system - if the directory containing the given path has been listed it is listed again on next access, and if the path is a cached file and mtime (nanoseconds) is None or differs from the cached version its cache is validated on next read, ignoring the epoch and trust window. kind is as for record. Called for changes heard from the broadcast."""
+    if len(key)==0: return
+    
+    node = self.node
+    for part in key[:-1]:
+      if node.state!=Node.DIRECTORY or node.contents==None: return
+      node = node.contents.get(part)
+      if node==None: return
+    
+    if node.state!=Node.DIRECTORY or node.contents==None: return
+    
+    if kind=='modified':
+      child = node.contents.get(key[-1])
+      if child!=None and (mtime==None or child.stat==None or child.stat[0]!=mtime):
+        child.update = None
+        child.epoch = 0
+    
+    else:
+      node.update = None
+      node.stat = None
+      node.epoch = 0
+  
+  
+  def sequence(self):
+    """Returns the sequence number of the most recent change, to pass to changes_since later."""
+    return self.seq
+  
+  
+  def changes_since(self, seq):
+    """Returns a list of the changes seen after the given sequence number, as (sequence number, kind, path) tuples in order, where kind is 'created', 'modified' or 'deleted' and path a tuple, as used for indexing. Returns None if the journal no longer goes back that far, in which case the caller has to rescan. Only changes the FSDB has seen are included - a directory has to be relisted or a file read for a change made by another process to appear. The first listing of a directory is not a change, and deleting a directory is reported as a single change, for the directory."""
+    with self.journal_lock:
+      if seq>=self.seq:
+        return []
+      
+      if len(self.journal)==0 or self.journal[0][0]>(seq+1):
+        return None
+      
+      return list(itertools.islice(self.journal, seq + 1 - self.journal[0][0], None))
+  
+  
+  def subscribe(self, callback):
+    """Registers a function to be called as callback(sequence number, kind, path) for every change, as it is seen - see changes_since for details. It is called by whichever thread saw the change, possibly with a directory lock held, so it should be quick and must not access the FSDB."""
+    self.subscribers.append(callback)
+  
+  
+  def unsubscribe(self, callback):
+    """Stops calling a function registered with subscribe."""
+    self.subscribers.remove(callback)
+  
+  
+  def flush(self):
+    """Writes every file that has a pending write, from write-behind mode. Must be called before the program exits, or the writes will be lost."""
+    for node in list(self.pending.values()):
+      node.flush()
+  
+  
+  def close(self):
+    """Releases the inotify instance, if any, and its share of the memory budget, flushing pending writes first - the FSDB remains usable, but falls back to polling directories. Call before dropping an FSDB."""
+    self.flush()
+    budget.release(self)
+    
+    if self.watcher!=None:
+      watcher = self.watcher
+      self.watcher = None
+      
+      self.watches = dict()
+      watcher.close()
   
   
   def get_cache_time(self):
@@ -430,21 +1174,131 @@ class FSDB(Mapping):
     self.cache_time = float(time)
   
   
+  def get_trust_window(self):
+    """Returns how long, in seconds, after a file has been validated its cached contents are trusted without checking again."""
+    return self.trust_window
+  
+  def set_trust_window(self, time):
+    """Sets the trust window, in floating point seconds - within this long of a file being validated its cached contents are returned without checking the file system. Defaults to 0, so files are always checked. A long window risks returning stale data when other processes edit files."""
+    self.trust_window = float(time)
+  
+  
+  def get_write_behind(self):
+    """Returns the write-behind interval, in seconds - 0 if writes go straight to disk."""
+    return self.write_behind
+  
+  def set_write_behind(self, time):
+    """Sets the write-behind interval, in floating point seconds. When positive writes only update the cache, with the files written once the oldest pending write is this old (checked when the FSDB is accessed) or flush is called, so repeated writes to a file cost one. Only safe for files no other process writes. Defaults to 0, for writing immediately."""
+    self.write_behind = float(time)
+    if self.write_behind<=0.0:
+      self.flush()
+  
+  
+  def stats(self):
+    """Returns a dictionary of statistics about the cache, for tuning - 'stat_calls' is how many times files have been stat-ed to validate their contents, 'stat_saved' how many times doing so was skipped, 'writes' how many files were written and 'writes_coalesced' how many writes were skipped in write-behind mode as the file was written again before being flushed. The counts are not locked, so can undercount a little when several threads are busy."""
+    return {'stat_calls' : self.stat_calls, 'stat_saved' : self.stat_saved, 'writes' : self.writes, 'writes_coalesced' : self.writes_coalesced}
+  
+  
   def register(self, ft):
     """Allows you to register a filetype with the State object, enabling the read and write methods for that filetype."""
-    self.types[ft.extension()] = ft
+    ext = ft.extension()
+    self.types[ext] = ft
+    self.type_table.setdefault(ext[ext.rfind('.'):], []).append((ext, ft))
+  
+  
+  def filetype_of(self, name):
+    """Returns the registered FileType that a file with the given name has, or None if there is not one."""
+    dot = name.rfind('.')
+    if dot<0: return None
+    
+    for ext, ft in self.type_table.get(name[dot:], ()):
+      if name.endswith(ext):
+        return ft
+    
+    return None
 
 
+  def load_snapshot(self, fn):
+    """Loads a snapshot previously saved by save_snapshot, so a restarted server does not have to reread every file. The snapshot is not trusted - directories are checked against their mtime before use and files against their mtime before their cached contents are returned, so it can be arbitrarily out of date. Must be called before the FSDB is used, after all file types have been registered. Remembers fn as the default for save_snapshot. Returns True on success, False if the snapshot was missing, damaged or for a different directory (the FSDB is then unchanged)."""
+    self.snapshot_fn = fn
+    
+    try:
+      with open(fn, 'r') as f:
+        snap = json.load(f)
+    except (OSError, ValueError):
+      return False
+    
+    if not isinstance(snap, dict) or snap.get('version')!=2 or snap.get('root')!=self.root or snap.get('types')!=sorted(self.types.keys()):
+      return False
+    
+    node = Node(self, None, None)
+    try:
+      node.restore(snap['node'])
+    except (TypeError, IndexError, KeyError):
+      return False
+    
+    self.node = node
+    self.snapshot_version = self.version
+    return True
+  
+  
+  def save_snapshot(self, fn = None):
+    """Saves a snapshot of the cached state - directory structure, mtimes and sizes, plus the contents of files where the file type allows - that can be loaded by load_snapshot to get a restarted server running fast. fn defaults to the file given to load_snapshot. Does nothing if nothing has changed since the last save or load. The file is written to a temporary file which is then renamed, so a reader never sees a partial snapshot. Pending writes are flushed first, as cached contents have to match the file they are recorded against."""
+    default = fn==None
+    if default:
+      fn = self.snapshot_fn
+      if fn==None: return
+    
+    self.flush()
+    
+    if default and self.snapshot_version==self.version:
+      return
+    
+    version = self.version
+    snap = {'version' : 2, 'root' : self.root, 'types' : sorted(self.types.keys()), 'node' : self.node.snapshot()}
+    
+    directory = os.path.dirname(fn)
+    if directory!='' and not os.path.exists(directory):
+      os.makedirs(directory)
+    
+    temp = '%s.%i.tmp' % (fn, os.getpid())
+    with open(temp, 'w') as f:
+      json.dump(snap, f, separators=(',', ':'))
+    os.replace(temp, fn)
+    
+    self.snapshot_version = version
+  
+  
+  def load(self):
+    """Loads the entire hierarchy in a single pass, including the mtime and size of every file - see Node.load. Happens automatically on first iteration, but can be called earlier to get the work done up front."""
+    self.poll()
+    self.node.load()
+  
+  
   def get_root(self):
     """Returns the root Node object, that is the start of the hierarchy."""
+    self.poll()
     return self.node
     
   
+  def walk(self, ext = None, exclude = ()):
+    """Iterates the files in the hierarchy as (path, Node) pairs - see Node.walk for details of the optional filters."""
+    self.poll()
+    return self.node.walk(ext, exclude)
+  
+  
+  def collect(self, ext = None, exclude = ()):
+    """Returns a list of every file in the hierarchy, as (path, Node) pairs - see Node.walk for details of the optional filters."""
+    self.poll()
+    return self.node.collect(ext, exclude)
+  
+  
   def __contains__(self, key):
     """Returns True if the given exists in the directory structure, False if it does not."""
     if isinstance(key, str):
       key = (key,)
     
+    self.poll()
     targ = self.node
     for part in key:
       targ.isa() # Makes sure its up to date.
@@ -459,6 +1313,7 @@ class FSDB(Mapping):
     if isinstance(key, str):
       key = (key,)
     
+    self.poll()
     targ = self.node
     for part in key:
       targ.isa() # Makes sure its upto date.
@@ -469,10 +1324,12 @@ class FSDB(Mapping):
 
   def __iter__(self):
     """Iterates everything - every entity in the hierarchy."""
+    self.load()
     for node in self.node.iterate():
       yield node
 
 
   def __len__(self):
     """Returns how many items will be iterated by iter... ignoring the temporal aspect where it could actually change half way through iterating! In other words, don't make that assumption."""
+    self.load()
     return self.node.count()
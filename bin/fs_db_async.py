@@ -0,0 +1,164 @@
+# Copyright 2014 Tom SF Haines
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+import concurrent.futures
+
+
+
+class AsyncFSDB:
+  """Wraps an FSDB for use from asyncio, so an event loop never waits on the file system - every call that could touch it runs in a pool of threads (the FSDB is thread safe) and is awaited. Calls that only read, such as getting a Node or reading a file, are coalesced - if the same one is already in progress the caller waits for its result rather than starting another, so a burst of requests for a file that is not cached loads it once. Must only be used from one event loop."""
+  def __init__(self, db, workers = 4):
+    """db is the FSDB to wrap; workers the number of threads in the pool, which bounds how many file system calls run at once."""
+    self.db = db
+    self.executor = concurrent.futures.ThreadPoolExecutor(workers, 'fsdb')
+    self.inflight = dict() # Key of a coalesced call -> its future.
+
+    self.calls = 0 # Number of calls sent to the pool.
+    self.coalesced = 0 # Number of calls that waited for an identical call already in progress instead.
+
+
+  def close(self):
+    """Shuts down the thread pool, after waiting for any calls in progress."""
+    self.executor.shutdown()
+
+
+  async def run(self, key, func, *args):
+    """Runs func(*args) in the thread pool and returns what it returns, or raises what it raises. If key is not None and a call with the same key is in progress waits for that instead - only use a key for calls that have no side effects. Cancelling the caller does not cancel the call, as others could be waiting for it."""
+    fut = self.inflight.get(key) if key!=None else None
+
+    if fut!=None:
+      self.coalesced += 1
+
+    else:
+      self.calls += 1
+      fut = asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+      if key!=None:
+        self.inflight[key] = fut
+
+        def done(f):
+          if self.inflight.get(key) is f:
+            del self.inflight[key]
+        fut.add_done_callback(done)
+
+    return await asyncio.shield(fut)
+
+
+  async def call(self, func, *args):
+    """Runs any function in the thread pool, never coalesced - for read-modify-write, which should be done as one function that uses Node.lock(), as the lock can't be held across awaits."""
+    return await self.run(None, func, *args)
+
+
+  async def get(self, key):
+    """Returns the AsyncNode for the given key, as FSDB.__getitem__ would - raises KeyError if it does not exist."""
+    key = (key,) if isinstance(key, str) else tuple(key)
+    node = await self.run(('get', key), self.db.__getitem__, key)
+    return AsyncNode(self, node)
+
+
+  async def contains(self, key):
+    """Returns True if the given key exists, as FSDB.__contains__."""
+    key = (key,) if isinstance(key, str) else tuple(key)
+    return await self.run(('contains', key), self.db.__contains__, key)
+
+
+  async def load(self):
+    """Loads the entire hierarchy - see FSDB.load."""
+    await self.run(('load',), self.db.load)
+
+
+  async def poll(self):
+    """Processes changes seen by the watcher and other processes - see FSDB.poll."""
+    await self.run(('poll',), self.db.poll)
+
+
+  async def flush(self):
+    """Writes any pending writes - see FSDB.flush."""
+    await self.run(None, self.db.flush)
+
+
+  def get_root(self):
+    """Returns the AsyncNode of the root directory - no file system access, so not awaited."""
+    return AsyncNode(self, self.db.get_root())
+
+
+  def walk(self, ext = None, exclude = ()):
+    """Asynchronous iterator of (path, AsyncNode) over the files of the hierarchy - see Node.walk for the filters."""
+    return self.get_root().walk(ext, exclude)
+
+
+
+class AsyncNode:
+  """Wraps a Node for AsyncFSDB - methods that might touch the file system are awaited, whilst those that don't are passed straight through. The wrapped Node is available as node, for passing to code that runs in the thread pool."""
+  __slots__ = ['owner', 'node']
+
+  def __init__(self, owner, node):
+    self.owner = owner
+    self.node = node
+
+
+  @property
+  def name(self):
+    return self.node.name
+
+
+  def path(self):
+    return self.node.path()
+
+
+  def real_path(self):
+    return self.node.real_path()
+
+
+  async def isa(self):
+    """Returns what it is - Node.FILE, Node.DIRECTORY or Node.DELETED."""
+    return await self.owner.run(('isa', id(self.node)), self.node.isa)
+
+
+  async def read(self):
+    """Returns the contents of the file - see Node.read, including that they must not be edited."""
+    return await self.owner.run(('read', id(self.node)), self.node.read)
+
+
+  async def read_for_update(self):
+    """Returns a copy of the contents of the file that can be edited - see Node.read_for_update."""
+    return await self.owner.run(None, self.node.read_for_update)
+
+
+  async def write(self, data, sync = False):
+    """Writes the file - see Node.write. A read that started before the write is not reused by reads made once it has started, or after it has finished, so they never get the contents from before it."""
+    key = ('read', id(self.node))
+    self.owner.inflight.pop(key, None)
+    await self.owner.run(None, self.node.write, data, sync)
+    self.owner.inflight.pop(key, None) # A read made during the write could have loaded the old contents.
+
+
+  async def keys(self):
+    """Returns a list of the names of the children of this directory."""
+    return await self.owner.run(('keys', id(self.node)), lambda: list(self.node.keys()))
+
+
+  async def get(self, name):
+    """Returns the AsyncNode of the child with the given name, raising KeyError if there is no such child."""
+    node = await self.owner.run(('child', id(self.node), name), self.node.__getitem__, name)
+    return AsyncNode(self.owner, node)
+
+
+  async def walk(self, ext = None, exclude = ()):
+    """Asynchronous iterator of (path, AsyncNode) over the files in this directory and its subdirectories - see Node.walk for the filters. The whole traversal is done in one go in the thread pool, with Node.collect, so it costs one trip rather than one per file."""
+    key = ('walk', id(self.node), ext, tuple(sorted(exclude)))
+    for path, node in await self.owner.run(key, self.node.collect, ext, exclude):
+      yield (path, AsyncNode(self.owner, node))
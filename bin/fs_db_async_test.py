@@ -0,0 +1,130 @@
+#! /usr/bin/env python3
+# Copyright 2014 Tom SF Haines
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import os.path
+import time
+import json
+import asyncio
+
+import unittest
+import tempfile
+
+from . import fs_db
+from . import fs_db_json
+from . import fs_db_async
+
+
+
+class SlowJsonFileType(fs_db_json.JsonFileType):
+  """Json file type that takes a while to read, and counts how many times it has, to check that reads are coalesced."""
+  def __init__(self):
+    super().__init__()
+    self.reads = 0
+  
+  def read(self, f):
+    self.reads += 1
+    time.sleep(0.05)
+    return super().read(f)
+
+
+
+class TestAsyncFSDB(unittest.TestCase):
+  """Tests the asyncio facade of the FSDB."""
+  def setUp(self):
+    self.temp_dir = tempfile.TemporaryDirectory()
+    self.root = self.temp_dir.name
+    
+    os.mkdir(os.path.join(self.root, 'penguins'))
+    with open(os.path.join(self.root, 'penguins', 'eat.json'), 'w') as f:
+      json.dump({'food' : 'fish'}, f)
+    with open(os.path.join(self.root, 'swan.json'), 'w') as f:
+      json.dump({'name' : 'Percy'}, f)
+    
+    self.ftype = SlowJsonFileType()
+    self.db = fs_db.FSDB(self.root)
+    self.db.register(self.ftype)
+    self.adb = fs_db_async.AsyncFSDB(self.db)
+  
+  
+  def tearDown(self):
+    self.adb.close()
+    self.temp_dir.cleanup()
+  
+  
+  def test_read(self):
+    """Checks getting, reading and writing files, and that a missing file raises KeyError."""
+    async def run():
+      node = await self.adb.get(('penguins', 'eat.json'))
+      self.assertTrue(node.path()==('penguins', 'eat.json'))
+      self.assertTrue(await node.isa()==fs_db.Node.FILE)
+      self.assertTrue((await node.read())['food']=='fish')
+      
+      data = await node.read_for_update()
+      data['food'] = 'squid'
+      await node.write(data)
+      self.assertTrue((await node.read())['food']=='squid')
+      
+      self.assertTrue(await self.adb.contains('swan.json'))
+      self.assertFalse(await self.adb.contains('goose.json'))
+      with self.assertRaises(KeyError):
+        await self.adb.get('goose.json')
+      
+      penguins = await self.adb.get_root().get('penguins')
+      self.assertTrue(await penguins.keys()==['eat.json'])
+    
+    asyncio.run(run())
+    self.assertTrue(self.db['penguins', 'eat.json'].read()['food']=='squid')
+  
+  
+  def test_walk(self):
+    """Checks async iteration of the files."""
+    async def run():
+      return [(path, await node.read()) async for path, node in self.adb.walk('.json')]
+    
+    files = dict(asyncio.run(run()))
+    self.assertTrue(files=={('swan.json',) : {'name' : 'Percy'}, ('penguins', 'eat.json') : {'food' : 'fish'}})
+  
+  
+  def test_coalesce(self):
+    """Checks that concurrent reads of the same file load it once."""
+    async def run():
+      node = await self.adb.get('swan.json')
+      return await asyncio.gather(*[node.read() for _ in range(8)])
+    
+    results = asyncio.run(run())
+    self.assertTrue(all(r is results[0] for r in results))
+    self.assertTrue(self.ftype.reads==1)
+    self.assertTrue(self.adb.coalesced==7)
+  
+  
+  def test_write_during_read(self):
+    """Checks that a read made whilst a write is in progress does not reuse a read that started before it."""
+    async def run():
+      node = await self.adb.get('swan.json')
+      before = asyncio.ensure_future(node.read())
+      await asyncio.sleep(0.01)
+      
+      write = asyncio.ensure_future(node.write({'name' : 'Pete'}))
+      await asyncio.sleep(0)
+      during = node.read()
+      
+      await asyncio.gather(before, write, during)
+      return await node.read()
+    
+    self.assertTrue(asyncio.run(run())['name']=='Pete')
+    self.assertTrue(self.adb.coalesced==0)
+
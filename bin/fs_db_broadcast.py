@@ -0,0 +1,136 @@
+# Copyright 2014 Tom SF Haines
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import os.path
+import time
+import json
+import socket
+
+
+
+# How often the list of other processes is rebuilt, in seconds - processes that have gone are also dropped as soon as a send to them fails...
+peer_refresh = 1.0
+
+# Largest message that will be received - a path plus a little...
+max_message = 64 * 1024
+
+
+
+class Broadcast:
+  """Tells the other processes that share a directory about changes to the file system, and hears about theirs, using Unix datagram sockets. Each process binds a socket in the directory, named after its pid; sending goes to every other socket found there. Non-blocking and lossy - if a process is not keeping up messages to it are dropped, so it has to fall back to noticing changes by other means. Messages are (path, kind, mtime_ns), with path absolute, kind as used by the FSDB journal and mtime_ns that of the file after the change, or None if not known."""
+  def __init__(self, directory, name = None):
+    """directory is where the sockets of every process live; name is that of the socket of this process, which defaults to its pid."""
+    if not os.path.exists(directory):
+      os.makedirs(directory)
+
+    self.directory = directory
+    self.name = (name if name!=None else str(os.getpid())) + '.sock'
+    self.path = os.path.join(directory, self.name)
+
+    # A socket left behind by a dead process with the same pid...
+    try:
+      os.unlink(self.path)
+    except FileNotFoundError:
+      pass
+
+    self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    self.sock.bind(self.path)
+    self.sock.setblocking(False)
+
+    self.peers = [] # Paths of the sockets of the other processes.
+    self.peers_time = 0.0 # When peers was last built.
+
+    self.sent = 0 # Number of messages sent, counting each process it went to.
+    self.received = 0 # Number of messages received.
+    self.dropped = 0 # Number of messages that could not be sent, as the receiver was not keeping up.
+
+
+  def __del__(self):
+    self.close()
+
+
+  def close(self):
+    """Closes the socket, and removes it from the directory so other processes stop sending to it."""
+    if getattr(self, 'sock', None)!=None:
+      self.sock.close()
+      self.sock = None
+
+      try:
+        os.unlink(self.path)
+      except OSError:
+        pass
+
+
+  def peer_list(self):
+    """Returns the paths of the sockets of the other processes, rebuilding the list if it is old."""
+    now = time.time()
+    if (now - self.peers_time) > peer_refresh:
+      try:
+        self.peers = [os.path.join(self.directory, fn) for fn in os.listdir(self.directory) if fn.endswith('.sock') and fn!=self.name]
+      except OSError:
+        self.peers = []
+      self.peers_time = now
+
+    return self.peers
+
+
+  def send(self, path, kind, mtime = None):
+    """Sends a change to every other process."""
+    if self.sock==None: return
+    msg = json.dumps([path, kind, mtime]).encode('utf8')
+
+    for peer in list(self.peer_list()):
+      try:
+        self.sock.sendto(msg, peer)
+        self.sent += 1
+
+      except (ConnectionRefusedError, FileNotFoundError) as e:
+        # The process has gone - forget it, and clean up after it if it crashed...
+        if peer in self.peers:
+          self.peers.remove(peer)
+        if isinstance(e, ConnectionRefusedError):
+          try:
+            os.unlink(peer)
+          except OSError:
+            pass
+
+      except OSError:
+        self.dropped += 1
+
+
+  def poll(self, callback):
+    """Processes every message waiting, calling callback(path, kind, mtime) for each, and returns how many there were."""
+    if self.sock==None: return 0
+    count = 0
+
+    while True:
+      try:
+        data = self.sock.recv(max_message)
+      except BlockingIOError:
+        break
+      except InterruptedError:
+        continue
+
+      try:
+        path, kind, mtime = json.loads(data.decode('utf8'))
+      except (ValueError, UnicodeDecodeError):
+        continue
+
+      count += 1
+      callback(path, kind, mtime)
+
+    self.received += count
+    return count
@@ -0,0 +1,219 @@
+# Copyright 2014 Tom SF Haines
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import os.path
+import errno
+import struct
+
+import ctypes
+import ctypes.util
+
+
+
+# Constants from sys/inotify.h...
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+
+IN_CLOEXEC = 0o2000000
+IN_NONBLOCK = 0o4000
+
+dir_mask = IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR
+
+event_head = struct.Struct('iIII')
+
+
+
+# File systems on which inotify only reports changes made by this machine, which makes it useless for invalidation...
+remote_filesystems = {'nfs', 'nfs4', 'cifs', 'smbfs', 'smb3', 'ncpfs', 'afs', 'ceph', 'glusterfs', 'lustre', 'gpfs', '9p', 'fuse.sshfs', 'fuse.glusterfs', 'fuse.s3fs'}
+
+
+
+# Load libc lazily, as only Linux has inotify - libc stays None if unavailable...
+libc = None
+libc_tried = False
+
+def get_libc():
+  """Returns the ctypes handle to libc with the inotify functions configured, or None if they are not available on this platform."""
+  global libc, libc_tried
+
+  if not libc_tried:
+    libc_tried = True
+    try:
+      lib = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+
+      lib.inotify_init1.argtypes = [ctypes.c_int]
+      lib.inotify_init1.restype = ctypes.c_int
+      lib.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+      lib.inotify_add_watch.restype = ctypes.c_int
+      lib.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+      lib.inotify_rm_watch.restype = ctypes.c_int
+
+      libc = lib
+    except (OSError, AttributeError):
+      libc = None
+
+  return libc
+
+
+
+def filesystem(path):
+  """Returns the type of the file system the given path is stored on, as a string such as 'ext4' or 'nfs4', or None if it can not be determined (Reads /proc/self/mounts, so Linux only)."""
+  path = os.path.realpath(path)
+
+  best = None
+  best_type = None
+  try:
+    with open('/proc/self/mounts', 'r') as f:
+      for line in f:
+        parts = line.split()
+        if len(parts)<3: continue
+
+        mount = parts[1].replace('\\040', ' ')
+        if path==mount or path.startswith(mount.rstrip('/') + '/'):
+          if best==None or len(mount)>=len(best):
+            best = mount
+            best_type = parts[2]
+
+  except OSError:
+    return None
+
+  return best_type
+
+
+
+def supported(path):
+  """Returns True if inotify can be trusted to report all changes below the given path - requires Linux and a local file system."""
+  if get_libc()==None:
+    return False
+
+  fs = filesystem(path)
+  if fs==None or fs in remote_filesystems:
+    return False
+
+  return True
+
+
+
+class Watcher:
+  """Wraps a single inotify instance that watches directories. Each watched directory is associated with an object, which is passed to the callback when the directory changes. Non-blocking - call poll() to process pending events."""
+  def __init__(self, callback):
+    """callback is called as callback(obj, name) when the directory of obj changes, with name the child that changed. It is called as callback(obj, None) when the directory itself has gone or if events have been lost, in which case all watched objects are reported."""
+    lib = get_libc()
+    if lib==None:
+      raise OSError(errno.ENOSYS, 'inotify not available')
+
+    self.fd = lib.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+    if self.fd<0:
+      err = ctypes.get_errno()
+      raise OSError(err, os.strerror(err))
+
+    self.callback = callback
+    self.watched = dict() # Watch descriptor to object.
+
+
+  def __del__(self):
+    self.close()
+
+
+  def close(self):
+    """Closes the inotify instance, dropping all watches."""
+    if getattr(self, 'fd', -1)>=0:
+      os.close(self.fd)
+      self.fd = -1
+      self.watched = dict()
+
+
+  def add(self, path, obj):
+    """Starts watching the given directory, returning the watch descriptor, or None if it could not be watched (e.g. the user limit on watches was reached), in which case the caller should fall back to polling."""
+    if self.fd<0: return None
+
+    wd = libc.inotify_add_watch(self.fd, os.fsencode(path), dir_mask)
+    if wd<0:
+      return None
+
+    self.watched[wd] = obj
+    return wd
+
+
+  def remove(self, wd):
+    """Stops watching the directory with the given watch descriptor."""
+    if wd in self.watched:
+      del self.watched[wd]
+      if self.fd>=0:
+        libc.inotify_rm_watch(self.fd, wd)
+
+
+  def __len__(self):
+    return len(self.watched)
+
+
+  def poll(self, ignore = ()):
+    """Processes all events waiting in the queue, calling the callback as required, and returns how many events were handled. ignore is a tuple of name prefixes that should not count as changes - used to hide lock directories."""
+    if self.fd<0: return 0
+    count = 0
+
+    while True:
+      try:
+        data = os.read(self.fd, 64 * 1024)
+      except BlockingIOError:
+        break
+      except InterruptedError:
+        continue
+
+      offset = 0
+      while offset<len(data):
+        wd, mask, cookie, length = event_head.unpack_from(data, offset)
+        offset += event_head.size
+        name = data[offset:offset+length].rstrip(b'\0')
+        offset += length
+        count += 1
+
+        if mask & IN_Q_OVERFLOW:
+          # Events have been lost - everything has to be assumed to have changed...
+          for obj in list(self.watched.values()):
+            self.callback(obj, None)
+          continue
+
+        obj = self.watched.get(wd)
+        if obj==None: continue
+
+        if mask & IN_IGNORED:
+          # Kernel has dropped the watch, because the directory has gone...
+          del self.watched[wd]
+          self.callback(obj, None)
+          continue
+
+        if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+          self.callback(obj, None)
+          continue
+
+        name = os.fsdecode(name)
+        if not name.startswith(ignore):
+          self.callback(obj, name)
+
+    return count
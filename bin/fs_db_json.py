@@ -13,22 +13,132 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import os
+import os.path
+import sys
+import time
 import json
+import random
+import struct
+import marshal
+import hashlib
+from types import MappingProxyType
 
 from .fs_db import FileType
 
 
 
+# Header of a file in the parsed cache - magic, Python version (as marshal's format can change between versions), then the mtime_ns, size and inode of the .json file it was parsed from...
+cache_header = struct.Struct('<4sIqqq')
+cache_magic = b'RFJM'
+
+
+
+def freeze(data):
+  """Returns a read only view of parsed json - dictionaries become mapping proxies and lists tuples, all the way down. Mapping proxies are assumed to already be frozen, so freezing something twice is cheap."""
+  if isinstance(data, dict):
+    return MappingProxyType({key : freeze(value) for key, value in data.items()})
+  if isinstance(data, (list, tuple)):
+    return tuple(freeze(value) for value in data)
+  return data
+
+
+def thaw(data):
+  """Reverses freeze, returning a copy made of dictionaries and lists that can be edited. Works on unfrozen json too, as a deep copy."""
+  if isinstance(data, (dict, MappingProxyType)):
+    return {key : thaw(value) for key, value in data.items()}
+  if isinstance(data, (list, tuple)):
+    return [thaw(value) for value in data]
+  return data
+
+
+def frozen_default(obj):
+  """For the default parameter of json.dump, so frozen json can be written out."""
+  if isinstance(obj, MappingProxyType):
+    return dict(obj)
+  raise TypeError('%s is not JSON serializable' % type(obj).__name__)
+
+
+
 class JsonFileType(FileType):
-  """Allows the FSDB system to access json file via the standard Python json reader/writer. Returns None on getting a dud file - user has to decide what to do with that."""
+  """Allows the FSDB system to access json file via the standard Python json reader/writer. Returns None on getting a dud file - user has to decide what to do with that. Can optionally keep a cache of parsed files, in marshal format, which is much faster to load than json for big files, such as render jobs."""
+  def __init__(self, cache_dir = None, cache_min = 16 * 1024):
+    """cache_dir is a directory in which to keep the parsed cache, or None, the default, to not have one. Only files of at least cache_min bytes are cached, as for small files opening the cache costs more than parsing. The cache is checked against the mtime, size and inode of the file, so it can never return stale data and can be deleted at any time."""
+    self.cache_dir = cache_dir
+    self.cache_min = cache_min
+    self.cache_hits = 0 # Number of reads that came from the cache.
+    self.cache_misses = 0 # Number of reads of files big enough to be cached that had to be parsed.
+  
   def extension(self):
     return '.json'
   
   def read(self, f):
+    if self.cache_dir==None or not isinstance(getattr(f, 'name', None), str):
+      return self.parse(f)
+    
+    st = os.fstat(f.fileno())
+    if st.st_size<self.cache_min:
+      return self.parse(f)
+    
+    head = cache_header.pack(cache_magic, sys.hexversion, st.st_mtime_ns, st.st_size, st.st_ino)
+    fn = self.cache_path(f.name)
+    
+    try:
+      with open(fn, 'rb') as cf:
+        data = cf.read()
+      if data.startswith(head):
+        ret = marshal.loads(data[cache_header.size:])
+        self.cache_hits += 1
+        return ret
+    except (OSError, ValueError, EOFError, TypeError):
+      pass
+    
+    # Parse it, and cache the result, unless the file was modified too recently for its mtime to be trusted (it could change again without the mtime changing)...
+    self.cache_misses += 1
+    ret = self.parse(f)
+    if ret!=None and st.st_mtime_ns < (time.time() - 2.0) * 1e9:
+      self.store(fn, head, ret)
+    return ret
+  
+  def write(self, f, data):
+    json.dump(data, f, default=frozen_default)
+  
+  def json_safe(self):
+    return True
+  
+  def freeze(self, data):
+    return freeze(data)
+  
+  def thaw(self, data):
+    return thaw(data)
+  
+  def parse(self, f):
+    """Parses the file, returning None if its not valid json."""
     try:
       return json.load(f)
     except ValueError:
       return None
   
-  def write(self, f, data):
-    json.dump(data, f)
+  def cache_path(self, path):
+    """Returns the filename of the cached version of the given file."""
+    key = hashlib.sha1(os.path.abspath(path).encode('utf8')).hexdigest()
+    return os.path.join(self.cache_dir, key[:2], key + '.marshal')
+  
+  def store(self, fn, head, data):
+    """Writes data to the cache file fn, via a temporary file so a reader never sees half of it. Failure is silent, as the cache is only an optimisation."""
+    temp = '%s.%08x.tmp' % (fn, random.getrandbits(32))
+    try:
+      directory = os.path.dirname(fn)
+      if not os.path.exists(directory):
+        os.makedirs(directory, exist_ok=True)
+      
+      with open(temp, 'wb') as cf:
+        cf.write(head)
+        marshal.dump(data, cf)
+      os.replace(temp, fn)
+    
+    except (OSError, ValueError):
+      try:
+        os.remove(temp)
+      except OSError:
+        pass
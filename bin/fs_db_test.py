@@ -17,12 +17,17 @@
 import os
 import os.path
 import time
+import re
+import json
+import operator
 
 import unittest
 import tempfile
+import threading
 
 from . import fs_db
 from . import fs_db_json
+from . import fs_db_broadcast
 
 
 
@@ -116,6 +121,82 @@ class TestFSDB(unittest.TestCase):
     del s
     
   
+  def test_walk(self):
+    """Checks that walk yields the right paths and nodes, filtering and pruning as requested."""
+    os.mkdir(os.path.join(self.root, 'penguins/old'))
+    open(os.path.join(self.root, 'penguins/old/fly.txt'), 'w').close()
+    open(os.path.join(self.root, 'penguins/dance.json'), 'w').close()
+    
+    s = fs_db.FSDB(self.root)
+    
+    paths = []
+    for path, node in s.walk():
+      self.assertTrue(path==node.path())
+      paths.append(path)
+    expected = {('cabbage.txt',), ('turnip.txt',), ('penguins', 'fly.txt'), ('penguins', 'old', 'fly.txt'), ('penguins', 'dance.json')}
+    self.assertTrue(set(paths)==expected)
+    
+    paths = set(path for path, node in s.walk('.txt', ('old',)))
+    expected = {('cabbage.txt',), ('turnip.txt',), ('penguins', 'fly.txt')}
+    self.assertTrue(paths==expected)
+    
+    paths = set(path for path, node in s['penguins'].walk('.json'))
+    self.assertTrue(paths=={('penguins', 'dance.json')})
+    
+    pairs = s.collect('.txt', ('old',))
+    self.assertTrue(pairs==list(s.walk('.txt', ('old',))))
+    self.assertTrue(all(s[path] is node for path, node in pairs))
+    
+    paths = set(s['penguins'].iterate_ext('.txt', re.compile('old')))
+    self.assertTrue(paths=={('penguins', 'fly.txt')})
+    
+    del s
+  
+  
+  def test_walk_prune(self):
+    """Checks that walk never lists the directories it is told to exclude, however deep they are."""
+    os.makedirs(os.path.join(self.root, 'penguins/old/deep'))
+    open(os.path.join(self.root, 'penguins/old/deep/fly.txt'), 'w').close()
+    
+    listed = []
+    scandir = os.scandir
+    def counting_scandir(path):
+      listed.append(os.path.relpath(path, self.root))
+      return scandir(path)
+    
+    s = fs_db.FSDB(self.root)
+    os.scandir = counting_scandir
+    try:
+      for ext in ('.txt', None):
+        paths = set(path for path, node in s.walk(ext, ('old',)))
+        self.assertTrue(paths=={('cabbage.txt',), ('turnip.txt',), ('penguins', 'fly.txt')})
+    finally:
+      os.scandir = scandir
+    
+    self.assertTrue(len(listed)!=0)
+    self.assertFalse(any('old' in path.split(os.sep) for path in listed))
+    
+    del s
+  
+  
+  def test_deep(self):
+    """Checks traversal of a deep hierarchy, which is done without recursion."""
+    path = self.root
+    for _ in range(200):
+      path = os.path.join(path, 'd')
+      os.mkdir(path)
+    open(os.path.join(path, 'abyss.txt'), 'w').close()
+    
+    s = fs_db.FSDB(self.root)
+    
+    pairs = s.collect('.txt')
+    self.assertTrue(len(pairs)==4)
+    self.assertTrue(('d',) * 200 + ('abyss.txt',) in set(path for path, node in pairs))
+    self.assertTrue(len(list(s.get_root().iterate()))==206)
+    
+    del s
+  
+  
   def test_node_isa(self):
     """Tests the is-a method of the Node object."""
     s = fs_db.FSDB(self.root)
@@ -235,6 +316,69 @@ class TestFSDB(unittest.TestCase):
     self.assertFalse('snails.txt' in s[()])
     
     del s
+  
+  
+  def test_load(self):
+    """Checks that loading the hierarchy in one pass fills in the type of everything, and the mtime and size of every file that can be read."""
+    with open(os.path.join(self.root, 'penguins/fly.txt'), 'w') as f:
+      f.write('flap')
+    
+    class TextFileType(fs_db.FileType):
+      def extension(self):
+        return '.txt'
+    
+    s = fs_db.FSDB(self.root)
+    s.register(TextFileType())
+    s.load()
+    
+    def nodes(node):
+      yield node
+      if node.contents!=None:
+        for child in node.contents.values():
+          yield from nodes(child)
+    
+    for node in nodes(s.get_root()):
+      self.assertTrue(node.state!=fs_db.Node.UNINITIALISED)
+      if node.state==fs_db.Node.FILE:
+        st = os.stat(node.real_path())
+        self.assertTrue(node.stat==(st.st_mtime_ns, st.st_size, st.st_ino))
+    
+    self.assertTrue(s['penguins','fly.txt'].stat[1]==4)
+    self.assertTrue(len(s)==5)
+    
+    del s
+    
+    s = fs_db.FSDB(self.root)
+    s.load()
+    self.assertTrue(s['penguins','fly.txt'].stat==None) # No file type, so never read - not worth the memory.
+    
+    del s
+  
+  
+  def test_watch(self):
+    """Tests that directory changes are seen immediately when inotify is watching, without waiting for the cache to time out."""
+    s = fs_db.FSDB(self.root, watch = True)
+    if not s.watching():
+      self.skipTest('inotify not available')
+    
+    self.assertTrue(len(s)==5)
+    
+    open(os.path.join(self.root, 'snails.txt'), 'w').close()
+    os.remove(os.path.join(self.root, 'penguins', 'fly.txt'))
+    os.mkdir(os.path.join(self.root, '.lock_cabbage.txt'))
+    
+    self.assertTrue('snails.txt' in s)
+    self.assertFalse(('penguins', 'fly.txt') in s)
+    self.assertTrue(len(s)==5)
+    
+    # Directories that are not changed should not be relisted...
+    update = s['penguins'].update
+    open(os.path.join(self.root, 'cats.txt'), 'w').close()
+    self.assertTrue('cats.txt' in s)
+    self.assertTrue(s['penguins'].update==update)
+    
+    s.close()
+    del s
 
 
 
@@ -294,6 +438,68 @@ class TestFSDB_Json(unittest.TestCase):
       self.fsdb['wibble.txt'].read()
   
   
+  def test_validate(self):
+    """Checks that changes are detected even when the mtime does not change, and that the trust window skips validation."""
+    node = self.fsdb['swan.json']
+    self.assertTrue(node.read()['name']=='Percy')
+    
+    # Replace the file with one with the same mtime, but a different size and inode...
+    fn = os.path.join(self.root, 'swan.json')
+    st = os.stat(fn)
+    with open(fn + '.new', 'w') as f:
+      f.write('{"name":"Lou", "age":5}')
+    os.utime(fn + '.new', ns=(st.st_atime_ns, st.st_mtime_ns))
+    os.replace(fn + '.new', fn)
+    
+    self.assertTrue(node.read()['name']=='Lou')
+    
+    # Trust window...
+    self.fsdb.set_trust_window(60.0)
+    calls = self.fsdb.stats()['stat_calls']
+    saved = self.fsdb.stats()['stat_saved']
+    
+    with open(fn, 'w') as f:
+      f.write('{"name":"Louise", "age":5}')
+    
+    self.assertTrue(node.read()['name']=='Lou')
+    self.assertTrue(node.read()['name']=='Lou')
+    self.assertTrue(self.fsdb.stats()['stat_calls']==calls)
+    self.assertTrue(self.fsdb.stats()['stat_saved']==saved+2)
+    
+    self.fsdb.set_trust_window(0.0)
+    self.assertTrue(node.read()['name']=='Louise')
+    self.assertTrue(self.fsdb.stats()['stat_calls']==calls+1)
+  
+  
+  def test_epoch(self):
+    """Checks that within an epoch files are only validated once."""
+    node = self.fsdb['swan.json']
+    fn = os.path.join(self.root, 'swan.json')
+    
+    fs_db.begin_epoch()
+    try:
+      self.assertTrue(node.read()['name']=='Percy')
+      calls = self.fsdb.stats()['stat_calls']
+      
+      with open(fn, 'w') as f:
+        f.write('{"name":"Louise", "age":5}')
+      
+      self.assertTrue(node.read()['name']=='Percy')
+      self.assertTrue(self.fsdb['swan.json'].read()['name']=='Percy')
+      self.assertTrue(self.fsdb.stats()['stat_calls']==calls)
+      
+      # Writes by this process are seen...
+      node.write({'name' : 'Paul'})
+      self.assertTrue(node.read()['name']=='Paul')
+    
+    finally:
+      fs_db.end_epoch()
+    
+    with open(fn, 'w') as f:
+      f.write('{"name":"Louise", "age":5}')
+    self.assertTrue(node.read()['name']=='Louise')
+  
+  
   def test_write(self):
     """Write files - check it behaves itself."""
     
@@ -308,6 +514,306 @@ class TestFSDB_Json(unittest.TestCase):
     self.assertTrue(data['name']=='Paul')
   
   
+  def test_atomic(self):
+    """Checks atomic mode - writes replace the file without leaving anything behind, and lock forces the next read to check the disk."""
+    db = fs_db.FSDB(self.root, atomic = True)
+    db.register(fs_db_json.JsonFileType())
+    db.set_trust_window(60.0)
+    
+    node = db['swan.json']
+    node.write({'name' : 'Paul'})
+    self.assertTrue(self.fsdb['swan.json'].read()['name']=='Paul')
+    self.assertTrue(sorted(os.listdir(self.root))==['swan.json', 'wibble.txt'])
+    
+    with open(os.path.join(self.root, 'swan.json'), 'w') as f:
+      f.write('{"name":"Louise", "age":5}')
+    self.assertTrue(node.read()['name']=='Paul') # Within trust window.
+    
+    with node.lock():
+      self.assertTrue(os.path.exists(os.path.join(self.root, '.lock_swan.json')))
+      self.assertTrue('.lock_swan.json' not in db.get_root())
+      
+      data = node.read()
+      self.assertTrue(data['name']=='Louise')
+      data['age'] = 6
+      node.write(data)
+    
+    self.cycle()
+    self.assertTrue(self.fsdb['swan.json'].read()['age']==6)
+    self.assertTrue(sorted(os.listdir(self.root))==['swan.json', 'wibble.txt'])
+    
+    del db
+  
+  
+  def test_write_behind(self):
+    """Checks that writes are held back and coalesced in write-behind mode, until flushed or forced."""
+    fn = os.path.join(self.root, 'swan.json')
+    def on_disk():
+      with open(fn, 'r') as f:
+        return json.load(f)['name']
+    
+    self.fsdb.set_write_behind(60.0)
+    node = self.fsdb['swan.json']
+    
+    node.write({'name' : 'Paul'})
+    node.write({'name' : 'Pete'})
+    self.assertTrue(node.read()['name']=='Pete')
+    self.assertTrue(on_disk()=='Percy')
+    self.assertTrue(self.fsdb.stats()['writes_coalesced']==1)
+    
+    self.fsdb.flush()
+    self.assertTrue(on_disk()=='Pete')
+    self.assertTrue(self.fsdb.stats()['writes']==1)
+    
+    node.write({'name' : 'Paul'})
+    node.write({'name' : 'Priscilla'}, True)
+    self.assertTrue(on_disk()=='Priscilla')
+    self.assertTrue(len(self.fsdb.pending)==0)
+    
+    # New files are written immediately...
+    self.fsdb.get_root().new('duck.json', {'name' : 'Donald'})
+    self.assertTrue(os.path.exists(os.path.join(self.root, 'duck.json')))
+    
+    # Flushed once the interval has passed...
+    node.write({'name' : 'Paul'})
+    self.fsdb.set_write_behind(1e-3)
+    time.sleep(2e-3)
+    self.fsdb.get_root()
+    self.assertTrue(on_disk()=='Paul')
+  
+  
+  def test_budget(self):
+    """Checks that contents are evicted least recently used first when over the memory budget, are reloaded when needed, and that pending writes are never evicted."""
+    for i in range(4):
+      with open(os.path.join(self.root, 'duck%i.json' % i), 'w') as f:
+        f.write('{"name":"Duck %i"}' % i)
+    size = os.path.getsize(os.path.join(self.root, 'duck0.json'))
+    
+    root = self.fsdb.get_root()
+    ducks = [root['duck%i.json' % i] for i in range(4)]
+    
+    prev = fs_db.budget
+    fs_db.budget = fs_db.ContentsBudget() # Budget is global - don't count the leftovers of other tests.
+    try:
+      fs_db.set_memory_budget(3 * size)
+      
+      for duck in ducks:
+        duck.read()
+      self.assertTrue(ducks[0].contents==None)
+      self.assertTrue(ducks[3].contents!=None)
+      self.assertTrue(fs_db.memory_stats()['evictions']==1)
+      self.assertTrue(fs_db.memory_stats()['resident']<=3 * size)
+      
+      self.assertTrue(ducks[0].read()['name']=='Duck 0')
+      self.assertTrue(ducks[1].contents==None)
+      
+      self.fsdb.set_write_behind(60.0)
+      ducks[2].write({'name' : 'Donald'})
+      ducks[3].read()
+      ducks[0].read()
+      ducks[1].read()
+      self.assertTrue(ducks[2].read()['name']=='Donald')
+      
+      self.fsdb.close()
+      self.assertTrue(all(node.owner is not self.fsdb for node, size in fs_db.budget.nodes.values()))
+    
+    finally:
+      fs_db.budget = prev
+  
+  
+  def test_journal(self):
+    """Checks that changes appear in the journal and are sent to subscribers."""
+    root = self.fsdb.get_root()
+    root['swan.json'].read()
+    start = self.fsdb.sequence()
+    
+    seen = []
+    self.fsdb.subscribe(lambda seq, kind, path: seen.append((kind, path)))
+    
+    root.new('duck.json', {'name' : 'Donald'})
+    root['swan.json'].write({'name' : 'Paul'})
+    root['duck.json'].remove()
+    root.create(('pond', 'reeds'))
+    
+    expected = [('created', ('duck.json',)), ('modified', ('swan.json',)), ('deleted', ('duck.json',)), ('created', ('pond',)), ('created', ('pond', 'reeds'))]
+    self.assertTrue(seen==expected)
+    
+    changes = self.fsdb.changes_since(start)
+    self.assertTrue([change[1:] for change in changes]==expected)
+    self.assertTrue([change[0] for change in changes]==list(range(start+1, start+6)))
+    self.assertTrue(self.fsdb.changes_since(start+4)==changes[-1:])
+    self.assertTrue(self.fsdb.changes_since(self.fsdb.sequence())==[])
+    
+    # Changes made by someone else are noticed when seen...
+    with open(os.path.join(self.root, 'swan.json'), 'w') as f:
+      f.write('{"name":"Louise", "age":5}')
+    os.remove(os.path.join(self.root, 'wibble.txt'))
+    
+    self.assertTrue(root['swan.json'].read()['name']=='Louise')
+    root.refresh()
+    self.assertTrue(seen[-2:]==[('modified', ('swan.json',)), ('deleted', ('wibble.txt',))])
+    
+    # The journal only goes back so far...
+    self.fsdb.set_write_behind(60.0)
+    for i in range(self.fsdb.journal.maxlen):
+      root['swan.json'].write({'name' : 'Percy %i' % i})
+    self.assertTrue(self.fsdb.changes_since(start)==None)
+  
+  
+  def test_threads(self):
+    """Hammers an FSDB from several threads at once, checking that nothing is lost and epochs are per thread."""
+    root = self.fsdb.get_root()
+    pond = root.new('pond')
+    root.new('count.json', {'count' : 0})
+    self.fsdb.set_cache_time(0.0)
+    
+    errors = []
+    epochs = []
+    
+    def work(index):
+      try:
+        mine = fs_db.begin_epoch()
+        epochs.append(mine)
+        for i in range(20):
+          pond.new('duck_%i_%i.json' % (index, i), {'name' : 'Donald'})
+          len(list(pond.walk('.json')))
+          pond.refresh()
+          
+          node = self.fsdb['count.json']
+          with node.lock():
+            data = dict(node.read())
+            data['count'] += 1
+            node.write(data)
+        
+        self.assertTrue(fs_db.epoch_state.current==mine)
+      
+      except Exception as e:
+        errors.append(e)
+      
+      finally:
+        fs_db.end_epoch()
+    
+    threads = [threading.Thread(target=work, args=(index,)) for index in range(8)]
+    for thread in threads: thread.start()
+    for thread in threads: thread.join()
+    
+    self.assertTrue(errors==[])
+    self.assertTrue(len(set(epochs))==8)
+    self.assertTrue(fs_db.epoch_state.current==0)
+    self.assertTrue(len(pond)==8*20)
+    self.assertTrue(self.fsdb['count.json'].read()['count']==8*20)
+    self.assertTrue(len(self.fsdb.file_locks)==0)
+    
+    self.cycle()
+    self.assertTrue(len(self.fsdb['pond'])==8*20)
+  
+  
+  def test_broadcast(self):
+    """Checks that changes are broadcast to other processes, and applied to their caches when they arrive."""
+    sockets = tempfile.TemporaryDirectory()
+    try:
+      # Pretend to be another process, with its own cache that would never notice the changes by itself...
+      theirs = fs_db_broadcast.Broadcast(sockets.name, 'theirs')
+      other = fs_db.FSDB(self.root)
+      other.register(fs_db_json.JsonFileType())
+      other.set_cache_time(3600.0)
+      other.set_trust_window(3600.0)
+      
+      self.assertTrue(other['swan.json'].read()['name']=='Percy')
+      self.assertFalse('duck.json' in other.get_root())
+      
+      fs_db.enable_broadcast(sockets.name)
+      root = self.fsdb.get_root()
+      root.new('duck.json', {'name' : 'Donald'})
+      root['swan.json'].write({'name' : 'Paul'})
+      root['swan.json'].read() # Only changes made through the FSDB are sent.
+      
+      self.assertFalse('duck.json' in other.get_root())
+      self.assertTrue(other['swan.json'].read()['name']=='Percy')
+      
+      self.assertTrue(theirs.poll(fs_db.apply_broadcast)==2)
+      self.assertTrue('duck.json' in other.get_root())
+      self.assertTrue(other['swan.json'].read()['name']=='Paul')
+      self.assertTrue(other['duck.json'].read()['name']=='Donald')
+      
+      # Sockets of processes that have gone are skipped...
+      theirs.close()
+      root['swan.json'].write({'name' : 'Paul'})
+      self.assertTrue(fs_db.broadcast.sent==2)
+    
+    finally:
+      fs_db.disable_broadcast()
+      sockets.cleanup()
+  
+  
+  def test_parse_cache(self):
+    """Checks that the parsed cache is used when the file has not changed, and ignored when it has."""
+    cache = os.path.join(self.root, 'cache')
+    
+    def db():
+      ret = fs_db.FSDB(self.root)
+      ret.register(fs_db_json.JsonFileType(cache, 0))
+      return ret
+    
+    fn = os.path.join(self.root, 'swan.json')
+    os.utime(fn, (time.time() - 10.0, time.time() - 10.0)) # Recently modified files are not cached.
+    
+    first = db()
+    self.assertTrue(first['swan.json'].read()['name']=='Percy')
+    self.assertTrue(first.types['.json'].cache_misses==1)
+    
+    second = db()
+    self.assertTrue(second['swan.json'].read()['name']=='Percy')
+    self.assertTrue(second.types['.json'].cache_hits==1)
+    
+    with open(fn, 'w') as f:
+      f.write('{"name":"Louise", "age":5}')
+    
+    third = db()
+    self.assertTrue(third['swan.json'].read()['name']=='Louise')
+    self.assertTrue(third.types['.json'].cache_hits==0)
+  
+  
+  def test_frozen(self):
+    """Checks that frozen mode hands out read only views of the cache, that read_for_update gives a copy that can be edited, and that frozen contents can be written and snapshotted."""
+    db = fs_db.FSDB(self.root, frozen=True)
+    db.register(fs_db_json.JsonFileType())
+    db.get_root().new('penguins').new('eat.json', {'food' : ['fish', 'squid']})
+    
+    data = db['swan.json'].read()
+    self.assertTrue(data['name']=='Percy')
+    self.assertTrue(db['swan.json'].read() is data)
+    self.assertRaises(TypeError, operator.setitem, data, 'name', 'Paul')
+    
+    eat = db['penguins', 'eat.json'].read()
+    self.assertTrue(eat['food']==('fish', 'squid'))
+    self.assertRaises(TypeError, operator.setitem, eat, 'food', ())
+    
+    # Edit a copy and write it back - the cache is frozen again, the copy left alone...
+    copy = db['penguins', 'eat.json'].read_for_update()
+    copy['food'].append('krill')
+    self.assertTrue(db['penguins', 'eat.json'].read()['food']==('fish', 'squid'))
+    
+    db['penguins', 'eat.json'].write(copy)
+    copy['food'].append('tourists')
+    self.assertTrue(db['penguins', 'eat.json'].read()['food']==('fish', 'squid', 'krill'))
+    
+    self.cycle()
+    self.assertTrue(self.fsdb['penguins', 'eat.json'].read()=={'food' : ['fish', 'squid', 'krill']})
+    
+    # Snapshots hold plain json...
+    alt_temp_dir = tempfile.TemporaryDirectory()
+    fn = os.path.join(alt_temp_dir.name, 'fsdb.json')
+    db.save_snapshot(fn)
+    
+    db = fs_db.FSDB(self.root, frozen=True)
+    db.register(fs_db_json.JsonFileType())
+    self.assertTrue(db.load_snapshot(fn))
+    self.assertTrue(db['penguins', 'eat.json'].read()['food']==('fish', 'squid', 'krill'))
+    self.assertRaises(TypeError, operator.setitem, db['swan.json'].read(), 'name', 'Paul')
+    alt_temp_dir.cleanup()
+  
+  
   def test_new(self):
     """Tests the ability to create new files."""
     
@@ -326,6 +832,30 @@ class TestFSDB_Json(unittest.TestCase):
     self.assertFalse('fishies' in d)
   
   
+  def test_compact(self):
+    """Checks the parts of Node that are worked out rather than stored, and that changes reset the contents summaries."""
+    os.mkdir(os.path.join(self.root, 'empty'))
+    
+    root = self.fsdb.get_root()
+    empty = root['empty']
+    self.assertTrue(len(empty)==0)
+    self.assertTrue(empty.contents is fs_db.no_children)
+    self.assertTrue(empty.real_path()==os.path.join(self.root, 'empty'))
+    self.assertTrue(root['swan.json'].ftype is self.fsdb.types['.json'])
+    self.assertTrue(root['wibble.txt'].ftype==None)
+    
+    self.assertFalse(empty.contains_ext('.json'))
+    self.assertTrue(len(list(self.fsdb.walk('.json')))==1)
+    
+    node = empty.new('duck.json', {'name' : 'Donald'})
+    self.assertTrue(node.real_path()==os.path.join(self.root, 'empty', 'duck.json'))
+    self.assertTrue(empty.contents is not fs_db.no_children)
+    self.assertTrue(('empty', 'duck.json') in [path for path, node in self.fsdb.walk('.json')])
+    
+    node.remove()
+    self.assertFalse(empty.contains_ext('.json'))
+  
+  
   def test_clone(self):
     """Tests the clone capability."""
     alt_temp_dir = tempfile.TemporaryDirectory()
@@ -364,3 +894,46 @@ class TestFSDB_Json(unittest.TestCase):
       self.fsdb.get_root().create(('wibble.txt', 'cabbage'))
 
     self.fsdb.get_root().create('fish')
+  
+  
+  def test_snapshot(self):
+    """Tests that a snapshot can be saved and loaded, and that it is validated against the file system after loading."""
+    self.fsdb.get_root().new('penguins').new('eat.json', ['fish'])
+    self.assertTrue(self.fsdb['swan.json'].read()['name']=='Percy')
+    
+    past = time.time() - 60.0
+    os.utime(self.root, (past, past))
+    os.utime(os.path.join(self.root, 'penguins'), (past, past))
+    self.fsdb.load()
+    
+    alt_temp_dir = tempfile.TemporaryDirectory()
+    fn = os.path.join(alt_temp_dir.name, 'snap', 'fsdb.json')
+    self.fsdb.save_snapshot(fn)
+    
+    # Load it, and check the contents come from the snapshot...
+    self.cycle()
+    self.assertTrue(self.fsdb.load_snapshot(fn))
+    self.assertTrue(self.fsdb.get_root().contents['swan.json'].contents['name']=='Percy')
+    self.assertTrue(self.fsdb['swan.json'].read()['name']=='Percy')
+    self.assertTrue(self.fsdb['penguins', 'eat.json'].read()==['fish'])
+    self.assertTrue(len(self.fsdb)==5)
+    
+    # Change the file system and verify that the snapshot is not trusted...
+    self.cycle()
+    
+    with open(os.path.join(self.root, 'swan.json'), 'w') as f:
+      f.write('{"name":"Louise", "age":5}')
+    os.remove(os.path.join(self.root, 'wibble.txt'))
+    
+    self.assertTrue(self.fsdb.load_snapshot(fn))
+    self.assertTrue(self.fsdb['swan.json'].read()['name']=='Louise')
+    self.assertFalse('wibble.txt' in self.fsdb)
+    self.assertTrue(len(self.fsdb)==4)
+    
+    # Snapshots for other directories should be rejected...
+    other = fs_db.FSDB(alt_temp_dir.name)
+    other.register(fs_db_json.JsonFileType())
+    self.assertFalse(other.load_snapshot(fn))
+    self.assertFalse(other.load_snapshot(fn + '.missing'))
+    
+    alt_temp_dir.cleanup()
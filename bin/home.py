@@ -77,7 +77,7 @@ def app(rfam, response):
   # Do the remaining assets - code is the same as for the asset list...  
   if len(jobs)>1:
     # Fetch the correct header for the asset list...
-    if rfam.proj_defaults(response.project)['priority.json'].read()['visible']:
+    if rfam.catalog(response.project).priority['visible']:
       assets_head = rfam.template('assets.head_priority', {}, response)
       row_template = 'assets.row_priority'
     else:
@@ -37,10 +37,9 @@ def app(rfam, response):
     response.append(json.dumps({'name' : name, 'start' : 1, 'end' : 24, 'final' : False}))
     return
   
-  info = db[path].read()
+  info = db[path].read_for_update()
   
   # start and end might not already exist, so add them if need be...
-  info = dict(info)
   if 'start' not in info:
     info['start' ] = '1'
   if 'end' not in info:
@@ -20,10 +20,9 @@ import time
 import random
 import math
 import uuid
+import threading
 from collections import defaultdict
 
-from .fs_db import FSDB
-from .fs_db_json import JsonFileType
 
 
 
@@ -62,15 +61,17 @@ class Jobs:
     if not os.path.exists(self.rfam.config['jobs']):
       os.makedirs(self.rfam.config['jobs'])
         
-    self.jobs = FSDB(self.rfam.config['jobs'], rfam.config['single_proc'])
-    self.jobs.register(JsonFileType())
+    self.jobs = self.rfam.fsdb(self.rfam.config['jobs'])
     
     # Prepare the nodes directory - a .json directory for each known node, accessed via a FSDB...
     if not os.path.exists(self.rfam.config['nodes']):
       os.makedirs(self.rfam.config['nodes'])
         
-    self.nodes = FSDB(self.rfam.config['nodes'], rfam.config['single_proc'])
-    self.nodes.register(JsonFileType())
+    self.nodes = self.rfam.fsdb(self.rfam.config['nodes'])
+    
+    # Heartbeats rewrite the same few files constantly, so let them collapse into occasional writes...
+    self.jobs.set_write_behind(self.rfam.config.get('write_behind', 0.0))
+    self.nodes.set_write_behind(self.rfam.config.get('write_behind', 0.0))
     
     # Extract a few misc parameters...
     self.bin_search_order = self.rfam.config['bin_search_order']
@@ -80,6 +81,7 @@ class Jobs:
     self.require_init = 1.0 # Probability of something previously unseen.
     self.require_shrink = math.pow(0.5, 1.0 / self.rfam.config['require_half_life']) # Number of jobs for stat to reach half strength.
     self.require_add = 1.0 - self.require_shrink
+    self.require_lock = threading.Lock() # Reports can arrive on several threads at once.
     
     # Time information, for job updates etc...
     self.heartbeat = self.rfam.config['heartbeat'] # How often clients should say hi.
@@ -181,9 +183,10 @@ class Jobs:
       return
     
     node = root[fn]
-    state = node.read()
-    state['pause'] = value
-    node.write(state)
+    with node.lock():
+      state = node.read_for_update()
+      state['pause'] = value
+      node.write(state)
 
 
   def job_priority(self, ident, value):
@@ -194,9 +197,10 @@ class Jobs:
       return
       
     node = root[fn]
-    state = node.read()
-    state['priority'] = value
-    node.write(state)
+    with node.lock():
+      state = node.read_for_update()
+      state['priority'] = value
+      node.write(state)
 
     
   def node_pause(self, ident, value = True):
@@ -207,9 +211,10 @@ class Jobs:
       return
     
     node = root[fn]
-    state = node.read()
-    state['paused'] = value
-    node.write(state)
+    with node.lock():
+      state = node.read_for_update()
+      state['paused'] = value
+      node.write(state)
 
 
   def node_pause_all(self, value):
@@ -218,10 +223,11 @@ class Jobs:
     for name in root:
       node = root[name]
       
-      state = node.read()
-      if state!=None:
-        state['paused'] = value
-        node.write(state)
+      with node.lock():
+        state = node.read_for_update()
+        if state!=None:
+          state['paused'] = value
+          node.write(state)
 
 
   def report(self, ident, provides = [], version = None):
@@ -230,29 +236,31 @@ class Jobs:
     # Record this nodes sighting...
     root = self.nodes.get_root()
     fn = ident + '.json'
-    if fn in root:
-      state = root[fn].read()
-    else:
-      state = None
-
-    if state==None:
-      state = {'ident' : ident, 'paused' : False}
-    
-    state['provides'] = provides
-    state['version'] = version
-    state['seen'] = time.time()
+    if fn not in root:
+      root.new(fn, {'ident' : ident, 'paused' : False})
     
-    root.new(fn, state)
+    node = root[fn]
+    with node.lock():
+      state = node.read_for_update()
+      if state==None:
+        state = {'ident' : ident, 'paused' : False}
+      
+      state['provides'] = provides
+      state['version'] = version
+      state['seen'] = time.time()
+      
+      node.write(state)
     
     # Analyse the provides variable - we need to keep rolling stats on how many nodes are arriving of each type so that it can correctly upweight jobs with essoteric requirements so they get done in a fair amount of time (for practical reasons assume items in the provides list are independent - if jobs only ever have one requires this is correct anyway)...
-    self.require_init *= self.require_shrink
-    for key in self.require_rate.keys():
-      self.require_rate[key] *= self.require_shrink
+    with self.require_lock:
+      self.require_init *= self.require_shrink
+      for key in self.require_rate.keys():
+        self.require_rate[key] *= self.require_shrink
 
-    for key in provides:
-      if key not in self.require_rate:
-        self.require_rate[key] = self.require_init
-      self.require_rate[key] += self.require_add
+      for key in provides:
+        if key not in self.require_rate:
+          self.require_rate[key] = self.require_init
+        self.require_rate[key] += self.require_add
 
 
   def task_select(self, ident, paths, provides = []):
@@ -360,38 +368,39 @@ class Jobs:
     # Record the work item and return (re-get it to minimise the risk of corruption - should probably change how this system works)...
     root = self.jobs.get_root()
     name = todo['uuid'] + '.json'
-    todo = root[name].read()
-    
-    inc_error = 0
-    ok = False
-    
-    if len(todo['todo'])!=0:
-      ok = True
-      if todo['video']:
-        frame = (min(todo['todo']), max(todo['todo']))
-        todo['todo'] = []
-      else:
-        frame = todo['todo'].pop(0)
-    
-    elif self.retry:
-      for i in range(len(todo['working'])):
-        if todo['working'][i][2] < too_old:
-          inc_error = 1
-          ok = True
-          frame = todo['working'][i][0]
-          del todo['working'][i]
-          if todo['video']:
-            todo['done'] = []
-          break
-    
-    if not ok: # Something has gone wrong - avoid a crash.
-      return None
+    with root[name].lock():
+      todo = root[name].read_for_update()
       
-    task = [frame, ident, now]
-    todo['working'].append(task)
-    todo['errors'] += inc_error
-    
-    root[name].write(todo)
+      inc_error = 0
+      ok = False
+      
+      if len(todo['todo'])!=0:
+        ok = True
+        if todo['video']:
+          frame = (min(todo['todo']), max(todo['todo']))
+          todo['todo'] = []
+        else:
+          frame = todo['todo'].pop(0)
+      
+      elif self.retry:
+        for i in range(len(todo['working'])):
+          if todo['working'][i][2] < too_old:
+            inc_error = 1
+            ok = True
+            frame = todo['working'][i][0]
+            del todo['working'][i]
+            if todo['video']:
+              todo['done'] = []
+            break
+      
+      if not ok: # Something has gone wrong - avoid a crash.
+        return None
+        
+      task = [frame, ident, now]
+      todo['working'].append(task)
+      todo['errors'] += inc_error
+      
+      root[name].write(todo)
     
     # Return the task for the node to do...
     newtask =  {'uuid' : todo['uuid'], 'frame' : task[0], 'file' : todo['file'], 'issued' : now, 'requires' : todo['requires'], 'prmanCommands' : job['prmanCommands']}
@@ -406,46 +415,47 @@ class Jobs:
     if name not in root:
       return False
     
-    node = root[name].read()
-    
-    # Perform the update - depends on if its video mode or individual frame mode...
-    if node['video']==False:
-      # Single frame...
-      found = False
-      for task in node['working']:
-        if task[0]==frame:
-          if task[1]==ident:
-            task[2] = time.time()
-          else:
-            # Another node is rendering it - hard stop...
-            return False
-          
-          found = True
-          break
+    with root[name].lock():
+      node = root[name].read_for_update()
       
-      if not found:
-        # Node is not meant to be rendering the asset, but then no one else is - might as well let it continue...
-        node['working'].append([frame, ident, time.time()])
-    
-    else:
-      # Video mode...
-      if len(node['working'])==0:
-        # Job doesn't exist - might as well assign it to the node...
-        node['todo'] = []
-        node['working'] = [[frame, ident, time.time()]]
+      # Perform the update - depends on if its video mode or individual frame mode...
+      if node['video']==False:
+        # Single frame...
+        found = False
+        for task in node['working']:
+          if task[0]==frame:
+            if task[1]==ident:
+              task[2] = time.time()
+            else:
+              # Another node is rendering it - hard stop...
+              return False
+            
+            found = True
+            break
+        
+        if not found:
+          # Node is not meant to be rendering the asset, but then no one else is - might as well let it continue...
+          node['working'].append([frame, ident, time.time()])
       
       else:
-        # Job exists - check its the right node...
-        if node['working'][0][1]!=ident:
-          return False
+        # Video mode...
+        if len(node['working'])==0:
+          # Job doesn't exist - might as well assign it to the node...
+          node['todo'] = []
+          node['working'] = [[frame, ident, time.time()]]
+        
+        else:
+          # Job exists - check its the right node...
+          if node['working'][0][1]!=ident:
+            return False
+          
+          node['working'][0][2] = time.time()
         
-        node['working'][0][2] = time.time()
+        # Update for the done/total values...
+        node['done'] = [i+frame[0] for i in range(done)]
       
-      # Update for the done/total values...
-      node['done'] = [i+frame[0] for i in range(done)]
-    
-    # Save the node back...
-    root[name].write(node)
+      # Save the node back...
+      root[name].write(node)
     
     # We got this far - there were no problems...
     return True
@@ -460,75 +470,78 @@ class Jobs:
     if name not in root:
       return False
     
-    node = root[name].read()
-    
-    # Mark the task as complete, noting that code depends on if its a video render or not...
-    if node['video']==False:
-      # Single frame...
-      for i in range(len(node['working'])):
-        if node['working'][i][0]==frame:
-          # Update data structure...
-          del node['working'][i]
-          node['done'].append(frame)
-          
-          # Update rendering time information for the job...
-          node['time_count'] += 1
-          node['time'] += (time - node['time']) / float(node['time_count'])
-          
-          # Update file timing information, if relevant...
-          db = self.rfam.proj(node['project'])
-          if node['meta'] in db:
-            meta_node = db[node['meta']]
-            meta = meta_node.read()
+    with root[name].lock():
+      node = root[name].read_for_update()
+      
+      # Mark the task as complete, noting that code depends on if its a video render or not...
+      if node['video']==False:
+        # Single frame...
+        for i in range(len(node['working'])):
+          if node['working'][i][0]==frame:
+            # Update data structure...
+            del node['working'][i]
+            node['done'].append(frame)
+            
+            # Update rendering time information for the job...
+            node['time_count'] += 1
+            node['time'] += (time - node['time']) / float(node['time_count'])
             
+            # Update file timing information, if relevant...
+            db = self.rfam.proj(node['project'])
+            if node['meta'] in db:
+              meta_node = db[node['meta']]
+              with meta_node.lock():
+                meta = meta_node.read_for_update()
+                
+                if 'render_time' not in meta:
+                  d = {}
+                  meta['render_time'] = d
+                else:
+                  d = meta['render_time']
+                
+                if str(frame) not in d:
+                  d[str(frame)] = [time]
+                else:
+                  d[str(frame)].append(time)
+                
+                meta_node.write(meta)
+            
+            break
+      
+      else:
+        # Video mode...
+        
+        # Update data structure...
+        node['todo'] = []
+        node['working'] = []
+        node['done'] = [i for i in range(frame[0], frame[1]+1)]
+        
+        # Update rendering time information, even though pointless...
+        node['time_count'] += 1
+        node['time'] += (time - node['time']) / float(node['time_count'])
+        
+        # Update file timing information, if relevant...
+        db = self.rfam.proj(node['project'])
+        if node['meta'] in db:
+          meta_node = db[node['meta']]
+          with meta_node.lock():
+            meta = meta_node.read_for_update()
+                
             if 'render_time' not in meta:
               d = {}
               meta['render_time'] = d
             else:
               d = meta['render_time']
-            
-            if str(frame) not in d:
-              d[str(frame)] = [time]
+                
+            if 'video' not in d:
+              d['video'] = [time]
             else:
-              d[str(frame)].append(time)
-            
+              d['video'].append(time)
+                
             meta_node.write(meta)
-          
-          break
-    
-    else:
-      # Video mode...
-      
-      # Update data structure...
-      node['todo'] = []
-      node['working'] = []
-      node['done'] = [i for i in range(frame[0], frame[1]+1)]
       
-      # Update rendering time information, even though pointless...
-      node['time_count'] += 1
-      node['time'] += (time - node['time']) / float(node['time_count'])
-      
-      # Update file timing information, if relevant...
-      db = self.rfam.proj(node['project'])
-      if node['meta'] in db:
-        meta_node = db[node['meta']]
-        meta = meta_node.read()
-            
-        if 'render_time' not in meta:
-          d = {}
-          meta['render_time'] = d
-        else:
-          d = meta['render_time']
-            
-        if 'video' not in d:
-          d['video'] = [time]
-        else:
-          d['video'].append(time)
-            
-        meta_node.write(meta)
-    
-    # Save the node back...
-    root[name].write(node)
+      # Save the node back, straight to disk as finished frames must not be lost...
+      root[name].write(node, True)
   
   
   def potential_jobs(self, task):
@@ -539,11 +552,13 @@ class Jobs:
     
     for name, node in [(name, root[name]) for name in root]:
       if node.isa()==node.FILE and name.endswith('.json'):
-        state = node.read()
-        if state!=None and task not in state['potential']:
-          state['potential'].append(task)
-          node.write(state)
-        
-          ret.append(state)
+        with node.lock():
+          state = node.read()
+          if state!=None and task not in state['potential']:
+            state = node.read_for_update()
+            state['potential'].append(task)
+            node.write(state)
+          
+            ret.append(state)
     
     return ret
@@ -15,51 +15,225 @@
 
 import os
 import os.path
+import stat
 import random
 import time
 
+try:
+  import fcntl
+except ImportError:
+  fcntl = None # Not Unix - only the mkdir backend is available.
+
 
 
 lock_dir_prefix = '.lock_'
+temp_file_prefix = '.tmp_'
+
+hidden_prefixes = (lock_dir_prefix, temp_file_prefix) # Names starting with these are internal, and should be hidden from listings.
+
+
+
+# Configuration, shared by all locks - see configure()...
+lock_backend = 'mkdir'
+lock_timeout = None
+lock_stale_age = 300.0
+
+# Statistics, shared by all locks - see get_stats()...
+stats = {'locks' : 0, 'contended' : 0, 'wait' : 0.0, 'timeouts' : 0, 'stale' : 0}
+
+
+
+def configure(backend = 'mkdir', timeout = None, stale_age = 300.0):
+  """Sets how locking is done, for every lock in the process. backend is either 'mkdir', the default, which uses lock directories and works everywhere, or 'flock', which uses fcntl.flock on a lock file, so reads can share a lock, waits block rather than poll and a crashed process can never leave a file locked (falls back to mkdir if fcntl is unavailable). Every process sharing the files must use the same backend. timeout is how many seconds to wait for a lock before raising TimeoutError, with None, the default, meaning forever. stale_age is how old, in seconds, a lock directory has to be before it is assumed to have been left behind by a crashed process and is deleted; None to never do so."""
+  global lock_backend, lock_timeout, lock_stale_age
+  lock_backend = backend
+  lock_timeout = timeout
+  lock_stale_age = stale_age
+
+
+def get_stats():
+  """Returns a dictionary of locking statistics for this process: 'locks' is how many have been acquired, 'contended' how many of those had to wait, 'wait' the total seconds spent waiting, 'timeouts' how many waits gave up and 'stale' how many lock directories were deleted as left behind by a crashed process."""
+  return dict(stats)
 
 
 
 class LockFile:
-  """Rather simple lock file system, based on lock directories (as directory creation is atomic) - whilst crude this is about as safe a locking system as its possible to create."""
+  """Rather simple lock file system, based on lock directories (as directory creation is atomic) - whilst crude this is about as safe a locking system as its possible to create. Alternatively uses flock on a lock file, depending on configure(), in which case reading (mode 'r') takes a shared lock, so readers do not wait for each other. If mode is None the file is locked but not opened, for when the lock has to cover several operations."""
   def __init__(self, fn, mode='r'):
     self.fn = fn
     self.mode = mode
   
   def __enter__(self):
-    # Keep trying to create a lock directory - this is safe on all platforms as directory creation is always atomic...
-    # Calculate lock dircectory name...
+    # Calculate lock directory/file name...
     head, tail = os.path.split(self.fn)
-    self.lock_dir = os.path.join(head, lock_dir_prefix + tail)
+    self.lock_path = os.path.join(head, lock_dir_prefix + tail)
+    self.fd = None
     
     # Get the lock...
+    start = time.time()
+    if lock_backend=='flock' and fcntl!=None:
+      contended = self.__flock(start)
+    else:
+      contended = self.__mkdir(start)
+    
+    stats['locks'] += 1
+    if contended:
+      stats['contended'] += 1
+      stats['wait'] += time.time() - start
+    
+    # We are safe - open the file...
+    self.f = None
+    if self.mode!=None:
+      try:
+        self.f = open(self.fn, self.mode)
+      except IOError:
+        self.f = None
+    
+    return self.f
+  
+  def __exit__(self, etype, value, traceback):
+    # Close file...
+    if self.f!=None:
+      self.f.close()
+    
+    # Terminate lock...
+    if self.fd!=None:
+      os.close(self.fd)
+    else:
+      os.rmdir(self.lock_path)
+    
+    return etype==None
+  
+  
+  def __mkdir(self, start):
+    """Gets the lock by creating the lock directory - this is safe on all platforms as directory creation is always atomic. Returns True if it had to wait."""
+    contended = False
+    
     while True:
       try:
-        os.mkdir(self.lock_dir)
-        break
+        os.mkdir(self.lock_path)
+        return contended
       except OSError:
-        # Its locked - sleep for a slightly random period of milliseconds...
+        # Its locked - check it has not been abandoned, then sleep for a slightly random period of milliseconds...
+        contended = True
+        self.__stale()
+        self.__check_timeout(start)
         time.sleep(1e-3 * random.randrange(1,9))
+  
+  
+  def __flock(self, start):
+    """Gets the lock with flock on the lock file, which is left in place afterwards. Blocks in the kernel when there is no timeout, otherwise polls with a growing delay. Returns True if it had to wait."""
+    contended = False
+    op = fcntl.LOCK_SH if self.mode=='r' else fcntl.LOCK_EX
+    
+    # Open the lock file, noting that a lock directory from the mkdir backend may be in the way...
+    while self.fd==None:
+      try:
+        self.fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o666)
+      except IsADirectoryError:
+        contended = True
+        self.__stale()
+        self.__check_timeout(start)
+        time.sleep(1e-3 * random.randrange(1,9))
+    
+    # Lock it...
+    try:
+      fcntl.flock(self.fd, op | fcntl.LOCK_NB)
+      return contended
+    except BlockingIOError:
+      pass
     
-    # We are safe - open the file...
     try:
-      self.f = open(self.fn, self.mode)
-    except IOError:
-      self.f = None
+      if lock_timeout==None:
+        fcntl.flock(self.fd, op)
+        return True
+      
+      delay = 1e-3
+      while True:
+        self.__check_timeout(start)
+        time.sleep(delay)
+        delay = min(2.0 * delay, 0.05)
+        
+        try:
+          fcntl.flock(self.fd, op | fcntl.LOCK_NB)
+          return True
+        except BlockingIOError:
+          pass
     
+    except:
+      os.close(self.fd)
+      self.fd = None
+      raise
+  
+  
+  def __stale(self):
+    """Deletes the lock directory if its older than the stale age, as that means a crashed process left it behind - it is renamed first, so a lock made by another process in the meantime is never deleted. Also deletes a lock file left behind by the flock backend, if nobody holds a flock on it, so switching back to the mkdir backend works."""
+    try:
+      st = os.stat(self.lock_path)
+      if stat.S_ISDIR(st.st_mode):
+        if lock_stale_age!=None and (time.time() - st.st_mtime) > lock_stale_age:
+          # Another waiter could delete it and a new lock be made between the stat and now, so move it out of the way atomically and check it is the one that was judged stale before deleting it...
+          head, tail = os.path.split(self.lock_path)
+          stale = os.path.join(head, '%s%08x_%s' % (lock_dir_prefix, random.getrandbits(32), tail))
+          os.rename(self.lock_path, stale)
+          
+          moved = os.stat(stale)
+          if moved.st_ino==st.st_ino and moved.st_mtime_ns==st.st_mtime_ns:
+            os.rmdir(stale)
+            stats['stale'] += 1
+          
+          else:
+            os.rename(stale, self.lock_path) # Took a live lock - put it straight back.
+      
+      elif stat.S_ISREG(st.st_mode):
+        fd = os.open(self.lock_path, os.O_RDWR)
+        try:
+          if fcntl!=None:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB) # Raises if held; released by the close.
+          os.unlink(self.lock_path)
+          stats['stale'] += 1
+        finally:
+          os.close(fd)
+    
+    except OSError:
+      pass
+  
+  
+  def __check_timeout(self, start):
+    """Raises TimeoutError if the lock has been waited on for too long."""
+    if lock_timeout!=None and (time.time() - start) > lock_timeout:
+      stats['timeouts'] += 1
+      stats['wait'] += time.time() - start
+      raise TimeoutError('Timed out waiting for lock on %s' % self.fn)
+
+
+
+
+class AtomicFile:
+  """Writes a file by writing a hidden temporary file in the same directory, which is flushed to disk and then renamed over the original, so other processes see either the old or the new version, never a partial write, and can read without taking a lock. If an exception escapes the temporary file is deleted and the original left untouched. Does not lock - concurrent writers simply race, with the last rename winning."""
+  def __init__(self, fn, mode='w'):
+    self.fn = fn
+    self.mode = mode
+  
+  def __enter__(self):
+    # Temporary file name is randomised so concurrent writers do not share it...
+    head, tail = os.path.split(self.fn)
+    self.temp = os.path.join(head, '%s%08x_%s' % (temp_file_prefix, random.getrandbits(32), tail))
+    
+    self.f = open(self.temp, self.mode)
     return self.f
   
   def __exit__(self, etype, value, traceback):
-    # Close file...
-    if self.f!=None:
+    if etype==None:
+      # Make sure its on the disk before it replaces the original...
+      self.f.flush()
+      os.fsync(self.f.fileno())
       self.f.close()
+      os.replace(self.temp, self.fn)
     
-    # Terminate lock...
-    os.rmdir(self.lock_dir)
+    else:
+      self.f.close()
+      os.remove(self.temp)
     
     return etype==None
 
@@ -75,3 +249,6 @@ if '__main__'==__name__:
       raise LookupError
   except LookupError:
     print('Lookup error received as expected')
+  
+  with AtomicFile('test3.txt') as f:
+    f.write('Hello atomically\n')
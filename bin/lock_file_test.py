@@ -0,0 +1,168 @@
+#! /usr/bin/env python3
+# Copyright 2014 Tom SF Haines
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import os.path
+import time
+
+import unittest
+import tempfile
+
+from . import lock_file
+
+
+
+class TestLockFile(unittest.TestCase):
+  """Tests both locking backends, including timeouts and the cleaning up of abandoned lock directories."""
+  def setUp(self):
+    self.temp_dir = tempfile.TemporaryDirectory()
+    self.root = self.temp_dir.name
+    self.fn = os.path.join(self.root, 'swan.txt')
+    
+    with open(self.fn, 'w') as f:
+      f.write('Percy')
+  
+  
+  def tearDown(self):
+    lock_file.configure()
+    self.temp_dir.cleanup()
+  
+  
+  def test_mkdir(self):
+    """Read and write with the default backend, making sure nothing is left behind."""
+    with lock_file.LockFile(self.fn, 'w') as f:
+      self.assertTrue(os.path.isdir(os.path.join(self.root, '.lock_swan.txt')))
+      f.write('Paul')
+    
+    with lock_file.LockFile(self.fn, 'r') as f:
+      self.assertTrue(f.read()=='Paul')
+    
+    self.assertTrue(os.listdir(self.root)==['swan.txt'])
+  
+  
+  def test_timeout(self):
+    """A held lock has to time out."""
+    lock_file.configure(timeout = 0.05)
+    before = lock_file.get_stats()
+    
+    with lock_file.LockFile(self.fn, None):
+      with self.assertRaises(TimeoutError):
+        with lock_file.LockFile(self.fn, 'r') as f:
+          pass
+    
+    self.assertTrue(lock_file.get_stats()['timeouts']==before['timeouts']+1)
+  
+  
+  def test_stale(self):
+    """A lock directory left behind by a crashed process is cleaned up once old enough."""
+    lock_dir = os.path.join(self.root, '.lock_swan.txt')
+    os.mkdir(lock_dir)
+    
+    lock_file.configure(timeout = 0.05)
+    with self.assertRaises(TimeoutError):
+      with lock_file.LockFile(self.fn, 'r') as f:
+        pass
+    
+    old = time.time() - 600.0
+    os.utime(lock_dir, (old, old))
+    before = lock_file.get_stats()
+    
+    with lock_file.LockFile(self.fn, 'r') as f:
+      self.assertTrue(f.read()=='Percy')
+    
+    self.assertTrue(lock_file.get_stats()['stale']==before['stale']+1)
+    self.assertFalse(os.path.exists(lock_dir))
+  
+  
+  def test_stale_race(self):
+    """A lock made by another process whilst a stale lock is being cleaned up must survive."""
+    lock_dir = os.path.join(self.root, '.lock_swan.txt')
+    os.mkdir(lock_dir)
+    old = time.time() - 600.0
+    os.utime(lock_dir, (old, old))
+    
+    # Between the stat and the rename another waiter deletes the stale lock and takes a new one...
+    rename = os.rename
+    def racing_rename(src, dst):
+      if src==lock_dir and os.stat(src).st_mtime<(time.time() - 300.0):
+        os.rmdir(lock_dir)
+        os.mkdir(lock_dir)
+      rename(src, dst)
+    
+    lock_file.configure(timeout = 0.05)
+    os.rename = racing_rename
+    try:
+      with self.assertRaises(TimeoutError):
+        with lock_file.LockFile(self.fn, 'r') as f:
+          pass
+    finally:
+      os.rename = rename
+    
+    self.assertTrue(sorted(os.listdir(self.root))==['.lock_swan.txt', 'swan.txt'])
+  
+  
+  @unittest.skipIf(lock_file.fcntl==None, 'fcntl not available')
+  def test_flock(self):
+    """Readers share the lock whilst a writer excludes them; a stale lock directory is replaced by a lock file."""
+    lock_dir = os.path.join(self.root, '.lock_swan.txt')
+    os.mkdir(lock_dir)
+    old = time.time() - 600.0
+    os.utime(lock_dir, (old, old))
+    
+    lock_file.configure('flock', 0.05)
+    
+    with lock_file.LockFile(self.fn, 'w') as f:
+      f.write('Paul')
+    self.assertTrue(os.path.isfile(os.path.join(self.root, '.lock_swan.txt')))
+    
+    with lock_file.LockFile(self.fn, 'r') as f1:
+      with lock_file.LockFile(self.fn, 'r') as f2:
+        self.assertTrue(f2.read()=='Paul')
+      
+      with self.assertRaises(TimeoutError):
+        with lock_file.LockFile(self.fn, 'w') as f3:
+          pass
+      
+      self.assertTrue(f1.read()=='Paul')
+    
+    before = lock_file.get_stats()
+    with lock_file.LockFile(self.fn, None):
+      pass
+    self.assertTrue(lock_file.get_stats()['locks']==before['locks']+1)
+  
+  
+  @unittest.skipIf(lock_file.fcntl==None, 'fcntl not available')
+  def test_flock_to_mkdir(self):
+    """Switching back to the mkdir backend after using flock deletes the lock file left behind, unless it is held."""
+    lock_path = os.path.join(self.root, '.lock_swan.txt')
+    lock_file.configure('flock', 0.05)
+    with lock_file.LockFile(self.fn, 'w') as f:
+      f.write('Paul')
+    
+    lock_file.configure(timeout = 0.05)
+    with lock_file.LockFile(self.fn, 'r') as f:
+      self.assertTrue(os.path.isdir(lock_path))
+      self.assertTrue(f.read()=='Paul')
+    self.assertTrue(os.listdir(self.root)==['swan.txt'])
+    
+    fd = os.open(lock_path, os.O_RDWR | os.O_CREAT)
+    try:
+      lock_file.fcntl.flock(fd, lock_file.fcntl.LOCK_SH)
+      with self.assertRaises(TimeoutError):
+        with lock_file.LockFile(self.fn, 'r') as f:
+          pass
+    finally:
+      os.close(fd)
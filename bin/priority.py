@@ -13,79 +13,393 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import time
+import heapq
+import threading
 
+from .fs_db import Node
 
-def true_priority(rfam, project, node, db = None, settings = None):
-  """Given the node for a json asset file this returns its priority, taking into account the relevant project settings."""
-  if settings==None:
-    settings = rfam.proj_defaults(project)['priority.json'].read()
+
+
+class PriorityEngine:
+  """The true priorities of every asset of a project, worked out in one go - an asset in a state that boosts gets the highest of its own priority and the true priorities of its dependencies plus the boost. Builds the graph of dependencies once and works through it in topological order, dependencies first, so shared dependencies are only done once. Dependencies that form a cycle do not boost each other, as that would never end; missing dependencies are ignored. Kept up to date by following the journal of the project FSDB, so an edit to a single asset only redoes the assets that depend on it, plus a full check of every file every cache period, to catch other processes. Thread safe. Files in directories for depreciated versions are not included."""
+  def __init__(self, rfam, project):
+    self.rfam = rfam
+    self.project = project
+    self.db = rfam.proj(project)
+    self.old = rfam.getLanguage()['old']
+    self.lock = threading.Lock()
+    
+    self.catalog = None # Catalog the priorities were worked out with - a new one means the settings or states may have changed, so everything is redone.
+    self.seq = None # Journal sequence number of the FSDB when last updated.
+    self.checked = None # When every file was last checked.
+    
+    # The graph - path of each asset -> its Node, contents, dependency paths (whether they exist or not), and the reverse, dependency path -> set of asset paths that depend on it...
+    self.nodes = dict()
+    self.metas = dict()
+    self.deps = dict()
+    self.dependents = dict()
+    
+    # The topological order - path -> (position, component), where position orders dependencies before the assets that depend on them and component is shared by assets in the same cycle...
+    self.order = dict()
+    
+    self.sizes = dict() # Component -> how many assets are in it.
+    self.next = 0 # Next free position.
+    
+    # The answer - path -> true priority...
+    self.values = dict()
+  
+  
+  def priority(self, path):
+    """Returns the true priority of the asset with the given path (tuple, including .json), or None if it is not an asset."""
+    with self.lock:
+      self.__update()
+      return self.values.get(tuple(path))
+  
+  
+  def owned(self, user):
+    """Returns a list of the Node-s of the assets owned by the given user, highest true priority first."""
+    with self.lock:
+      self.__update()
+      ret = [path for path, meta in self.metas.items() if meta['owner']==user]
+      ret.sort(key = lambda path: -self.values[path])
+      return [self.nodes[path] for path in ret]
+  
+  
+  def top(self):
+    """Returns a dictionary of user ident -> Node of the asset they own with the highest true priority."""
+    with self.lock:
+      self.__update()
+      best = dict()
+      for path, meta in self.metas.items():
+        owner = meta['owner']
+        if owner!=None and (owner not in best or self.values[best[owner]]<self.values[path]):
+          best[owner] = path
+      
+      return {owner : self.nodes[path] for owner, path in best.items()}
+  
+  
+  def __update(self):
+    """Brings everything up to date - the caller must hold the lock."""
+    catalog = self.rfam.catalog(self.project)
+    now = time.time()
+    
+    if catalog is not self.catalog or self.checked==None or (now - self.checked) >= self.rfam.config['cache']:
+      # Check every file, and redo everything if the settings changed...
+      seq = self.db.sequence()
+      changed = self.__check_all()
+      self.seq = seq
+      self.checked = now
+      
+      rebuild = catalog is not self.catalog
+      self.catalog = catalog
+      self.__apply(changed, rebuild)
+    
+    elif self.db.sequence()!=self.seq:
+      # Only check the files the journal says have changed...
+      seq = self.db.sequence()
+      journal = self.db.changes_since(self.seq)
+      self.seq = seq
+      
+      if journal==None:
+        self.__apply(self.__check_all())
+      
+      else:
+        self.__apply(self.__check_paths(set(path for _, kind, path in journal)))
+  
+  
+  def __read(self, node):
+    """Returns the contents of the given Node if it is an asset, None otherwise."""
+    try:
+      meta = node.read()
+    except (KeyError, OSError, TypeError, ValueError):
+      return None
+    
+    if meta==None or 'type' not in meta or 'owner' not in meta:
+      return None
+    return meta
+  
+  
+  def __check_all(self):
+    """Reads every asset, returning a list of (path, Node, contents) for those that have changed - contents is None if it has gone."""
+    seen = set()
+    ret = []
+    
+    for path, node in self.db.walk('.json', (self.old,)):
+      meta = self.__read(node)
+      if meta!=None:
+        seen.add(path)
+      if meta is not self.metas.get(path):
+        ret.append((path, node, meta))
+    
+    for path in self.metas.keys() - seen:
+      ret.append((path, None, None))
+    
+    return ret
   
-  meta = node.read()
-  ret = meta['priority']
-  state = rfam.getState(project, meta['state'])
   
-  if settings['boosting'] and state['boost']:
-    if db==None:
-      db = rfam.proj(project)
+  def __check_paths(self, paths):
+    """Reads the assets at or below the given paths, returning a list of changes as for __check_all."""
+    ret = []
+    done = set()
+    
+    for path in paths:
+      if self.old in path: continue
+      
+      try:
+        node = self.db[path]
+        kind = node.isa()
+      except KeyError:
+        node = None
+        kind = Node.DELETED
+      
+      # Find what is there now, and what was indexed - everything below the path if it is or was a directory...
+      found = dict()
+      if kind==Node.DIRECTORY:
+        for sub, child in node.walk('.json', (self.old,)):
+          found[sub] = child
       
+      elif kind==Node.FILE and path[-1].endswith('.json'):
+        found[path] = node
+      
+      if kind==Node.DIRECTORY or (kind==Node.DELETED and not path[-1].endswith('.json')):
+        n = len(path)
+        candidates = set(p for p in self.metas if p[:n]==path)
+      
+      else:
+        candidates = set([path]) if path in self.metas else set()
+      
+      for p in candidates | found.keys():
+        if p in done: continue
+        done.add(p)
+        
+        node = found.get(p)
+        meta = self.__read(node) if node!=None else None
+        if meta is not self.metas.get(p):
+          ret.append((p, node, meta))
+    
+    return ret
+  
+  
+  def __apply(self, changes, rebuild = False):
+    """Updates the graph and priorities with a list of changes, as returned by __check_all. Edits that keep the topological order valid are done incrementally, by redoing only the assets that depend on what changed, in order; anything else redoes everything, as does setting rebuild to True."""
+    if len(changes)==0 and not rebuild: return
+    
+    redo = set()
+    
+    for path, node, meta in changes:
+      old = self.metas.get(path)
+      
+      if meta==None:
+        # Asset gone - its dependents need redoing, unless it was part of a cycle, which could now be broken...
+        if old==None: continue
+        if self.sizes[self.order[path][1]]!=1:
+          rebuild = True
+        
+        redo.update(self.dependents.get(path, ()))
+        self.__remove(path)
+        continue
+      
+      deps = self.__deps(meta)
+      self.nodes[path] = node
+      self.metas[path] = meta
+      
+      if old==None:
+        # New asset - goes on the end of the order, unless something already depends on it, as that could make a cycle...
+        if len(self.dependents.get(path, ()))!=0:
+          rebuild = True
+        
+        self.__link(path, deps)
+        self.order[path] = (self.next, self.next)
+        self.sizes[self.next] = 1
+        self.next += 1
+      
+      elif deps!=self.deps[path]:
+        # Dependencies changed - fine as long as it is not in a cycle and they all come before it...
+        pos, comp = self.order[path]
+        if self.sizes[comp]!=1 or any(d in self.order and self.order[d][0]>=pos for d in deps):
+          rebuild = True
+        
+        self.__unlink(path)
+        self.__link(path, deps)
+      
+      redo.add(path)
+    
+    if rebuild:
+      self.__rebuild()
+    else:
+      self.__propagate(redo)
+  
+  
+  def __deps(self, meta):
+    """Returns the paths of the dependencies of an asset, as a tuple of tuples."""
+    ret = []
     for child in meta['dependencies']:
       path = child.split('/')
       path[-1] += '.json'
-      n = db[path]
+      ret.append(tuple(path))
+    return tuple(ret)
+  
+  
+  def __link(self, path, deps):
+    """Records the dependencies of an asset."""
+    self.deps[path] = deps
+    for d in deps:
+      self.dependents.setdefault(d, set()).add(path)
+  
+  
+  def __unlink(self, path):
+    """Removes the record of the dependencies of an asset."""
+    for d in self.deps.pop(path, ()):
+      users = self.dependents.get(d)
+      if users!=None:
+        users.discard(path)
+        if len(users)==0:
+          del self.dependents[d]
+  
+  
+  def __remove(self, path):
+    """Removes an asset that has gone."""
+    self.__unlink(path)
+    del self.nodes[path]
+    del self.metas[path]
+    del self.values[path]
+    
+    pos, comp = self.order.pop(path)
+    self.sizes[comp] -= 1
+    if self.sizes[comp]==0:
+      del self.sizes[comp]
+  
+  
+  def __rebuild(self):
+    """Redoes the topological order and every priority. Uses Tarjan's algorithm, with a stack rather than recursion, to find the cycles - it outputs them (each asset not in a cycle being one of its own) with dependencies first."""
+    self.order = dict()
+    self.sizes = dict()
+    self.values = dict()
+    
+    index = dict()
+    low = dict()
+    stack = []
+    on_stack = set()
+    count = 0
+    
+    def edges(path):
+      return iter([d for d in self.deps[path] if d in self.metas])
+    
+    for root in self.metas:
+      if root in index: continue
       
-      p = priority(rfam, project, n, db, settings)
-      p += settings['boost']
+      index[root] = low[root] = len(index)
+      stack.append(root)
+      on_stack.add(root)
+      work = [(root, edges(root))]
       
-      if p>ret:
-        ret = p
+      while len(work)!=0:
+        path, todo = work[-1]
+        
+        for d in todo:
+          if d not in index:
+            index[d] = low[d] = len(index)
+            stack.append(d)
+            on_stack.add(d)
+            work.append((d, edges(d)))
+            break
+          
+          elif d in on_stack:
+            low[path] = min(low[path], index[d])
+        
+        else:
+          work.pop()
+          if len(work)!=0:
+            parent = work[-1][0]
+            low[parent] = min(low[parent], low[path])
+          
+          if low[path]==index[path]:
+            # Found a component - assign it its place in the order...
+            comp = count
+            size = 0
+            while True:
+              member = stack.pop()
+              on_stack.discard(member)
+              self.order[member] = (count, comp)
+              count += 1
+              size += 1
+              if member==path: break
+            
+            self.sizes[comp] = size
+    
+    self.next = count
+    
+    # Work out the priorities, in order...
+    for path in sorted(self.order, key = lambda p: self.order[p][0]):
+      self.values[path] = self.__value(path)
+  
+  
+  def __propagate(self, paths):
+    """Redoes the priorities of the given assets, and of everything that depends on those that change, in topological order so each is done at most once."""
+    heap = [(self.order[p][0], p) for p in paths if p in self.metas]
+    heapq.heapify(heap)
+    queued = set(p for _, p in heap)
+    
+    while len(heap)!=0:
+      _, path = heapq.heappop(heap)
+      
+      value = self.__value(path)
+      if value==self.values.get(path): continue
+      self.values[path] = value
+      
+      for user in self.dependents.get(path, ()):
+        if user in self.metas and user not in queued:
+          queued.add(user)
+          heapq.heappush(heap, (self.order[user][0], user))
+  
+  
+  def __value(self, path):
+    """Returns the true priority of the given asset - the priorities of its dependencies must already be known."""
+    return self.__boost(self.metas[path], self.deps[path], self.order[path][1])
+  
+  
+  def __boost(self, meta, deps, comp):
+    """Returns the true priority of an asset with the given contents and dependencies, ignoring dependencies in the given component, if it is not None."""
+    ret = meta['priority']
+    settings = self.catalog.priority
+    state = self.catalog.states.get(meta['state'])
+    
+    if settings['boosting'] and state!=None and state['boost']:
+      for d in deps:
+        p = self.values.get(d)
+        if p!=None and (comp==None or self.order[d][1]!=comp):
+          p += settings['boost']
+          if p>ret:
+            ret = p
+    
+    return ret
+  
   
+  def estimate(self, meta):
+    """Returns the true priority of an asset that is not part of the graph, such as a depreciated version, given its contents - its dependencies are looked up in the graph."""
+    with self.lock:
+      self.__update()
+      return self.__boost(meta, self.__deps(meta), None)
+
+
+
+def true_priority(rfam, project, node):
+  """Given the node for a json asset file this returns its priority, taking into account the relevant project settings."""
+  engine = rfam.priorities(project)
+  ret = engine.priority(node.path())
+  if ret==None:
+    ret = engine.estimate(node.read())
   return ret
 
 
 
 def user_task_list(rfam, user, project):
   """Given a user (ident), a project (ident) and the rfam object this returns a list of fs_db nodes, in order from highest priority to lowest priority. The Node-s are for the .json objects rather than the actual files, as that is what is typically required in the first instance."""
-  
-  # First build a list of assets that are owned by the user...
-  ret = []
-  
-  db = rfam.proj(project)
-  old = rfam.getLanguage()['old']
-  
-  for path in db:
-    if old in path: continue # Skip depreciated versions of files.
-    node = db[path]
-    if node.isa()==node.FILE and path[-1].endswith('.json'):
-      meta = node.read()
-      if meta!=None and 'type' in meta and 'owner' in meta and meta['owner']==user:
-        ret.append(node)
-  
-  # Sort and return...
-  settings = rfam.proj_defaults(project)['priority.json'].read()
-  ret.sort(key = lambda node: -true_priority(rfam, project, node, db, settings))
-  return ret
+  return rfam.priorities(project).owned(user)
 
 
 
 def project_tasks(rfam, project):
   """Returns a dictionary indexed by user identifier giving the json Node of their highest priority task - basically a list of everything that is currently being worked on."""
-  ret = dict()
-  
-  db = rfam.proj(project)
-  settings = rfam.proj_defaults(project)['priority.json'].read()
-  old = rfam.getLanguage()['old']
-  
-  for path in db:
-    if old in path: continue # Skip depreciated versions of files.
-    node = db[path]
-    if node.isa()==node.FILE and path[-1].endswith('.json'):
-      meta = node.read()
-      if meta!=None and 'type' in meta and 'owner' in meta and meta['owner']!=None:
-        p = true_priority(rfam, project, node, db, settings)
-        if meta['owner'] not in ret or ret[meta['owner']][0]<p:
-          ret[meta['owner']] = (p, node)
-  
-  for key in ret.keys():
-    ret[key] = ret[key][1]
-  
-  return ret
+  return rfam.priorities(project).top()
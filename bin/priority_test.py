@@ -0,0 +1,137 @@
+#! /usr/bin/env python3
+# Copyright 2014 Tom SF Haines
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import os.path
+import json
+
+import unittest
+import tempfile
+
+from . import fs_db
+from . import fs_db_json
+from . import priority
+
+
+
+class FakeCatalog:
+  """Just the parts of a Catalog the priority engine uses."""
+  def __init__(self):
+    self.priority = {'low' : 0, 'high' : 10, 'boosting' : True, 'boost' : 1}
+    self.states = {'ns' : {'ident' : 'ns', 'boost' : True}, 'done' : {'ident' : 'done', 'boost' : False}}
+
+
+
+class FakeRFAM:
+  """Just the parts of RFAM the priority engine uses, for a single project."""
+  def __init__(self, db):
+    self.db = db
+    self.config = {'cache' : 60.0}
+    self.cat = FakeCatalog()
+    self.engine = priority.PriorityEngine(self, 'p')
+  
+  def proj(self, project):
+    return self.db
+  
+  def getLanguage(self, user = None):
+    return {'old' : 'old'}
+  
+  def catalog(self, project):
+    return self.cat
+  
+  def priorities(self, project):
+    return self.engine
+
+
+
+class TestPriority(unittest.TestCase):
+  """Tests the priority engine."""
+  def setUp(self):
+    self.temp_dir = tempfile.TemporaryDirectory()
+    self.root = self.temp_dir.name
+    
+    # A chain of assets, a <- b <- c (c depends on b, which depends on a), plus d on its own and an old version of a that depends on d...
+    os.mkdir(os.path.join(self.root, 'old'))
+    self.save('a', 8, 'ns', 'tom', [])
+    self.save('b', 2, 'ns', 'tom', ['a'])
+    self.save('c', 1, 'ns', 'sue', ['b'])
+    self.save('d', 5, 'done', 'sue', [])
+    self.save('old/a', 3, 'ns', 'tom', ['d'])
+    
+    self.db = fs_db.FSDB(self.root)
+    self.db.register(fs_db_json.JsonFileType())
+    self.rfam = FakeRFAM(self.db)
+  
+  
+  def tearDown(self):
+    self.temp_dir.cleanup()
+  
+  
+  def save(self, name, value, state, owner, deps):
+    with open(os.path.join(self.root, name + '.json'), 'w') as f:
+      json.dump({'type' : 'prop', 'priority' : value, 'state' : state, 'owner' : owner, 'dependencies' : deps}, f)
+  
+  
+  def edit(self, name, **kw):
+    node = self.db[name + '.json']
+    with node.lock():
+      meta = node.read_for_update()
+      meta.update(kw)
+      node.write(meta)
+  
+  
+  def true(self, name):
+    return priority.true_priority(self.rfam, 'p', self.db[(name + '.json').split('/')])
+  
+  
+  def test_boost(self):
+    """Checks priorities are boosted through chains of dependencies, but not for states that don't boost, and that old versions are estimated."""
+    self.assertTrue([self.true(n) for n in 'abcd']==[8, 9, 10, 5])
+    self.assertTrue(self.true('old/a')==6)
+  
+  
+  def test_tasks(self):
+    """Checks the task lists of users."""
+    self.assertTrue([n.name for n in priority.user_task_list(self.rfam, 'sue', 'p')]==['c.json', 'd.json'])
+    self.assertTrue({u : n.name for u, n in priority.project_tasks(self.rfam, 'p').items()}=={'tom' : 'b.json', 'sue' : 'c.json'})
+  
+  
+  def test_update(self):
+    """Checks edits are picked up, including those that change the dependencies, and adding and removing assets."""
+    self.assertTrue(self.true('c')==10)
+    
+    self.edit('a', priority=0)
+    self.assertTrue([self.true(n) for n in 'abcd']==[0, 2, 3, 5])
+    
+    self.edit('a', dependencies=['d'])
+    self.assertTrue([self.true(n) for n in 'abcd']==[6, 7, 8, 5])
+    
+    self.edit('b', state='done')
+    self.assertTrue([self.true(n) for n in 'abcd']==[6, 2, 3, 5])
+    
+    self.db.get_root().new('e.json', {'type' : 'prop', 'priority' : 9, 'state' : 'ns', 'owner' : None, 'dependencies' : ['c']})
+    self.assertTrue(self.true('e')==9)
+    
+    self.db['d.json'].remove()
+    self.assertTrue([self.true(n) for n in 'abc']==[0, 2, 3])
+  
+  
+  def test_cycle(self):
+    """Checks the assets in a cycle of dependencies do not boost each other, but still boost what depends on them."""
+    self.edit('a', dependencies=['c'])
+    self.db.get_root().new('e.json', {'type' : 'prop', 'priority' : 0, 'state' : 'ns', 'owner' : 'tom', 'dependencies' : ['b']})
+    
+    self.assertTrue([self.true(n) for n in 'abce']==[8, 2, 1, 3])
@@ -29,16 +29,17 @@ def role(rfam, response):
   
   # Terminate the new role entry...
   proj = rfam.proj(response.project)['project.json']
-  p = proj.read()
-  if ident in p['roles']:
-    rfam.log(response, 'remove_role(%s,%s)' % (p['roles'][ident]['role'], p['roles'][ident]['user']))
-    
-    del p['roles'][ident]
-    proj.write(p)
-    response.append('true')
-    
-  else:
-    response.append('false')
+  with proj.lock():
+    p = proj.read_for_update()
+    if ident in p['roles']:
+      rfam.log(response, 'remove_role(%s,%s)' % (p['roles'][ident]['role'], p['roles'][ident]['user']))
+      
+      del p['roles'][ident]
+      proj.write(p)
+      response.append('true')
+      
+    else:
+      response.append('false')
 
 
 
@@ -77,16 +78,17 @@ def ext_asset(rfam, response):
   
   # Terminate the new role entry...
   proj = rfam.proj(response.project)['project.json']
-  p = proj.read()
-  if ident in p['ext_assets']:
-    rfam.log(response, 'remove_external_asset(%s)' % ident)
-    
-    del p['ext_assets'][ident]
-    proj.write(p)
-    response.append('true')
-    
-  else:
-    response.append('false')
+  with proj.lock():
+    p = proj.read_for_update()
+    if ident in p['ext_assets']:
+      rfam.log(response, 'remove_external_asset(%s)' % ident)
+      
+      del p['ext_assets'][ident]
+      proj.write(p)
+      response.append('true')
+      
+    else:
+      response.append('false')
 
 
 
@@ -38,38 +38,33 @@ def app(rfam, response):
   job_list.sort(key=lambda job: job['project'] + job['name'])
   
   for job in job_list:
-    # Clean up any expired working jobs...
-    def keep_task(task):
-      # Actual test, with structure update...
+    # Skip over expired working jobs, counting them as they will be once the farm notices (the job is shared with the cache, so it is not edited here)...
+    todo = len(job['todo'])
+    errors = job['errors']
+    working_tasks = []
+    
+    for task in job['working']:
       if task[2]<too_old:
         if job['video']:
-          job['todo'] = [i for i in range(task[0][0], task[0][1]+1)]
-        else:
-          if rfam.jobs.retry:
-            job['todo'].append(task[0])
-          else:
-            job['failed'].append(task[0])
-        job['errors'] += 1
-        return False
+          todo = task[0][1] + 1 - task[0][0]
+        elif rfam.jobs.retry:
+          todo += 1
+        errors += 1
       
       else:
-        # This is somewhat abusive - record an index from node to task whilst filtering...
+        # Record an index from node to task whilst filtering...
         tasks[task[1]][job['name']].append(task[0])
-        
-        return True
-    
-    job['working'] = [task for task in job['working'] if keep_task(task)]
+        working_tasks.append(task)
     
     project = rfam.getProject(job['project'])['name']
     
     # Extract numbers for job...
-    todo = len(job['todo'])
     done = len(job['done'])
     
-    if job['video'] and len(job['working'])!=0:
-      working = job['working'][0][0][1] + 1 - job['working'][0][0][0] - done
+    if job['video'] and len(working_tasks)!=0:
+      working = working_tasks[0][0][1] + 1 - working_tasks[0][0][0] - done
     else:
-      working = len(job['working'])
+      working = len(working_tasks)
     
     total = todo + working + done
     if total>0:
@@ -94,7 +89,7 @@ def app(rfam, response):
       else:
         control = rfam.template('jobs.control.working', {}, response)
     
-    payload = {'uuid' : job['uuid'], 'project' : project, 'name' : job['name'], 'errors' : str(job['errors']), 'mft' : mft, 'todo' : todo, 'working' : working, 'done' : done, 'total' : total, 'percent' : percent, 'priority' : priority, 'control' : control}
+    payload = {'uuid' : job['uuid'], 'project' : project, 'name' : job['name'], 'errors' : str(errors), 'mft' : mft, 'todo' : todo, 'working' : working, 'done' : done, 'total' : total, 'percent' : percent, 'priority' : priority, 'control' : control}
     
     # Generate the row...
     html = rfam.template('jobs.row', payload, response)
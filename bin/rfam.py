@@ -19,12 +19,19 @@ import json
 import time
 import datetime
 import logging
+import hashlib
+import atexit
+import threading
 
 import xml.sax.saxutils as saxutils
 
 from .templates import Templates
-from .fs_db import FSDB
+from .fs_db import FSDB, set_memory_budget, memory_stats, enable_broadcast
 from .fs_db_json import JsonFileType
+from .asset_index import AssetIndex
+from .catalog import Catalog, Choice
+from .priority import PriorityEngine
+from . import lock_file
 
 from .jobs import Jobs
 
@@ -48,16 +55,33 @@ class RFAM:
         
         self.paths[path['ident']] = path['path']
     
-    # Use it to prepare the other fsdb databases for the projects and users directories, include a timer so we don't query these databases too often...
-    self.projects = FSDB(self.config['projects'], self.config['single_proc'])
-    self.projects.register(JsonFileType())
+    # Configure file locking and the memory budget, which all of the fsdb databases share...
+    lock_file.configure(self.config.get('lock', 'mkdir'), self.config.get('lock_timeout', None), self.config.get('lock_stale', 300.0))
+    
+    if self.config.get('memory_budget', None)!=None:
+      set_memory_budget(int(self.config['memory_budget'] * 1024 * 1024))
+    
+    # If several processes are serving then they tell each other about the changes they make, so none of them serves stale listings...
+    if self.config.get('broadcast', None)!=None:
+      enable_broadcast(self.config['broadcast'])
+    
+    # One json file type is shared by every fsdb database, so they share the parsed cache, if enabled...
+    self.json_type = JsonFileType(self.config.get('parse_cache', None))
     
-    self.users = FSDB(self.config['users'], self.config['single_proc'])
-    self.users.register(JsonFileType())
+    # Use it to prepare the other fsdb databases for the projects and users directories, include a timer so we don't query these databases too often...
+    self.projects = self.fsdb(self.config['projects'])
+    self.users = self.fsdb(self.config['users'])
 
-    # Record a last refreshed time, so it knows when to check for user/project datastore changes...
+    # Record a last refreshed time, so it knows when to check for user/project datastore changes - the indices are updated by one thread at a time and swapped in whole, so other threads can keep using the old ones. Also kept are the contents of each file that went into the indices, so only those that have changed since are reindexed, and the journal sequence numbers of the fsdb databases when they were last checked, so changes made through them are picked up straight away...
     self.ident_to_project = {}
+    self.ident_to_user = None
+    self.user_index = (None, dict()) # (ident_to_user, its inverted index - project ident -> (tuple of user idents in order, frozenset of the same)), swapped in as one so a thread never gets one without the other.
+    self.project_files = dict() # File name -> contents, as returned by read.
+    self.user_files = dict()
+    self.projects_seq = None
+    self.users_seq = None
     self.last_refresh = time.time() - self.config['cache']
+    self.refresh_lock = threading.Lock()
         
     # We load language dictionaries as needed...
     self.languages = dict()
@@ -65,15 +89,33 @@ class RFAM:
     # Initialise the templates system...
     self.templates = Templates(self.config['templates'], self.getLanguage)
     
-    # The file system 'databases' for each project - this is where the magic occurs...
+    # The file system 'databases' for each project - this is where the magic occurs. The lock protects the dictionaries, not the FSDB objects, which look after themselves...
+    self.dbs_lock = threading.RLock()
     self.dbs = dict()
+    self.dbs_used = dict() # When each project was last used, so idle ones can be dropped.
     
     # The defaults used by projects when creating files, and other stuff...
     self.dbs_defaults = dict()
     
+    # The shared indices of the assets of each project, if enabled...
+    self.indices = dict()
+    
+    # The catalog of the defaults of each project, rebuilt when they change...
+    self.catalogs = dict()
+    
+    # The priority engine of each project, made when first needed...
+    self.engines = dict()
+    
+    # The user choices of each project, as (project, unowned text) -> (ident_to_user they were made from, Choice)...
+    self.user_choices = dict()
+    
     # Job queue used for the render farm...
     self.jobs = Jobs(self)
     
+    # Make sure the snapshots are saved and pending writes flushed when the server shuts down (flush runs first)...
+    atexit.register(self.save_snapshots)
+    atexit.register(self.flush)
+    
     # Setup logging...
     if 'log' in self.config:
       fn = self.config['log'] % {'pid' : str(os.getpid())}
@@ -84,6 +126,13 @@ class RFAM:
       
       form = '%(asctime)s | %(message)s'
       logging.basicConfig(filename=fn, level=logging.DEBUG, format=form)
+    
+    # Optionally do the periodic refresh in a background thread, so no request has to wait for it...
+    self.refresher = None
+    if self.config.get('background_refresh', False):
+      self.__refresh()
+      self.refresher = threading.Thread(target=self.__refresher, name='refresh', daemon=True)
+      self.refresher.start()
 
 
   def development(self):
@@ -106,6 +155,57 @@ class RFAM:
     return os.path.join(self.paths[head], tail)
   
   
+  def fsdb(self, path):
+    """Returns a new FSDB for the given directory, configured as the main configuration file requests and with the json file type registered."""
+    ret = FSDB(path, self.config['single_proc'], self.config.get('watch', False), self.config.get('atomic', False), self.config.get('frozen', False))
+    ret.register(self.json_type)
+    ret.set_trust_window(self.config.get('trust', 0.0))
+    
+    if 'snapshots' in self.config:
+      name = hashlib.sha1(os.path.abspath(path).encode('utf8')).hexdigest() + '.json'
+      ret.load_snapshot(os.path.join(self.config['snapshots'], name))
+    
+    return ret
+  
+  
+  def all_fsdb(self):
+    """Returns a list of every FSDB object currently in use."""
+    ret = [self.projects, self.users, self.jobs.jobs, self.jobs.nodes]
+    with self.dbs_lock:
+      ret += list(self.dbs.values())
+      ret += list(self.dbs_defaults.values())
+    return ret
+  
+  
+  def fsdb_stats(self):
+    """Returns the statistics of all the FSDB objects in use summed together, as a dictionary - see FSDB.stats()."""
+    ret = dict()
+    for db in self.all_fsdb():
+      for key, value in db.stats().items():
+        ret[key] = ret.get(key, 0) + value
+    return ret
+  
+  
+  def flush(self):
+    """Writes any pending writes of every FSDB, for those in write-behind mode."""
+    for db in self.all_fsdb():
+      try:
+        db.flush()
+      except OSError as e:
+        logging.warning('Failed to flush writes for %s: %s' % (db.root, str(e)))
+  
+  
+  def save_snapshots(self):
+    """Saves a snapshot of every FSDB that has changed since it was last saved, so a restarted server can start quickly. Does nothing if snapshots are not enabled."""
+    if 'snapshots' not in self.config: return
+    
+    for db in self.all_fsdb():
+      try:
+        db.save_snapshot()
+      except OSError as e:
+        logging.warning('Failed to save snapshot for %s: %s' % (db.root, str(e)))
+  
+  
   def getLogoPath(self):
     """Returns the path to the logo"""
     return self.config['logo']
@@ -147,35 +247,136 @@ class RFAM:
     
   
   def __refresh(self):
-    """We rebuild indices as needed - don't want to do so too often as it gets expensive."""
+    """Keeps the indices up to date - called by every method that uses them. Changes made through the users and projects fsdb databases are indexed straight away, by following their journals; every cache period every file is checked for changes made by other processes and some housekeeping done, unless the background thread is doing that. Either way only files that have changed are reindexed. Only one thread does so at a time; the others carry on with the old indices, unless there are none yet, in which case they wait."""
     now = time.time()
-    if now >= (self.last_refresh + self.config['cache']):
-      self.last_refresh = now
-      
-      prev = self.ident_to_project
-      self.ident_to_project = dict()
-      projects = self.projects.get_root()
-      for project in projects:
-        if project.endswith('.json'):
-          project = projects[project].read()
-          self.ident_to_project[project['ident']] = project
-          
-          if project['ident'] in prev:
-            if prev[project['ident']]['directory'] != project['directory']:
-              del self.dbs[project['ident']]
-
-            del prev[project['ident']]
-      
-      for key in prev.keys():
-        if key in self.dbs: del self.dbs[key]
-        if key in self.dbs_defaults: del self.dbs_defaults[key]
-    
-      self.ident_to_user = dict()
-      users = self.users.get_root()
-      for user in users:
-        if user.endswith('.json'):
-          user = users[user].read()
-          self.ident_to_user[user['ident']] = user
+    if self.ident_to_user!=None and not self.__refresh_due(now): return
+    
+    if not self.refresh_lock.acquire(self.ident_to_user==None): return
+    try:
+      if self.ident_to_user!=None and not self.__refresh_due(now): return # Another thread did it whilst this one waited.
+      
+      if self.ident_to_user==None or (self.refresher==None and now >= (self.last_refresh + self.config['cache'])):
+        self.__housekeeping(now)
+        self.__reindex(True)
+      
+      else:
+        self.__reindex(False)
+    
+    finally:
+      self.refresh_lock.release()
+  
+  
+  def __refresh_due(self, now):
+    """Returns True if __refresh has something to do."""
+    if self.projects.sequence()!=self.projects_seq or self.users.sequence()!=self.users_seq: return True
+    return self.refresher==None and now >= (self.last_refresh + self.config['cache'])
+  
+  
+  def __refresher(self):
+    """Body of the background thread - does the periodic refresh every cache period."""
+    while True:
+      time.sleep(self.config['cache'])
+      
+      try:
+        with self.refresh_lock:
+          self.__housekeeping(time.time())
+          self.__reindex(True)
+      
+      except Exception:
+        logging.exception('Background refresh failed')
+  
+  
+  def __housekeeping(self, now):
+    """The jobs that are done once every cache period - saving snapshots, logging statistics and dropping projects nobody is using."""
+    self.last_refresh = now
+    
+    self.save_snapshots()
+    logging.debug('fsdb stats: %s' % ', '.join('%s=%i' % pair for pair in sorted(self.fsdb_stats().items())))
+    logging.debug('lock stats: %s' % ', '.join('%s=%g' % pair for pair in sorted(lock_file.get_stats().items())))
+    logging.debug('memory stats: %s' % ', '.join('%s=%i' % pair for pair in sorted(memory_stats().items())))
+    if self.json_type.cache_dir!=None:
+      logging.debug('parse cache: hits=%i, misses=%i' % (self.json_type.cache_hits, self.json_type.cache_misses))
+    
+    # Drop the caches of projects that nobody has looked at for a while...
+    if self.config.get('project_idle', None)!=None:
+      with self.dbs_lock:
+        idle = [ident for ident, used in self.dbs_used.items() if (now - used) > self.config['project_idle']]
+      for ident in idle:
+        self.drop_proj(ident)
+  
+  
+  def __reindex(self, full):
+    """Updates the indices of users and projects - if full is True every file is checked for changes, otherwise only those the journals of the fsdb databases say have changed. The caller must hold the refresh lock."""
+    changes, self.projects_seq, self.project_files, self.ident_to_project = self.__reindex_db(self.projects, self.projects_seq, self.project_files, self.ident_to_project, full)
+    
+    # Drop the caches of projects that have gone or moved...
+    for old, new in changes:
+      if old!=None and (new==None or new['ident']!=old['ident'] or new['directory']!=old['directory']):
+        self.drop_proj(old['ident'])
+    
+    changes, self.users_seq, self.user_files, ident_to_user = self.__reindex_db(self.users, self.users_seq, self.user_files, self.ident_to_user if self.ident_to_user!=None else dict(), full)
+    
+    if ident_to_user is not self.ident_to_user:
+      self.user_index = (ident_to_user, self.__invert_users(ident_to_user))
+      self.ident_to_user = ident_to_user
+  
+  
+  def __invert_users(self, ident_to_user):
+    """Returns the inverted index of the given ident_to_user, as stored in user_index."""
+    members = dict()
+    for ident, user in ident_to_user.items():
+      for project in user['projects']:
+        members.setdefault(project, set()).add(ident)
+    
+    return {project : (tuple(sorted(idents)), frozenset(idents)) for project, idents in members.items()}
+  
+  
+  def __reindex_db(self, db, seq, files, index, full):
+    """Does the work of __reindex for one fsdb database, of .json files that each contain an 'ident'. seq is the journal sequence number of the last update, files the dictionary of file name -> contents indexed and index the dictionary of ident -> contents. Returns (list of (old contents, new contents) for the files that changed, with None for added or removed files, new seq, new files, new index), where files and index are copies if anything changed, so threads using the old ones are not disturbed."""
+    root = db.get_root()
+    new_seq = db.sequence()
+    
+    names = None
+    if not full:
+      journal = db.changes_since(seq) if seq!=None else None
+      if journal!=None:
+        names = set(path[0] for _, kind, path in journal if len(path)==1 and path[0].endswith('.json'))
+    
+    if names==None:
+      names = set(name for name in root if name.endswith('.json'))
+      names.update(files.keys()) # So removed files are noticed.
+    
+    # Read them all, noting which have changed - read returns the same object if the file has not changed...
+    changes = []
+    for name in names:
+      try:
+        data = root[name].read()
+      except (KeyError, OSError, TypeError):
+        data = None
+      
+      old = files.get(name)
+      if data is not old:
+        changes.append((name, old, data))
+    
+    if len(changes)==0:
+      return [], new_seq, files, index
+    
+    # Update copies of the dictionaries...
+    files = dict(files)
+    index = dict(index)
+    
+    for name, old, data in changes:
+      if old!=None:
+        del files[name]
+        if index.get(old['ident']) is old:
+          del index[old['ident']]
+    
+    for name, old, data in changes:
+      if data!=None:
+        files[name] = data
+        index[data['ident']] = data
+    
+    return [(old, data) for name, old, data in changes], new_seq, files, index
 
 
   def getProjects(self):
@@ -196,23 +397,69 @@ class RFAM:
   def proj(self, ident):
     """Given the identifier of a project this returns a FSDB object representing it - it is through this that all data access occurs."""
     self.__refresh()
-    if ident not in self.dbs:
-      p = self.getProject(ident)
-      path = self.real(p['directory'])
+    with self.dbs_lock:
+      self.dbs_used[ident] = time.time()
+      
+      if ident not in self.dbs:
+        p = self.ident_to_project.get(ident)
+        path = self.real(p['directory'])
+        
+        if not os.path.exists(path):
+          os.makedirs(path)
+        
+        self.dbs[ident] = self.fsdb(path)
+      
+      return self.dbs[ident]
+  
+  
+  def drop_proj(self, ident):
+    """Drops the FSDB objects of the given project, so the memory they use is released - they are recreated if the project is used again. A thread that is still using one can carry on, as a closed FSDB still works."""
+    with self.dbs_lock:
+      if ident in self.dbs:
+        self.dbs[ident].close()
+        del self.dbs[ident]
+      
+      if ident in self.dbs_defaults:
+        self.dbs_defaults[ident].close()
+        del self.dbs_defaults[ident]
+      
+      if ident in self.indices:
+        self.indices[ident].close()
+        del self.indices[ident]
       
-      if not os.path.exists(path):
-        os.makedirs(path)
+      if ident in self.catalogs:
+        del self.catalogs[ident]
       
-      self.dbs[ident] = FSDB(path, self.config['single_proc'])
-      self.dbs[ident].register(JsonFileType())
+      if ident in self.engines:
+        del self.engines[ident]
+      
+      for key in [key for key in self.user_choices if key[0]==ident]:
+        del self.user_choices[key]
+      
+      if ident in self.dbs_used:
+        del self.dbs_used[ident]
+  
+  
+  def indexed_assets(self, ident):
+    """Returns a list of asset_index.Asset, one for every asset of the given project, from the index shared between processes, so no .json files need to be parsed. Returns None if the index is not enabled or can not be used right now, in which case the caller has to go through the FSDB."""
+    if self.config.get('index', None)==None: return None
     
-    return self.dbs[ident]
+    db = self.proj(ident)
+    with self.dbs_lock:
+      index = self.indices.get(ident)
+      if index==None:
+        name = hashlib.sha1(os.path.abspath(db.root).encode('utf8')).hexdigest() + '.idx'
+        index = AssetIndex(os.path.join(self.config['index'], name), db, self.config['cache'], (self.getLanguage()['old'],))
+        self.indices[ident] = index
+    
+    return index.assets()
   
   
   def proj_defaults(self, ident):
     """Given the identifier of a project this returns a FSDB object for its defaults directory - this is the configuration information that gives details like types, states and priorities."""
     self.__refresh()
-    if ident not in self.dbs_defaults:
+    ret = self.dbs_defaults.get(ident)
+    if ret==None:
       db = self.proj(ident)
       if 'project.json' in db:
         default = db['project.json'].read()['default']
@@ -221,23 +468,58 @@ class RFAM:
       
       path = os.path.join(self.config['defaults'], default)
       
-      self.dbs_defaults[ident] = FSDB(path, self.config['single_proc'])
-      self.dbs_defaults[ident].register(JsonFileType())
+      with self.dbs_lock:
+        ret = self.dbs_defaults.get(ident)
+        if ret==None:
+          ret = self.fsdb(path)
+          self.dbs_defaults[ident] = ret
     
-    return self.dbs_defaults[ident]
+    return ret
+  
+  
+  def catalog(self, ident):
+    """Given the identifier of a project returns the Catalog of its defaults - the asset types, states and priority configuration, already read and indexed. It is rebuilt when the defaults change, and every cache period in case another process changed them."""
+    ddb = self.proj_defaults(ident)
+    
+    with self.dbs_lock:
+      ret = self.catalogs.get(ident)
+    
+    if ret==None or not ret.current(ddb, self.config['cache']):
+      ret = Catalog(ddb) # Outside the lock - two threads could both build one, but that is harmless.
+      with self.dbs_lock:
+        self.catalogs[ident] = ret
+    
+    return ret
+  
+  
+  def priorities(self, ident):
+    """Given the identifier of a project returns its PriorityEngine, which knows the true priority of every asset."""
+    with self.dbs_lock:
+      ret = self.engines.get(ident)
+      if ret==None:
+        ret = PriorityEngine(self, ident)
+        self.engines[ident] = ret
+    
+    return ret
   
   
   def set_proj_defaults(self, ident, default):
     # Update record...
     db = self.proj(ident)
     proj = db['project.json']
-    p = proj.read()
-    p['default'] = default
-    proj.write(p)
+    with proj.lock():
+      p = proj.read_for_update()
+      p['default'] = default
+      proj.write(p)
     
     # Clear cache...
-    if ident in self.dbs_defaults:
-      del self.dbs_defaults[ident]
+    with self.dbs_lock:
+      if ident in self.dbs_defaults:
+        self.dbs_defaults[ident].close()
+        del self.dbs_defaults[ident]
+      
+      if ident in self.catalogs:
+        del self.catalogs[ident]
 
 
   def getUsers(self):
@@ -256,13 +538,16 @@ class RFAM:
   
   
   def getUsersByProject(self, ident):
-    """Returns a list of all users on the given project."""
+    """Returns a list of all users on the given project, sorted by ident."""
     self.__refresh()
-    
-    def on_proj(user):
-      return ident in self.ident_to_user[user]['projects']
-      
-    return list(filter(on_proj, self.ident_to_user.keys()))
+    return list(self.user_index[1].get(ident, ((), frozenset()))[0])
+  
+  
+  def isUserOnProject(self, project, user):
+    """Returns True if the given user is on the given project."""
+    self.__refresh()
+    members = self.user_index[1].get(project)
+    return members!=None and user in members[1]
   
   
   def template(self, name, dic, response):
@@ -272,40 +557,17 @@ class RFAM:
   
   def types(self, project):
     """Returns a list of type identifiers for the given project."""
-    ddb = self.proj_defaults(project)
-    
-    ret = []
-    for child in filter(lambda n: n.endswith('.json'), ddb['asset_types']):
-      targ = ddb['asset_types', child].read()
-      ret.append(targ['ident'])
-      
-    return ret
+    return list(self.catalog(project).types)
   
   
   def getType(self, project, ident):
     """Given the identifier of a type returns its type data structure (A dictionary loaded form the related json file.), or None if not recognised."""
-    ddb = self.proj_defaults(project)
-    
-    for child in filter(lambda n: n.endswith('.json'), ddb['asset_types']):
-      targ = ddb['asset_types', child].read()
-    
-      if targ['ident']==ident:
-        return targ
-
-    return None
+    return self.catalog(project).types.get(ident)
 
 
   def getState(self, project, ident):
     """Given the identifier of a state returns its data structure (A dictionary loaded form the related json file.), or None if not recognised."""
-    ddb = self.proj_defaults(project)
-    
-    for child in filter(lambda n: n.endswith('.json'), ddb['states']):
-      targ = ddb['states', child].read()
-    
-      if targ['ident']==ident:
-        return targ
-
-    return None
+    return self.catalog(project).states.get(ident)
   
   
   def defaultChoice(self, selected = None):
@@ -320,78 +582,75 @@ class RFAM:
   
   def typeChoice(self, project, selected = None):
     """Returns a string that can be dumped into a select statement - basically a list of asset types that are valid for the given project. You can optionally provide a type ident to be selected by default"""
-    ddb = self.proj_defaults(project)
+    catalog = self.catalog(project)
     
-    ret = []
-    for child in filter(lambda n: n.endswith('.json'), ddb['asset_types']):
-      at = ddb['asset_types', child].read()
-      sel = 'selected' if selected==at['ident'] else ''
-      ext = ('.' + at['file'].split('.')[-1]) if 'file' in at else ''
+    def make():
+      ret = []
+      for at in catalog.types.values():
+        ext = ('.' + at['file'].split('.')[-1]) if 'file' in at else ''
+        ret.append((at['sort'], at['ident'], '<option ', ' data-dir="%s" data-ext="%s" value="%s">%s</option>' % (at['directory'], ext, at['ident'], saxutils.escape(at['name']))))
+      
+      return Choice(option[1:] for option in sorted(ret, key=lambda o: (o[0], o[3])))
     
-      ret.append((at['sort'], '<option %s data-dir="%s" data-ext="%s" value="%s">%s</option>' % (sel, at['directory'], ext, at['ident'], saxutils.escape(at['name']))))
-  
-    ret = ''.join(map(lambda c: c[1], sorted(ret)))
-    return ret
+    return catalog.memo('type', make).render(selected)
 
 
   def userChoice(self, project, selected = None, inc_unowned = False, user = None):
     """Returns a string that can be dumped into a select statement - basically a list of choices for all the users on the given project. You can optionally provide a user ident to be selected by default, and if you set inc_unowned to True you get an 'Unowned' entry in the list, which will be selected by default if selected is set to None."""
-    def make_option(ident):
-      user = self.getUser(ident)
-      sel = 'selected' if selected==ident else ''
-      return '<option %s value="%s">%s</option>' % (sel, ident, saxutils.escape(user['name']))
-    
-    users = self.getUsersByProject(project)
-    lines = map(make_option, users)
-    
-    if inc_unowned:
-      line = '<option value="">%s</option>' % self.getLanguage(user)['unowned']
-      lines = [line] + list(lines)
+    self.__refresh()
+    ident_to_user, project_to_users = self.user_index
+    users = project_to_users.get(project, ((), frozenset()))[0]
+    unowned = self.getLanguage(user)['unowned'] if inc_unowned else None
+    
+    key = (project, unowned)
+    made = self.user_choices.get(key)
+    if made==None or made[0] is not ident_to_user:
+      def make_option(ident):
+        return (ident, '<option ', ' value="%s">%s</option>' % (ident, saxutils.escape(ident_to_user[ident]['name'])))
+      
+      options = list(map(make_option, users))
+      if inc_unowned:
+        options.insert(0, (None, '<option', ' value="">%s</option>' % unowned))
+      
+      made = (ident_to_user, Choice(options))
+      with self.dbs_lock:
+        self.user_choices[key] = made
     
-    return ''.join(lines)
+    return made[1].render(selected)
   
   
   def stateChoice(self, project, at, selected):
     """Returns a string to go in a select html element of the states for an asset - you need to provide the project, and the asset type as they both influence the list, as well as which one is selected."""
+    catalog = self.catalog(project)
     
-    # Obtain the type object of the provided ident, use it to create an output list...
-    at = self.getType(project, at)
-    ret = [None] * len(at['states'])
-    
-    # Iterate the states and insert them in their correct positions...
-    ddb = self.proj_defaults(project)
-    for name in filter(lambda n: n.endswith('.json'), ddb['states']):
-      state = ddb['states', name].read()
-      try:
-        pos = at['states'].index(state['ident'])
-        sel = 'selected' if selected==state['ident'] else ''
-        ret[pos] = '<option %s value="%s">%s</option>' % (sel, state['ident'], saxutils.escape(state['name']))
-      
-      except ValueError:
-        pass # State not supported by this type.
+    def make():
+      return Choice((state['ident'], '<option ', ' value="%s">%s</option>' % (state['ident'], saxutils.escape(state['name']))) for state in catalog.type_states[at])
     
-    # Return it...
-    return ''.join(ret)
+    return catalog.memo(('state', at), make).render(selected)
     
     
   def priorityInterface(self, project, value):
     """Returns a html element string for the priority selection of an asset - will either be an input or select depending on the configuration options of the project."""
-    config = self.proj_defaults(project)['priority.json'].read()
-    if 'names' in config and isinstance(config['names'], list):
+    catalog = self.catalog(project)
+    config = catalog.priority
+    low = config['low']
+    high = config['high']
+    
+    if 'names' in config and isinstance(config['names'], (list, tuple)):
       # Dropdown dialog of choices...
-      low = config['low']
-      high = config['high']
       names = config['names']
       selected = int((len(names) -1) * ((value-low) / float(high-low)) + 0.5)
       
-      ret = []
-      div = len(names) - 1.0
-      for pos, name in enumerate(names):
-        val = int(low + (high-low) * (pos / div))
-        sel = 'selected' if pos==selected else ''
-        ret.append('<option %s value="%i">%s</option>' % (sel, val, name))
+      def make():
+        ret = []
+        div = len(names) - 1.0
+        for pos, name in enumerate(names):
+          val = int(low + (high-low) * (pos / div))
+          ret.append((pos, '<option ', ' value="%i">%s</option>' % (val, name)))
+        
+        return Choice(ret)
       
-      return '<select>' + ''.join(ret) + '</select>'
+      return '<select>' + catalog.memo('priority', make).render(selected) + '</select>'
     
     else:
       # Numeric input...
@@ -0,0 +1,105 @@
+#! /usr/bin/env python3
+# Copyright 2014 Tom SF Haines
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import os.path
+import sys
+import json
+
+import unittest
+import tempfile
+
+from . import rfam
+
+
+
+class TestRFAM(unittest.TestCase):
+  """Tests the indices RFAM keeps of the users and projects."""
+  def setUp(self):
+    self.temp_dir = tempfile.TemporaryDirectory()
+    self.root = self.temp_dir.name
+    base = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    
+    # A minimal installation - one project, with two users...
+    for name in ('paths', 'projects', 'users'):
+      os.mkdir(os.path.join(self.root, name))
+    
+    # The shipped configuration, without logging and using the languages and templates of this repository...
+    with open(os.path.join(base, 'config.json'), 'r') as f:
+      config = json.load(f)
+    config.pop('log', None)
+    for key in ('languages', 'templates'):
+      config[key] = os.path.join(base, config[key])
+    self.save('config.json', config)
+    self.save('projects/p.json', {'ident' : 'p', 'name' : 'Penguins', 'directory' : 'data::p'})
+    self.save('users/tom.json', {'ident' : 'tom', 'name' : 'Tom', 'projects' : ['p'], 'language' : 'english'})
+    self.save('users/sue.json', {'ident' : 'sue', 'name' : 'Sue', 'projects' : ['p'], 'language' : 'english'})
+    
+    self.cwd = os.getcwd()
+    os.chdir(self.root)
+    self.rfam = rfam.RFAM()
+  
+  
+  def tearDown(self):
+    os.chdir(self.cwd)
+    self.temp_dir.cleanup()
+  
+  
+  def save(self, fn, data):
+    """Helper - writes a json file, relative to the installation."""
+    with open(os.path.join(self.root, fn), 'w') as f:
+      json.dump(data, f)
+  
+  
+  def test_users(self):
+    """Checks the users of a project, including after one is added through the users fsdb."""
+    self.assertTrue(self.rfam.getUsersByProject('p')==['sue', 'tom'])
+    self.assertTrue(self.rfam.isUserOnProject('p', 'tom'))
+    self.assertFalse(self.rfam.isUserOnProject('p', 'ann'))
+    
+    self.rfam.users.get_root().new('ann.json', {'ident' : 'ann', 'name' : 'Ann', 'projects' : ['p'], 'language' : 'english'})
+    self.assertTrue(self.rfam.getUsersByProject('p')==['ann', 'sue', 'tom'])
+    self.assertTrue(self.rfam.isUserOnProject('p', 'ann'))
+    self.assertTrue('>Ann</option>' in self.rfam.userChoice('p'))
+  
+  
+  def test_user_choice_reindex(self):
+    """Checks that userChoice copes with the users being reindexed part way through, as happens when another thread does so - a user is added or removed before every line it runs."""
+    root = self.rfam.users.get_root()
+    
+    def toggle():
+      if 'ann.json' in root:
+        root['ann.json'].remove()
+      else:
+        root.new('ann.json', {'ident' : 'ann', 'name' : 'Ann', 'projects' : ['p'], 'language' : 'english'})
+      self.rfam.getUsers()
+    
+    code = rfam.RFAM.userChoice.__code__
+    def trace(frame, event, arg):
+      if frame.f_code is not code: return None
+      
+      def line(frame, event, arg):
+        if event=='line': toggle()
+        return line
+      return line
+    
+    previous = sys.gettrace()
+    sys.settrace(trace)
+    try:
+      for _ in range(4):
+        self.rfam.userChoice('p', 'tom', True)
+    finally:
+      sys.settrace(previous)
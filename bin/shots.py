@@ -37,24 +37,21 @@ def app(rfam, response):
   old = rfam.getLanguage(response.user)['old']
   
   ident = 0
-  for path in db:
-    if old in path: continue # Skip depreciated versions of files.
-    node = db[path]
-    if node.isa()==node.FILE and path[-1].endswith('.json'):
-      meta = node.read()
-      if meta==None or ('type' not in meta) or ('owner' not in meta):
-        continue
-      if not meta['render']:
-        continue
-      
-      owner = rfam.userChoice(response.project, meta['owner'], True)
-      rating = int(meta['rating']) if 'rating' in meta else 0
-      pipeline = meta['pipeline'] if 'pipeline' in meta else 'wait'
-      
-      payload = {'id' : str(ident), 'path' : attr_escape(('/'.join(path))[:-5]), 'name' : meta['name'], 'owner' : owner, 'r1' : 'on' if rating>=1 else 'off', 'r2' : 'on' if rating>=2 else 'off', 'r3' : 'on' if rating>=3 else 'off', 'r4' : 'on' if rating>=4 else 'off', 'r5' : 'on' if rating>=5 else 'off', 'pipeline' : pipeline}
-      shots.append((meta['name'], rfam.template('shots.row', payload, response)))
-      
-      ident += 1
+  for path, node in db.walk('.json', (old,)): # Skip depreciated versions of files.
+    meta = node.read()
+    if meta==None or ('type' not in meta) or ('owner' not in meta):
+      continue
+    if not meta['render']:
+      continue
+    
+    owner = rfam.userChoice(response.project, meta['owner'], True)
+    rating = int(meta['rating']) if 'rating' in meta else 0
+    pipeline = meta['pipeline'] if 'pipeline' in meta else 'wait'
+    
+    payload = {'id' : str(ident), 'path' : attr_escape(('/'.join(path))[:-5]), 'name' : meta['name'], 'owner' : owner, 'r1' : 'on' if rating>=1 else 'off', 'r2' : 'on' if rating>=2 else 'off', 'r3' : 'on' if rating>=3 else 'off', 'r4' : 'on' if rating>=4 else 'off', 'r5' : 'on' if rating>=5 else 'off', 'pipeline' : pipeline}
+    shots.append((meta['name'], rfam.template('shots.row', payload, response)))
+    
+    ident += 1
   
   shots.sort()
   shots = '\n'.join([shot[1] for shot in shots])
@@ -40,7 +40,7 @@ def asset(rfam, response):
     response.make418()
     return
     
-  if key=='owner' and value!='' and value not in rfam.getUsersByProject(response.project):
+  if key=='owner' and value!='' and not rfam.isUserOnProject(response.project, value):
     response.make418()
     return
   if key=='owner' and value=='':
@@ -49,12 +49,12 @@ def asset(rfam, response):
   if key=='priority':
     value = int(value)
     
-    priorities = rfam.proj_defaults(response.project)['priority.json'].read()
+    priorities = rfam.catalog(response.project).priority
     if value < priorities['low'] or value > priorities['high']:
       response.append('false')
       return
   
-  if key=='type' and value not in rfam.types(response.project):
+  if key=='type' and value not in rfam.catalog(response.project).types:
     response.make418()
     return
   
@@ -73,24 +73,26 @@ def asset(rfam, response):
       return
       
     user = saxutils.unescape(response.getQuery()['user'])
-    if user not in rfam.getUsersByProject(response.project):
+    if not rfam.isUserOnProject(response.project, user):
       response.make418()
       return
   
   # Do the update...
   if key=='support':
-    meta = node.read()
-    s = set(meta['support'])
-    if value: s.add(user)
-    else: s.discard(user)
-    meta['support'] = list(s)
-    node.write(meta)
+    with node.lock():
+      meta = node.read_for_update()
+      s = set(meta['support'])
+      if value: s.add(user)
+      else: s.discard(user)
+      meta['support'] = list(s)
+      node.write(meta)
     rfam.log(response, 'store_asset_support(%s,%s,%s)' % ('/'.join(path), user, str(value)))
 
   else: # Everything normal
-    meta = node.read()
-    meta[key] = value
-    node.write(meta)
+    with node.lock():
+      meta = node.read_for_update()
+      meta[key] = value
+      node.write(meta)
     rfam.log(response, 'store_asset(%s,%s,%s)' % ('/'.join(path), key, str(value)))
 
   response.append('true')
@@ -117,7 +119,7 @@ def job(rfam, response):
   if key=='priority':
     value = int(value)
     
-    priorities = rfam.proj_defaults(response.project)['priority.json'].read()
+    priorities = rfam.catalog(response.project).priority
     if value < priorities['low'] or value > priorities['high']:
       response.append('false')
       return
@@ -184,9 +186,10 @@ def project(rfam, response):
   proj = rfam.proj(response.project)['project.json']
   
   if key in ['title', 'description', 'license']:
-    p = proj.read()
-    p[key] = value
-    proj.write(p)
+    with proj.lock():
+      p = proj.read_for_update()
+      p[key] = value
+      proj.write(p)
     
   elif key=='default':
     rfam.set_proj_defaults(response.project, value)
@@ -230,43 +233,44 @@ def role(rfam, response):
       
     value = saxutils.unescape(response.getQuery()['value'])
   
-  if key=='user' and value not in rfam.getUsersByProject(response.project):
+  if key=='user' and not rfam.isUserOnProject(response.project, value):
     response.make418()
     return
   
   # Perform the request with some further error checking...
   proj = rfam.proj(response.project)['project.json']
-  if move:
-    p = proj.read()
+  with proj.lock():
+    if move:
+      p = proj.read_for_update()
     
-    if ident not in p['roles']:
-      response.append('false')
-      return
+      if ident not in p['roles']:
+        response.append('false')
+        return
     
-    order = list(map(lambda p: p[0], sorted(p['roles'].items(), key = lambda p: p[1]['order'])))
-    pos = order.index(ident)
+      order = list(map(lambda p: p[0], sorted(p['roles'].items(), key = lambda p: p[1]['order'])))
+      pos = order.index(ident)
     
-    if key=='up':
-      if pos!=0:
-        temp = p['roles'][ident]['order']
-        p['roles'][ident]['order'] = p['roles'][order[pos-1]]['order']
-        p['roles'][order[pos-1]]['order'] = temp
-    else: # Down
-      if (pos+1)!=len(order):
-        temp = p['roles'][ident]['order']
-        p['roles'][ident]['order'] = p['roles'][order[pos+1]]['order']
-        p['roles'][order[pos+1]]['order'] = temp
+      if key=='up':
+        if pos!=0:
+          temp = p['roles'][ident]['order']
+          p['roles'][ident]['order'] = p['roles'][order[pos-1]]['order']
+          p['roles'][order[pos-1]]['order'] = temp
+      else: # Down
+        if (pos+1)!=len(order):
+          temp = p['roles'][ident]['order']
+          p['roles'][ident]['order'] = p['roles'][order[pos+1]]['order']
+          p['roles'][order[pos+1]]['order'] = temp
     
-    proj.write(p)
-  else:
-    p = proj.read()
+      proj.write(p)
+    else:
+      p = proj.read_for_update()
   
-    if ident not in p['roles']:
-      response.append('false')
-      return
+      if ident not in p['roles']:
+        response.append('false')
+        return
   
-    p['roles'][ident][key] = value
-    proj.write(p)
+      p['roles'][ident][key] = value
+      proj.write(p)
   
   # Apply the request and return success...
   if not move:
@@ -305,14 +309,15 @@ def ext_asset(rfam, response):
   
   # Perform the request with some further error checking...
   proj = rfam.proj(response.project)['project.json']
-  p = proj.read()
-  
-  if ident not in p['ext_assets']:
-    response.append('false')
-    return
-  
-  p['ext_assets'][ident][key] = value
-  proj.write(p)
+  with proj.lock():
+    p = proj.read_for_update()
+    
+    if ident not in p['ext_assets']:
+      response.append('false')
+      return
+    
+    p['ext_assets'][ident][key] = value
+    proj.write(p)
   
   # Apply the request and return success...
   rfam.log(response, 'store_external_asset(%s,%s,%s)' % (ident, key, str(value)))
@@ -17,6 +17,7 @@ import datetime
 
 from bin.rfam import RFAM
 from bin.response import Response
+from bin import fs_db
 
 
 
@@ -111,8 +112,17 @@ modules[''] = home.app
 
 
 
-# The actual application that responds to everything...
+# The actual application that responds to everything - each request is an epoch, so no file is checked against the disk more than once whilst generating a page...
 def application(environ, start_response):
+  fs_db.begin_epoch()
+  try:
+    return handle(environ, start_response)
+  finally:
+    fs_db.end_epoch()
+
+
+
+def handle(environ, start_response):
   response = Response(environ)
   cookie = response.getCookie()
   
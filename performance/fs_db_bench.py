@@ -0,0 +1,193 @@
+#! /usr/bin/env python3
+
+import os
+import sys
+import time
+import json
+import shutil
+import argparse
+import builtins
+import platform
+import tempfile
+import subprocess
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from bin.fs_db import FSDB
+from bin.fs_db_json import JsonFileType
+
+
+
+# Micro-benchmarks of the FSDB on its own, no server required - builds synthetic project trees of various sizes in a temporary directory, laid out like real projects (asset .json files, .blend placeholders and _old directories), then times the common operations. Optionally adds a delay to every file system call, to model a network file system on a laptop. Results are printed and can be saved as json, to compare between commits.
+
+
+
+def build(root, files):
+	"""Builds a synthetic project tree with roughly the given number of files in root; returns the number of files actually created."""
+	assets = max(1, files // 4) # Each asset has a .json, a .blend and two old versions.
+	count = 0
+	
+	for a in range(assets):
+		d = os.path.join(root, 'shots' if a%2==0 else 'assets', 'group_%i' % (a // 50), 'asset_%i' % a)
+		os.makedirs(os.path.join(d, '_old'))
+		
+		meta = {'name' : 'asset_%i' % a, 'type' : 'prop', 'owner' : 'user_%i' % (a%7), 'state' : 'wip', 'priority' : 1, 'description' : 'A synthetic asset ' * 4}
+		with open(os.path.join(d, 'meta.json'), 'w') as f:
+			json.dump(meta, f)
+		open(os.path.join(d, 'asset.blend'), 'w').close()
+		
+		for v in range(2):
+			open(os.path.join(d, '_old', 'asset_%i.blend' % v), 'w').close()
+		
+		count += 4
+	
+	# Age the directories, as the FSDB does not trust the modification time of a directory changed in the last few seconds...
+	old = time.time() - 60.0
+	for path, dirs, names in os.walk(root):
+		os.utime(path, (old, old))
+	
+	return count
+
+
+
+class Latency:
+	"""Context manager that adds a delay to every file system call the FSDB makes (stat, scandir, open and friends) and counts them, to model slow storage such as NFS. Attributes of the entries returned by scandir are assumed to come free with the listing, as they do with NFS READDIRPLUS."""
+	names = ['stat', 'lstat', 'scandir', 'mkdir', 'rmdir', 'replace', 'unlink', 'fsync']
+	
+	def __init__(self, delay):
+		self.delay = delay
+		self.calls = 0
+	
+	def wrap(self, func):
+		def wrapped(*args, **kwargs):
+			self.calls += 1
+			if self.delay>0.0:
+				time.sleep(self.delay)
+			return func(*args, **kwargs)
+		return wrapped
+	
+	def __enter__(self):
+		self.originals = dict((name, getattr(os, name)) for name in self.names)
+		for name, func in self.originals.items():
+			setattr(os, name, self.wrap(func))
+		
+		self.original_open = builtins.open
+		builtins.open = self.wrap(self.original_open)
+		return self
+	
+	def __exit__(self, etype, value, traceback):
+		for name, func in self.originals.items():
+			setattr(os, name, func)
+		builtins.open = self.original_open
+
+
+
+def timed(func, latency):
+	"""Runs func, returning (seconds, file system calls)."""
+	calls = latency.calls
+	start = time.perf_counter()
+	func()
+	return time.perf_counter() - start, latency.calls - calls
+
+
+
+def bench(root, files, delay, sample):
+	"""Runs every benchmark on the tree in root, returning a dictionary of operation -> {'seconds', 'calls', 'count'}, where count is how many things were done, so per item costs can be calculated."""
+	ret = dict()
+	
+	with Latency(delay) as latency:
+		db = FSDB(root, True)
+		db.register(JsonFileType())
+		
+		def record(name, func, count = 1):
+			seconds, calls = timed(func, latency)
+			ret[name] = {'seconds' : seconds, 'calls' : calls, 'count' : count}
+		
+		# Cold load - first full traversal...
+		record('cold_load', lambda: db.load(), files)
+		
+		# Warm iterate_ext - everything cached...
+		paths = list(db.get_root().iterate_ext('.json'))
+		record('warm_iterate_ext', lambda: list(db.get_root().iterate_ext('.json')), len(paths))
+		
+		nodes = [db[path] for path in paths]
+		some = nodes[:sample]
+		
+		# Read miss - first read, parsing the file...
+		record('read_miss', lambda: [node.read() for node in nodes], len(nodes))
+		
+		# Read hit - validated with a stat...
+		record('read_hit', lambda: [node.read() for node in nodes], len(nodes))
+		
+		# Write...
+		def write():
+			for node in some:
+				data = dict(node.read())
+				data['priority'] += 1
+				node.write(data)
+		record('write', write, len(some))
+		
+		# Refresh of every directory, with nothing changed...
+		dirs = []
+		stack = [db.get_root()]
+		while len(stack)!=0:
+			node = stack.pop()
+			dirs.append(node)
+			stack += [child for child in node.contents.values() if child.state==child.DIRECTORY]
+		
+		record('refresh', lambda: [node.refresh() for node in dirs], len(dirs))
+		
+		# Refresh with every directory changed...
+		for node in dirs:
+			node.stat = None
+		record('refresh_changed', lambda: [node.refresh() for node in dirs], len(dirs))
+	
+	return ret
+
+
+
+def commit():
+	"""Returns the git commit of the code being benchmarked, or None if unknown."""
+	try:
+		out = subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)), stderr=subprocess.DEVNULL)
+		return out.decode('utf8').strip()
+	except (OSError, subprocess.CalledProcessError):
+		return None
+
+
+
+# Parse the command line...
+parser = argparse.ArgumentParser(description='Benchmarks the FSDB on synthetic project trees.')
+parser.add_argument('--sizes', default='1000,10000,100000', help='Comma separated list of tree sizes, in files.')
+parser.add_argument('--latency', type=float, default=0.0, help='Delay added to every file system call, in milliseconds - 0.5 to 2 is typical of NFS.')
+parser.add_argument('--sample', type=int, default=1000, help='Maximum number of files to write.')
+parser.add_argument('--output', default=None, help='File to save the results to, as json.')
+args = parser.parse_args()
+
+sizes = [int(size) for size in args.sizes.split(',')]
+results = {'commit' : commit(), 'python' : platform.python_version(), 'latency_ms' : args.latency, 'sizes' : dict()}
+
+
+
+# Run the benchmarks...
+for size in sizes:
+	root = tempfile.mkdtemp(prefix='fs_db_bench_')
+	try:
+		files = build(root, size)
+		res = bench(root, files, 1e-3 * args.latency, args.sample)
+		results['sizes'][str(files)] = res
+		
+		print('%i files:' % files)
+		for name, r in res.items():
+			print('  %-18s %9.2f ms %9.2f us/item %8i calls' % (name, 1e3 * r['seconds'], 1e6 * r['seconds'] / max(r['count'], 1), r['calls']))
+	
+	finally:
+		shutil.rmtree(root)
+
+
+
+# Save...
+if args.output!=None:
+	with open(args.output, 'w') as f:
+		json.dump(results, f, indent=1)
+	print('Saved to %s' % args.output)
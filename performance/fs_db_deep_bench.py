@@ -0,0 +1,129 @@
+#! /usr/bin/env python3
+
+import os
+import sys
+import time
+import json
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from bin.fs_db import FSDB
+from bin.fs_db_json import JsonFileType
+
+
+
+# Benchmarks traversal of the FSDB (iterate, iterate_ext, walk and collect) on deep synthetic trees, where every directory holds a few files and a few subdirectories, down to the given depth - the cost of a traversal should not grow with the depth. Everything is cached before timing, so only the traversal itself is measured. Results are printed and can be saved as json, to compare between commits.
+
+
+
+def build(root, depth, fanout, files):
+	"""Builds a tree in root with the given depth, fanout directories in every directory above the bottom and files .json files in every directory. Returns the number of files made."""
+	count = 0
+	stack = [(root, 0)]
+	
+	while len(stack)!=0:
+		path, level = stack.pop()
+		for i in range(files):
+			with open(os.path.join(path, 'a%i.json' % i), 'w') as f:
+				f.write('{}')
+			count += 1
+		
+		if level<depth:
+			for i in range(fanout):
+				child = os.path.join(path, 'd%i' % i)
+				os.mkdir(child)
+				stack.append((child, level + 1))
+	
+	# Age the directories, as the FSDB does not trust the modification time of a directory changed in the last few seconds...
+	old = time.time() - 60.0
+	for path, dirs, names in os.walk(root):
+		os.utime(path, (old, old))
+	
+	return count
+
+
+
+def timed(func, repeats):
+	"""Returns (best time of several runs of func in seconds, what func returned)."""
+	best = None
+	for _ in range(repeats):
+		start = time.perf_counter()
+		ret = func()
+		t = time.perf_counter() - start
+		best = t if best==None else min(best, t)
+	return best, ret
+
+
+
+def bench(root, repeats):
+	"""Times every traversal of the tree in root, returning a dictionary of operation -> {'seconds', 'count'}."""
+	ret = dict()
+	db = FSDB(root, True)
+	db.register(JsonFileType())
+	db.load()
+	node = db.get_root()
+	
+	def record(name, func):
+		seconds, items = timed(func, repeats)
+		ret[name] = {'seconds' : seconds, 'count' : len(items)}
+	
+	record('iterate', lambda: list(node.iterate()))
+	record('iterate_ext', lambda: list(node.iterate_ext('.json')))
+	record('walk', lambda: list(node.walk('.json')))
+	if hasattr(node, 'collect'):
+		record('collect', lambda: node.collect('.json'))
+	
+	return ret
+
+
+
+def commit():
+	"""Returns the git commit of the code being benchmarked, or None if unknown."""
+	try:
+		out = subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)), stderr=subprocess.DEVNULL)
+		return out.decode('utf8').strip()
+	except (OSError, subprocess.CalledProcessError):
+		return None
+
+
+
+# Parse the command line...
+parser = argparse.ArgumentParser(description='Benchmarks traversal of the FSDB on deep synthetic trees.')
+parser.add_argument('--depths', default='4,8,16', help='Comma separated list of tree depths.')
+parser.add_argument('--fanout', type=int, default=2, help='Number of subdirectories in each directory; 1 makes a single deep chain.')
+parser.add_argument('--files', type=int, default=8, help='Number of files in each directory.')
+parser.add_argument('--repeats', type=int, default=5, help='Number of times to repeat each timing, keeping the best.')
+parser.add_argument('--output', default=None, help='File to save the results to, as json.')
+args = parser.parse_args()
+
+results = {'commit' : commit(), 'python' : platform.python_version(), 'fanout' : args.fanout, 'files' : args.files, 'depths' : dict()}
+
+
+
+# Run the benchmarks...
+for depth in [int(d) for d in args.depths.split(',')]:
+	root = tempfile.mkdtemp(prefix='fs_db_deep_bench_')
+	try:
+		files = build(root, depth, args.fanout, args.files)
+		res = bench(root, args.repeats)
+		results['depths'][str(depth)] = res
+		
+		print('depth %i, %i files:' % (depth, files))
+		for name, r in res.items():
+			print('  %-12s %9.2f ms %9.3f us/item' % (name, 1e3 * r['seconds'], 1e6 * r['seconds'] / max(r['count'], 1)))
+	
+	finally:
+		shutil.rmtree(root)
+
+
+
+# Save...
+if args.output!=None:
+	with open(args.output, 'w') as f:
+		json.dump(results, f, indent=1)
+	print('Saved to %s' % args.output)
@@ -0,0 +1,74 @@
+#! /usr/bin/env python3
+
+import os
+import sys
+import time
+import json
+import shutil
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from bin.fs_db import FSDB
+from bin.fs_db_json import JsonFileType
+
+
+
+# Script to measure how much memory the FSDB uses to cache a large hierarchy - builds a synthetic set of projects laid out like a real one, including the _old directories that previous versions of files are moved into, then loads it all and reports the bytes per file...
+
+
+# Parameters - total files is roughly projects * assets * (2 + versions)...
+projects = 10
+assets = 2500
+versions = 2
+contents = '--contents' in sys.argv # Also read every .json file, so the cache holds the parsed contents.
+
+
+
+# Build the hierarchy...
+root = tempfile.mkdtemp(prefix='fs_db_memory_')
+files = 0
+
+start = time.time()
+for p in range(projects):
+	for a in range(assets):
+		d = os.path.join(root, 'project_%i' % p, 'shots' if a%2==0 else 'assets', 'group_%i' % (a // 50), 'asset_%i' % a)
+		os.makedirs(os.path.join(d, '_old'))
+		
+		meta = {'name' : 'asset_%i' % a, 'type' : 'prop', 'owner' : 'user_%i' % (a%7), 'state' : 'wip', 'priority' : 1}
+		with open(os.path.join(d, 'meta.json'), 'w') as f:
+			json.dump(meta, f)
+		open(os.path.join(d, 'asset.blend'), 'w').close()
+		files += 2
+		
+		for v in range(versions):
+			open(os.path.join(d, '_old', 'asset_%i.blend' % v), 'w').close()
+			files += 1
+
+print('Built %i files in %.2f seconds' % (files, time.time() - start))
+
+
+
+# Load it all, measuring the memory used...
+tracemalloc.start()
+start = time.time()
+
+db = FSDB(root, True)
+db.register(JsonFileType())
+for path, node in db.walk('.json' if contents else None):
+	if contents:
+		node.read()
+
+end = time.time()
+current, peak = tracemalloc.get_traced_memory()
+tracemalloc.stop()
+
+print('Loaded in %.2f seconds' % (end - start))
+print('Cache uses %.1f MB, %.0f bytes per file (peak %.1f MB)' % (current / 1024**2, current / files, peak / 1024**2))
+
+
+
+# Clean up...
+del db
+shutil.rmtree(root)
@@ -0,0 +1,92 @@
+#! /usr/bin/env python3
+
+import os
+import sys
+import time
+import json
+import shutil
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from bin.fs_db_json import JsonFileType
+
+
+
+# Benchmarks the parsed cache of JsonFileType against plain json parsing, on synthetic render job files of various frame counts, laid out as jobs.py writes them - the todo, done and prmanCommands lists are what make them big. Times reading every file with the cache off, with the cache being filled (a miss, which also writes the cache) and with the cache hit.
+
+
+
+def job(frames):
+	"""Returns a synthetic render job with the given number of frames, half done."""
+	half = frames // 2
+	return {'uuid' : '0' * 32, 'name' : 'shot_%i' % frames, 'created' : time.time(), 'file' : 'teams::red/shots/shot.blend', 'path' : 'teams', 'priority' : 5, 'project' : 'red', 'meta' : None, 'video' : False, 'requires' : ['blender'], 'pause' : False,
+	        'todo' : list(range(half, frames)), 'working' : [[half - 1, 'node_1', time.time()]], 'done' : [[f, 'node_%i' % (f % 16), 120.5 + f % 7] for f in range(half - 1)], 'failed' : [], 'time' : 1234.5, 'time_count' : half - 1, 'errors' : 0, 'potential' : [],
+	        'prmanCommands' : ['prman -Progress -t:4 /renders/shot/frame_%04i.rib' % f for f in range(frames)]}
+
+
+
+def read_all(ft, fns):
+	"""Reads every file with the given file type, as the FSDB would."""
+	for fn in fns:
+		with open(fn, 'r') as f:
+			ft.read(f)
+
+
+
+def timed(func, repeats):
+	"""Returns the best time of several runs of func, in seconds."""
+	best = None
+	for _ in range(repeats):
+		start = time.perf_counter()
+		func()
+		t = time.perf_counter() - start
+		best = t if best==None else min(best, t)
+	return best
+
+
+
+# Parse the command line...
+parser = argparse.ArgumentParser(description='Benchmarks the parsed json cache on synthetic render job files.')
+parser.add_argument('--frames', default='100,1000,10000', help='Comma separated list of frame counts for the jobs.')
+parser.add_argument('--files', type=int, default=50, help='Number of job files of each size.')
+parser.add_argument('--repeats', type=int, default=3, help='Number of times to repeat each timing, keeping the best.')
+args = parser.parse_args()
+
+
+
+# Run the benchmarks...
+for frames in [int(f) for f in args.frames.split(',')]:
+	root = tempfile.mkdtemp(prefix='fs_db_parse_bench_')
+	try:
+		# Write the jobs, aged so the cache will accept them...
+		fns = []
+		old = time.time() - 60.0
+		for i in range(args.files):
+			fn = os.path.join(root, 'job_%i.json' % i)
+			with open(fn, 'w') as f:
+				json.dump(job(frames), f)
+			os.utime(fn, (old, old))
+			fns.append(fn)
+		size = os.path.getsize(fns[0])
+
+		plain = JsonFileType()
+		cache_dir = os.path.join(root, 'cache')
+
+		parse = timed(lambda: read_all(plain, fns), args.repeats)
+
+		def fill():
+			shutil.rmtree(cache_dir, ignore_errors=True)
+			read_all(JsonFileType(cache_dir, 0), fns)
+		miss = timed(fill, args.repeats)
+
+		hit = timed(lambda: read_all(JsonFileType(cache_dir, 0), fns), args.repeats)
+
+		print('%i frames (%.1f KB per file):' % (frames, size / 1024.0))
+		print('  %-8s %9.3f ms/file' % ('parse', 1e3 * parse / len(fns)))
+		print('  %-8s %9.3f ms/file' % ('miss', 1e3 * miss / len(fns)))
+		print('  %-8s %9.3f ms/file  (%.1fx faster than parsing)' % ('hit', 1e3 * hit / len(fns), parse / hit))
+
+	finally:
+		shutil.rmtree(root)
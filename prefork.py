@@ -0,0 +1,104 @@
+#! /usr/bin/env python3
+# Copyright 2014 Tom SF Haines
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Alternative to run.py that uses several processes, for multi-core machines - the socket is opened once and then the processes are forked, each accepting connections from it. Each process has its own caches, which are kept up to date by broadcasting changes between them (see the broadcast option in docs/configuration.txt)...
+
+import os
+import sys
+import time
+import signal
+
+from run import config, make_server
+
+
+
+def worker(server):
+  """Runs in each forked process - loads the application, which builds its own caches, and serves requests until told to stop. Stopping raises SystemExit, so pending writes are flushed and snapshots saved on the way out."""
+  signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+  signal.signal(signal.SIGINT, lambda signum, frame: sys.exit(0))
+
+  from main import application
+  server.set_app(application)
+  server.serve_forever()
+
+
+
+processes = config.get('processes', os.cpu_count() or 1)
+
+# Refuse to run several processes with options that are only safe for one, as they would overwrite each other's changes...
+if processes>1 and config['single_proc']:
+  sys.exit('Error: single_proc must be false to run more than one process')
+
+if processes>1 and config.get('write_behind', 0.0)>0.0:
+  sys.exit('Error: write_behind must be 0 to run more than one process')
+
+# Open the socket before forking, so every process shares it...
+server = make_server()
+
+if config.get('broadcast', None)==None and processes>1:
+  print('Warning: without the broadcast option set each process only notices changes made by the others after the cache time')
+
+children = set()
+
+def spawn():
+  """Forks a worker - the child never returns, as worker only exits by raising SystemExit, which goes all the way up so the interpreter shuts down properly."""
+  pid = os.fork()
+  if pid==0:
+    worker(server)
+
+  children.add(pid)
+
+
+def stop(signum, frame):
+  for pid in children:
+    try:
+      os.kill(pid, signal.SIGTERM)
+    except ProcessLookupError:
+      pass
+
+  for pid in list(children):
+    try:
+      os.waitpid(pid, 0)
+    except ChildProcessError:
+      pass
+
+  sys.exit(0)
+
+
+signal.signal(signal.SIGTERM, stop)
+signal.signal(signal.SIGINT, stop)
+
+for _ in range(processes):
+  spawn()
+
+
+
+# Replace any process that dies, pausing first so a broken configuration doesn't spin...
+while True:
+  pid, status = os.wait()
+  if pid in children:
+    children.discard(pid)
+    print('Worker %i exited with status %i - restarting' % (pid, status))
+
+    # Clean up its broadcast socket, which it won't have done if it crashed...
+    if config.get('broadcast', None)!=None:
+      try:
+        os.unlink(os.path.join(config['broadcast'], '%i.sock' % pid))
+      except OSError:
+        pass
+
+    time.sleep(1.0)
+    spawn()
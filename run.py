@@ -15,12 +15,12 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import json
+import threading
+import socketserver
 import wsgiref.simple_server
 
 import urllib3.connection
 
-from main import application
-
 
 
 # Load the configuration...
@@ -41,6 +41,42 @@ class BetterWSGIServer(wsgiref.simple_server.WSGIServer):
     return request, client_addr
 
 
-server = BetterWSGIServer(('', config['port']), wsgiref.simple_server.WSGIRequestHandler)
-server.set_app(application)
-server.serve_forever()
+# Threaded version, that handles up to a given number of requests at once - further requests wait for a thread to finish...
+class ThreadedWSGIServer(socketserver.ThreadingMixIn, BetterWSGIServer):
+  daemon_threads = True
+
+  def __init__(self, address, handler, threads):
+    super().__init__(address, handler)
+    self.workers = threading.BoundedSemaphore(threads)
+
+  def process_request(self, request, client_address):
+    self.workers.acquire()
+    try:
+      super().process_request(request, client_address)
+    except:
+      self.workers.release()
+      raise
+
+  def process_request_thread(self, request, client_address):
+    try:
+      super().process_request_thread(request, client_address)
+    finally:
+      self.workers.release()
+
+
+def make_server():
+  """Returns the server, listening on the configured port but without an application set - threaded if so configured. Used by prefork.py as well."""
+  threads = config.get('threads', 1)
+  if threads>1:
+    return ThreadedWSGIServer(('', config['port']), wsgiref.simple_server.WSGIRequestHandler, threads)
+  else:
+    return BetterWSGIServer(('', config['port']), wsgiref.simple_server.WSGIRequestHandler)
+
+
+
+if __name__=='__main__':
+  from main import application
+
+  server = make_server()
+  server.set_app(application)
+  server.serve_forever()
@@ -19,6 +19,12 @@ import unittest
 
 
 from bin.fs_db_test import *
+from bin.lock_file_test import *
+from bin.asset_index_test import *
+from bin.fs_db_async_test import *
+from bin.catalog_test import *
+from bin.priority_test import *
+from bin.rfam_test import *
 
 
 